@@ -0,0 +1,110 @@
+"""
+Cold-start import budget for the lambda handlers.
+
+Each handler module is imported in a fresh interpreter with `python -X importtime`, which
+is the import work a cold lambda container does before the first event. The slowest
+modules are printed, and the run fails when a handler goes over its budget or imports a
+module that should only be loaded lazily.
+
+Usage:
+    python -m benchmark.cold_start
+    python -m benchmark.cold_start --top 20 --repeat 5
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Milliseconds allowed for importing each handler module, measured as the median of the runs
+COLD_START_BUDGET_MS = {
+    "lambda_extract.handler": 400,
+    "lambda_transform.transform_handler": 400,
+    "lambda_load.load_lambda": 400,
+}
+
+# Modules the handlers must not import at module load, they are imported on first use
+LAZY_MODULES = ["pandas", "awswrangler", "pyarrow", "numpy", "sqlalchemy"]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$")
+
+
+def measure_imports(module):
+    """
+    Imports a module in a new interpreter and returns its -X importtime report
+
+    Args:
+        module (str): dotted module name, imported from the repository root
+
+    Returns:
+        dictionary of imported module names to cumulative import time in microseconds
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": root}
+    env.pop("AWS_EXECUTION_ENV", None)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=root,
+        check=True,
+    )
+
+    imports = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            imports[match.group(4)] = int(match.group(2))
+    return imports
+
+
+def check_handler(module, budget_ms, repeat=3, top=10):
+    """
+    Measures a handler module against its budget
+
+    Args:
+        module (str): handler module name
+        budget_ms (int): allowed import time in milliseconds
+        repeat (int): number of fresh interpreters, the median is compared to the budget
+        top (int): number of slowest imports to print
+
+    Returns:
+        list of problems, empty when the handler is within budget
+    """
+    runs = [measure_imports(module) for _ in range(repeat)]
+    totals = sorted(run[module] / 1000 for run in runs)
+    median_ms = totals[len(totals) // 2]
+    imports = runs[-1]
+
+    print(f"{module}: {median_ms:.0f} ms (budget {budget_ms} ms)")
+    slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)
+    for name, micros in slowest[1 : top + 1]:
+        print(f"    {micros / 1000:8.1f} ms  {name}")
+
+    problems = []
+    if median_ms > budget_ms:
+        problems.append(f"{module} took {median_ms:.0f} ms, budget is {budget_ms} ms")
+    for lazy in LAZY_MODULES:
+        if lazy in imports:
+            problems.append(f"{module} imports {lazy} at module load")
+    return problems
+
+
+def main(repeat=3, top=10):
+    problems = []
+    for module, budget_ms in COLD_START_BUDGET_MS.items():
+        problems.extend(check_handler(module, budget_ms, repeat, top))
+
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(main(args.repeat, args.top))
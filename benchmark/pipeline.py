@@ -0,0 +1,355 @@
+"""
+End-to-end pipeline benchmark with regression tracking.
+
+Seeds a local Postgres with synthetic totesys data (local_pipeline.synthetic_data) at each
+scale factor, then runs every stage the lambdas run, timing each one:
+    extract_query      get_latest_data
+    serialize_upload   s3_save_as_json, one object per source table
+    fetch              load_new_data
+    transform          convert_dictionary_to_dataframe and the transform_star graph
+    parquet_write      write_star_tables
+    warehouse_load     stream_load_into_warehouse, the load lambda's COPY upsert
+and the pipeline as a whole. Each stage records rows/s, peak RSS and bytes moved.
+
+Buckets are moto's in-process S3 by default, or a local folder with --lake file. Star
+tables are loaded into a "benchmark" schema of the same database, which is dropped at the end.
+
+Results are written to a JSON file and compared with a stored baseline. A stage that is
+slower or uses more memory than the baseline by more than the threshold fails the run.
+
+Usage:
+    python -m benchmark.pipeline --scales 0.1 1 10
+    python -m benchmark.pipeline --update-baseline
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from benchmark.warehouse_load import BENCHMARK_SCHEMA, FACT_SALES_ORDER_DDL
+
+# Scale factors run by default, 1 is 10,000 sales orders
+SCALES = [0.1, 1]
+
+# Relative change in rows/s or peak RSS from the baseline that counts as a regression
+REGRESSION_THRESHOLD = 0.2
+
+# Stages faster than this in the baseline are too noisy to compare throughput on
+MIN_COMPARED_SECONDS = 0.05
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline_pipeline.json")
+
+STAR_SCHEMA_DDL = [
+    f"""CREATE TABLE {BENCHMARK_SCHEMA}.dim_date (
+        date_id DATE PRIMARY KEY, year INT, month INT, day INT, day_of_week INT,
+        day_name VARCHAR, month_name VARCHAR, quarter INT
+    )""",
+    f"""CREATE TABLE {BENCHMARK_SCHEMA}.dim_staff (
+        staff_id INT PRIMARY KEY, first_name VARCHAR, last_name VARCHAR,
+        department_name VARCHAR, location VARCHAR, email_address VARCHAR
+    )""",
+    f"""CREATE TABLE {BENCHMARK_SCHEMA}.dim_location (
+        location_id INT PRIMARY KEY, address_line_1 VARCHAR, address_line_2 VARCHAR,
+        district VARCHAR, city VARCHAR, postal_code VARCHAR, country VARCHAR, phone VARCHAR
+    )""",
+    f"""CREATE TABLE {BENCHMARK_SCHEMA}.dim_design (
+        design_id INT PRIMARY KEY, design_name VARCHAR, file_location VARCHAR,
+        file_name VARCHAR
+    )""",
+    f"""CREATE TABLE {BENCHMARK_SCHEMA}.dim_currency (
+        currency_id INT PRIMARY KEY, currency_code VARCHAR, currency_name VARCHAR
+    )""",
+    f"""CREATE TABLE {BENCHMARK_SCHEMA}.dim_counterparty (
+        counterparty_id INT PRIMARY KEY, counterparty_legal_name VARCHAR,
+        counterparty_legal_address_line_1 VARCHAR, counterparty_legal_address_line_2 VARCHAR,
+        counterparty_legal_district VARCHAR, counterparty_legal_city VARCHAR,
+        counterparty_legal_postal_code VARCHAR, counterparty_legal_country VARCHAR,
+        counterparty_legal_phone_number VARCHAR
+    )""",
+]
+
+
+def current_rss_bytes():
+    """
+    Returns the resident set size of this process
+
+    Reads /proc/self/statm where it exists, elsewhere falls back to the peak so far from
+    getrusage (kilobytes on Linux, bytes on macOS).
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def measure_stage(results, name, interval=0.005):
+    """
+    Times a stage and samples its peak RSS on a background thread
+
+    The block fills in "rows" and "bytes" on the yielded dictionary, which is stored in
+    results[name] with seconds, rows_per_second and peak_rss_mb added on exit.
+
+    Args:
+        results (dict): stage results of the current scale
+        name (str): stage name
+        interval (float): seconds between RSS samples
+    """
+    stage = {"rows": 0, "bytes": 0}
+    peak = current_rss_bytes()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(interval):
+            peak = max(peak, current_rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        seconds = time.perf_counter() - start
+        done.set()
+        sampler.join()
+        peak = max(peak, current_rss_bytes())
+        stage.update(
+            {
+                "seconds": round(seconds, 3),
+                "rows_per_second": round(stage["rows"] / seconds, 1) if seconds else 0,
+                "peak_rss_mb": round(peak / 2**20, 1),
+            }
+        )
+        results[name] = stage
+
+
+def stored_bytes(storage, prefix=None):
+    """Returns the total size of the objects under prefix"""
+    return sum(len(storage.get(key)) for key in storage.list(prefix=prefix))
+
+
+def run_stages(source_conn, warehouse_conn, ingestion, processed):
+    """
+    Runs every pipeline stage once against seeded source tables
+
+    Args:
+        source_conn (pg8000.native.Connection): source database, closed by extract
+        warehouse_conn (pg8000.native.Connection): connection with the benchmark schema
+        ingestion (str): ingestion bucket location
+        processed (str): processed bucket location
+
+    Returns:
+        dictionary of stage names to measurements, including "pipeline" for the whole run
+    """
+    from lambda_layer.python.storage import get_storage
+    from lambda_extract.src.db_query import get_latest_data
+    from lambda_extract.src.s3_save_utilities import s3_save_as_json
+    from lambda_transform.src.load_new_data import load_new_data
+    from lambda_transform.src.convert_to_dataframe import (
+        convert_dictionary_to_dataframe,
+    )
+    from lambda_transform.src.transform_graph import run_transform_graph
+    from lambda_transform.src.df_to_parquet import write_star_tables
+    from lambda_load.src.load_parquet_data import list_pending_table_keys
+    from lambda_load.src.copy_load import stream_load_into_warehouse
+    from local_pipeline.runner import SOURCE_TABLES
+
+    results = {}
+    with measure_stage(results, "pipeline") as pipeline:
+        with measure_stage(results, "extract_query") as stage:
+            extracted = get_latest_data(
+                source_conn, SOURCE_TABLES, "2000-01-01 00:00:00"
+            )
+            stage["rows"] = sum(len(rows) for rows in extracted.values())
+        pipeline["rows"] = results["extract_query"]["rows"]
+
+        folder = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with measure_stage(results, "serialize_upload") as stage:
+            for table, rows in extracted.items():
+                s3_save_as_json(rows, ingestion, f"{folder}/{table}.json")
+            stage["rows"] = results["extract_query"]["rows"]
+        del extracted
+
+        with measure_stage(results, "fetch") as stage:
+            fetched = load_new_data(ingestion, SOURCE_TABLES)
+            stage["rows"] = sum(len(rows) for rows in fetched.values())
+
+        with measure_stage(results, "transform") as stage:
+            star_frames = run_transform_graph(convert_dictionary_to_dataframe(fetched))
+            stage["rows"] = sum(len(frame) for frame in star_frames.values())
+        del fetched
+
+        with measure_stage(results, "parquet_write") as stage:
+            written = write_star_tables(star_frames, processed)
+            stage["rows"] = results["transform"]["rows"]
+            stage["bytes"] = written["bytes"]
+        del star_frames
+
+        with measure_stage(results, "warehouse_load") as stage:
+            storage = get_storage(processed)
+            table_keys, _ = list_pending_table_keys(storage)
+            loaded = stream_load_into_warehouse(
+                storage, table_keys, warehouse_conn, BENCHMARK_SCHEMA
+            )
+            stage["rows"] = sum(loaded.values())
+            stage["bytes"] = written["bytes"]
+
+    # sized after the run so listing the bucket is not timed
+    json_bytes = stored_bytes(get_storage(ingestion), folder)
+    results["serialize_upload"]["bytes"] = json_bytes
+    results["fetch"]["bytes"] = json_bytes
+    results["pipeline"]["bytes"] = json_bytes + results["parquet_write"]["bytes"]
+    return results
+
+
+@contextmanager
+def lake_buckets(lake):
+    """
+    Yields ingestion and processed bucket locations for one benchmark run
+
+    Args:
+        lake (str): "s3" for moto's in-process S3, or "file" for a temporary folder
+    """
+    if lake == "file":
+        with tempfile.TemporaryDirectory() as root:
+            yield f"file://{root}/ingestion", f"file://{root}/processed"
+        return
+
+    import boto3
+    from moto import mock_aws
+    from lambda_layer.python.runtime_resources import clear_runtime_resources
+
+    with mock_aws():
+        clear_runtime_resources()
+        s3 = boto3.client("s3", region_name="eu-west-2")
+        for bucket in ("benchmark-ingestion", "benchmark-processed"):
+            s3.create_bucket(
+                Bucket=bucket,
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+        try:
+            yield "benchmark-ingestion", "benchmark-processed"
+        finally:
+            clear_runtime_resources()
+
+
+def run_benchmark(scales=SCALES, seed=0, lake="s3"):
+    """
+    Seeds the source tables and runs the pipeline stages at each scale factor
+
+    Args:
+        scales (list): synthetic data scale factors
+        seed (int): random seed for the synthetic data
+        lake (str): "s3" or "file", see lake_buckets
+
+    Returns:
+        dictionary of "scale_<factor>" to stage measurements
+    """
+    from local_pipeline.runner import connect_from_env
+    from local_pipeline.synthetic_data import seed_database
+
+    results = {}
+    admin_conn = connect_from_env("DB")
+    try:
+        for scale in scales:
+            seed_database(admin_conn, scale, seed)
+            admin_conn.run(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE")
+            admin_conn.run(f"CREATE SCHEMA {BENCHMARK_SCHEMA}")
+            for ddl in STAR_SCHEMA_DDL:
+                admin_conn.run(ddl)
+            admin_conn.run(FACT_SALES_ORDER_DDL)
+
+            with lake_buckets(lake) as (ingestion, processed):
+                results[f"scale_{scale}"] = run_stages(
+                    connect_from_env("DB"), admin_conn, ingestion, processed
+                )
+            print(f"scale {scale}: {json.dumps(results[f'scale_{scale}']['pipeline'])}")
+    finally:
+        admin_conn.run(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE")
+        admin_conn.close()
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Compares benchmark results with a stored baseline
+
+    Only scales and stages present in both are compared. Throughput is not compared for
+    stages that took less than MIN_COMPARED_SECONDS in the baseline.
+
+    Args:
+        results (dict): output of run_benchmark
+        baseline (dict): earlier output of run_benchmark
+        threshold (float): allowed relative change, e.g. 0.2 for 20%
+
+    Returns:
+        list of regression messages, empty when nothing regressed
+    """
+    regressions = []
+    for scale, stages in results.items():
+        for name, stage in stages.items():
+            base = baseline.get(scale, {}).get(name)
+            if not base:
+                continue
+            if base["seconds"] >= MIN_COMPARED_SECONDS and stage[
+                "rows_per_second"
+            ] < base["rows_per_second"] * (1 - threshold):
+                regressions.append(
+                    f"{scale} {name}: {stage['rows_per_second']:,.0f} rows/s, "
+                    f"baseline {base['rows_per_second']:,.0f}"
+                )
+            if stage["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold):
+                regressions.append(
+                    f"{scale} {name}: peak RSS {stage['peak_rss_mb']} MB, "
+                    f"baseline {base['peak_rss_mb']} MB"
+                )
+    return regressions
+
+
+def main(args):
+    from dotenv import load_dotenv
+
+    load_dotenv(args.env_file)
+    results = run_benchmark(args.scales, args.seed, args.lake)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(
+            f"No baseline at {args.baseline}, run with --update-baseline to create it"
+        )
+        return 0
+
+    with open(args.baseline) as file:
+        regressions = compare_to_baseline(results, json.load(file), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=float, nargs="+", default=SCALES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lake", choices=["s3", "file"], default="s3")
+    parser.add_argument("--output", default="pipeline_benchmark.json")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--env-file", default=".env.test")
+    sys.exit(main(parser.parse_args()))
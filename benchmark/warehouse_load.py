@@ -0,0 +1,173 @@
+"""
+Throughput benchmark for the warehouse loaders.
+
+Loads the same synthetic fact_sales_order rows into a local Postgres with
+    - pg8000: warehouse_load_functions_pg8000.load_data_into_warehouse, one upsert per row
+    - sqlalchemy_copy: warehouse_load_functions.copy_dataframes_to_sql, pooled engine and COPY
+    - pg8000_copy: copy_load.copy_upsert_table, the COPY staging upsert used by the load lambda
+
+Connection details are read from .env.test (see `make create-env-file`). Tables are
+created in a separate "benchmark" schema, which is dropped at the end.
+
+Usage:
+    python -m benchmark.warehouse_load --rows 100000
+"""
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from dotenv import load_dotenv
+from pg8000.native import Connection
+from lambda_load.src.copy_load import copy_upsert_table
+from lambda_load.src.warehouse_load_functions import (
+    get_engine,
+    alchemy_close_connection,
+    copy_dataframes_to_sql,
+)
+from lambda_load.src.warehouse_load_functions_pg8000 import (
+    load_data_into_warehouse as pg8000_load_data_into_warehouse,
+)
+
+BENCHMARK_SCHEMA = "benchmark"
+
+FACT_SALES_ORDER_DDL = f"""
+    CREATE TABLE {BENCHMARK_SCHEMA}.fact_sales_order (
+        sales_record_id INT PRIMARY KEY,
+        sales_order_id INT NOT NULL,
+        created_date DATE NOT NULL,
+        created_time TIME NOT NULL,
+        last_updated_date DATE NOT NULL,
+        last_updated_time TIME NOT NULL,
+        sales_staff_id INT NOT NULL,
+        counterparty_id INT NOT NULL,
+        units_sold INT NOT NULL,
+        unit_price NUMERIC(10, 2) NOT NULL,
+        currency_id INT NOT NULL,
+        design_id INT NOT NULL,
+        agreed_payment_date DATE NOT NULL,
+        agreed_delivery_date DATE NOT NULL,
+        agreed_delivery_location_id INT NOT NULL
+    )
+"""
+
+
+def make_fact_sales_order(rows, seed=0):
+    """
+    Builds a synthetic fact_sales_order DataFrame
+
+    Args:
+        rows (int): number of rows
+        seed (int): random seed, the same seed gives the same rows
+
+    Returns:
+        DataFrame with the warehouse fact_sales_order columns
+    """
+    rng = np.random.default_rng(seed)
+    created = pd.Timestamp("2024-01-01") + pd.to_timedelta(
+        rng.integers(0, 365 * 24 * 3600, rows), unit="s"
+    )
+    return pd.DataFrame(
+        {
+            "sales_record_id": np.arange(1, rows + 1),
+            "sales_order_id": np.arange(1, rows + 1),
+            "created_date": created.date,
+            "created_time": created.time,
+            "last_updated_date": created.date,
+            "last_updated_time": created.time,
+            "sales_staff_id": rng.integers(1, 21, rows),
+            "counterparty_id": rng.integers(1, 21, rows),
+            "units_sold": rng.integers(1000, 100_000, rows),
+            "unit_price": rng.integers(200, 400, rows) / 100,
+            "currency_id": rng.integers(1, 4, rows),
+            "design_id": rng.integers(1, 500, rows),
+            "agreed_payment_date": (created + pd.Timedelta(days=5)).date,
+            "agreed_delivery_date": (created + pd.Timedelta(days=7)).date,
+            "agreed_delivery_location_id": rng.integers(1, 31, rows),
+        }
+    )
+
+
+def run_loader(conn, name, load):
+    """
+    Times one loader against an empty benchmark table
+
+    Args:
+        conn (pg8000.native.Connection): connection used to reset the table
+        name (str): loader name
+        load (callable): runs the load
+
+    Returns:
+        dictionary with the seconds taken and rows loaded
+    """
+    conn.run(f"TRUNCATE {BENCHMARK_SCHEMA}.fact_sales_order")
+    start = time.perf_counter()
+    load()
+    seconds = time.perf_counter() - start
+    rows = conn.run(f"SELECT COUNT(*) FROM {BENCHMARK_SCHEMA}.fact_sales_order")[0][0]
+    print(f"{name}: {rows} rows in {seconds:.2f}s ({rows / seconds:,.0f} rows/s)")
+    return {"seconds": round(seconds, 3), "rows": rows}
+
+
+def main(rows, env_file=".env.test"):
+    load_dotenv(env_file)
+    db_params = {
+        "username": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+        "dbname": os.getenv("DB_NAME"),
+    }
+    conn = Connection(
+        database=db_params["dbname"],
+        user=db_params["username"],
+        password=db_params["password"],
+        host=db_params["host"],
+        port=int(db_params["port"]),
+    )
+    engine = get_engine(db_params)
+    df = make_fact_sales_order(rows)
+    dataframes = {"fact_sales_order": df}
+
+    def pg8000_copy():
+        batches = pa.Table.from_pandas(df, preserve_index=False).to_batches(50_000)
+        copy_upsert_table(
+            conn, "fact_sales_order", "sales_record_id", batches, BENCHMARK_SCHEMA
+        )
+
+    try:
+        conn.run(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE")
+        conn.run(f"CREATE SCHEMA {BENCHMARK_SCHEMA}")
+        conn.run(FACT_SALES_ORDER_DDL)
+
+        results = {
+            "pg8000": run_loader(
+                conn,
+                "pg8000",
+                lambda: pg8000_load_data_into_warehouse(
+                    dataframes, conn, BENCHMARK_SCHEMA
+                ),
+            ),
+            "sqlalchemy_copy": run_loader(
+                conn,
+                "sqlalchemy_copy",
+                lambda: copy_dataframes_to_sql(dataframes, engine, BENCHMARK_SCHEMA),
+            ),
+            "pg8000_copy": run_loader(conn, "pg8000_copy", pg8000_copy),
+        }
+        return results
+    finally:
+        conn.run(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE")
+        alchemy_close_connection(engine)
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--env-file", default=".env.test")
+    args = parser.parse_args()
+    print(json.dumps(main(args.rows, args.env_file), indent=2))
@@ -0,0 +1,13 @@
+-- Indexes for keyset-paginated extraction, see get_changes_after_cursors in lambda_extract/src/db_query.py
+-- Every page is a range scan on (last_updated, {table}_id) instead of a scan of the whole table
+CREATE INDEX IF NOT EXISTS design_last_updated_idx ON "design" (last_updated, design_id);
+CREATE INDEX IF NOT EXISTS currency_last_updated_idx ON "currency" (last_updated, currency_id);
+CREATE INDEX IF NOT EXISTS sales_order_last_updated_idx ON "sales_order" (last_updated, sales_order_id);
+CREATE INDEX IF NOT EXISTS staff_last_updated_idx ON "staff" (last_updated, staff_id);
+CREATE INDEX IF NOT EXISTS counterparty_last_updated_idx ON "counterparty" (last_updated, counterparty_id);
+CREATE INDEX IF NOT EXISTS address_last_updated_idx ON "address" (last_updated, address_id);
+CREATE INDEX IF NOT EXISTS department_last_updated_idx ON "department" (last_updated, department_id);
+CREATE INDEX IF NOT EXISTS purchase_order_last_updated_idx ON "purchase_order" (last_updated, purchase_order_id);
+CREATE INDEX IF NOT EXISTS payment_type_last_updated_idx ON "payment_type" (last_updated, payment_type_id);
+CREATE INDEX IF NOT EXISTS payment_last_updated_idx ON "payment" (last_updated, payment_id);
+CREATE INDEX IF NOT EXISTS transaction_last_updated_idx ON "transaction" (last_updated, transaction_id);
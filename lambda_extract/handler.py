@@ -1,4 +1,5 @@
 from datetime import datetime
+import json
 import re
 import logging
 
@@ -8,8 +9,33 @@ if os.environ.get("AWS_EXECUTION_ENV") is not None:
     from src.s3_save_utilities import s3_save_as_json
     from src.s3_helpers import retrieve_list_of_s3_files
     from src.secrets_manager import get_secret
-    from src.db_connection import create_conn
-    from src.db_query import get_latest_data
+    from src.db_connection import create_conn, has_replica, protect_session
+    from src.db_query import get_changes_after_cursors
+    from src.extract_cursors import (
+        find_cursor_batch,
+        initial_cursors,
+        read_extract_cursors,
+        run_deadline,
+        write_extract_cursors,
+    )
+    from src.bootstrap import (
+        BOOTSTRAP_MAX_WORKERS,
+        BOOTSTRAP_PENDING_FILE,
+        bootstrap_extract,
+        read_bootstrap_pending,
+    )
+    from src.cdc import (
+        CDC_SLOT,
+        DELETED_ROWS_FILE,
+        acknowledge_changes,
+        capture_changes,
+    )
+    from runtime_resources import get_db_connection
+    from profiling import profiled
+    from request_accounting import accounted, account_connection
+    from storage import get_storage
+    from table_parts import write_parts_manifest
+    from watermarks import max_last_updated, write_source_watermarks
 
     # For use in lambda function
 else:
@@ -17,10 +43,44 @@ else:
     from lambda_extract.src.s3_save_utilities import s3_save_as_json
     from lambda_extract.src.s3_helpers import retrieve_list_of_s3_files
     from lambda_extract.src.secrets_manager import get_secret
-    from lambda_extract.src.db_connection import create_conn
-    from lambda_extract.src.db_query import get_latest_data
+    from lambda_extract.src.db_connection import (
+        create_conn,
+        has_replica,
+        protect_session,
+    )
+    from lambda_extract.src.db_query import get_changes_after_cursors
+    from lambda_extract.src.extract_cursors import (
+        find_cursor_batch,
+        initial_cursors,
+        read_extract_cursors,
+        run_deadline,
+        write_extract_cursors,
+    )
+    from lambda_extract.src.bootstrap import (
+        BOOTSTRAP_MAX_WORKERS,
+        BOOTSTRAP_PENDING_FILE,
+        bootstrap_extract,
+        read_bootstrap_pending,
+    )
+    from lambda_extract.src.cdc import (
+        CDC_SLOT,
+        DELETED_ROWS_FILE,
+        acknowledge_changes,
+        capture_changes,
+    )
+    from lambda_layer.python.runtime_resources import get_db_connection
+    from lambda_layer.python.profiling import profiled
+    from lambda_layer.python.request_accounting import accounted, account_connection
+    from lambda_layer.python.storage import get_storage
+    from lambda_layer.python.table_parts import write_parts_manifest
+    from lambda_layer.python.watermarks import (
+        max_last_updated,
+        write_source_watermarks,
+    )
 
 
+@accounted
+@profiled
 def lambda_handler(event, context):
     """
     AWS Lambda Handler to extract latest data from Postgres database and upload to AWS S3 bucket.
@@ -30,9 +90,35 @@ def lambda_handler(event, context):
 
         {
             "secret" = "aws_secretsmanager_secret_name,"
-            "bucket" = "aws_s3_bucket_name"
+            "bucket" = "aws_s3_bucket_name",
+            "cdc" = true,                   optional, read changes from a replication slot
+            "slot" = "totesys_cdc",         optional, slot name when "cdc" is set
+            "bootstrap" = true,             optional, re-extract the whole tables
+            "protect_source" = true         optional, source-friendly reads
         }
 
+    Polling runs page through each table by (last_updated, id) after the cursors saved
+    with the newest batch in _extract_cursors.json, see src/extract_cursors.py. A run that
+    is about to time out stops reading and saves where it got to, and the next run
+    resumes there.
+
+    With "protect_source" the reads go to the read replica when the secret has a
+    "replica_host" and run under statement and lock timeouts. CDC still reads its slot
+    from the primary.
+
+    The first run, when the bucket is empty, and runs with "bootstrap" extract the whole
+    tables in parallel primary key ranges, see src/bootstrap.py. Large tables are then
+    written as part files, listed in the batch's _parts.json manifest. A bootstrap about
+    to time out saves the ranges left in _bootstrap_pending.json, and the next run
+    extracts them before polling starts. A failed bootstrap saves all of its ranges there
+    before the run fails.
+
+    With "cdc" the rows come from a logical replication slot, see src/cdc.py, instead of
+    polling each table by last_updated. The run that creates the slot still polls, so the
+    rows changed before the slot existed are not missed. The slot is only advanced once every
+    file of the batch is written. Deletes are dropped, deleted rows' keys are only saved to
+    _deleted_rows.json for reference and the rows stay in the warehouse.
+
     The S3 bucket folders structure looks like this:
 
     bucket-name
@@ -85,9 +171,23 @@ def lambda_handler(event, context):
             r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})/", last_object_name
         ).group(1)
 
-    database_credentials_string = get_secret(secret)
+    def connect():
+        return account_connection(create_conn(get_secret(secret)))
 
-    conn = create_conn(database_credentials_string)
+    def connect_protected():
+        # protected reads go to the read replica when the secret names one
+        return protect_session(
+            account_connection(create_conn(get_secret(secret), replica=True))
+        )
+
+    # connections are kept open for the next warm invocation
+    protect = bool(event.get("protect_source"))
+    read_connect = connect_protected if protect else connect
+    read_conn = get_db_connection(
+        f"{secret}/protected" if protect else secret, read_connect
+    )
+    # replication slots only exist on the primary
+    conn = get_db_connection(secret, connect) if event.get("cdc") else read_conn
 
     tables = [
         "design",
@@ -103,9 +203,100 @@ def lambda_handler(event, context):
         "transaction",
     ]
 
-    latest_data = get_latest_data(conn, tables, last_sync_timestamp)
-
     current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    storage = get_storage(bucket)
+
+    cursors, complete = None, True
+    slot = event.get("slot", CDC_SLOT)
+    changes = capture_changes(conn, tables, slot) if event.get("cdc") else None
+    latest_data, deleted, lsn = changes if changes is not None else (None, {}, None)
+
+    # the newest batch with cursors, a stopped bootstrap also leaves its ranges left there
+    cursor_batch = find_cursor_batch(objects_list)
+    pending = (
+        read_bootstrap_pending(storage, cursor_batch)
+        if f"{cursor_batch}/{BOOTSTRAP_PENDING_FILE}" in objects_list
+        and not event.get("bootstrap")
+        else None
+    )
+
+    if changes is None and (
+        event.get("bootstrap") or len(objects_list) == 0 or pending
+    ):
+        # whole tables, extracted in parallel primary key ranges. A protected bootstrap only
+        # runs ranges in parallel on a read replica, the primary gets one range at a time
+        on_replica = protect and has_replica(get_secret(secret))
+        try:
+            watermarks, cursors, complete = bootstrap_extract(
+                read_conn,
+                read_connect,
+                tables,
+                bucket,
+                current_timestamp,
+                max_workers=BOOTSTRAP_MAX_WORKERS if on_replica or not protect else 1,
+                deadline=run_deadline(context),
+                pending=pending,
+            )
+        except Exception:
+            # the cursors make this batch the one the next run resumes the ranges from
+            left = read_bootstrap_pending(storage, current_timestamp)
+            if left is not None:
+                write_extract_cursors(
+                    storage, current_timestamp, left["cursors"], complete=False
+                )
+            raise
+    else:
+        read_from = None
+        if latest_data is None:
+            # continue after the (last_updated, id) of the last row read from each table
+            if cursor_batch is None:
+                read_from = initial_cursors(tables, last_sync_timestamp)
+            else:
+                read_from = read_extract_cursors(storage, cursor_batch, tables)
+            latest_data, cursors, complete = get_changes_after_cursors(
+                read_conn,
+                tables,
+                read_from,
+                deadline=run_deadline(context),
+                close_connection=False,
+            )
+        failed = []
+        for table, rows in latest_data.items():
+            try:
+                s3_save_as_json(
+                    rows, bucket, f"{current_timestamp}/{table}.json", raise_errors=True
+                )
+            except Exception:
+                # the slot must not be advanced past unsaved changes
+                if read_from is None:
+                    raise
+                failed.append(table)
+        if failed:
+            # read again by the next run from their old cursors, and listed with no parts
+            # so the transform reads this batch without them
+            logger.error("Failed to save tables: %s", failed)
+            cursors.update({table: read_from[table] for table in failed})
+            write_parts_manifest(storage, current_timestamp, {t: [] for t in failed})
+        watermarks = {
+            table: None if table in failed else max_last_updated(rows)
+            for table, rows in latest_data.items()
+        }
+
+    if deleted:
+        storage.put(
+            f"{current_timestamp}/{DELETED_ROWS_FILE}",
+            json.dumps(deleted, default=str),
+            content_type="application/json",
+        )
+
+    # newest source change in this batch, carried through to the load for freshness metrics
+    write_source_watermarks(
+        storage, current_timestamp, watermarks, extracted_at=current_timestamp
+    )
+
+    # written last, a batch without cursors is read again by the next run
+    if cursors is not None:
+        write_extract_cursors(storage, current_timestamp, cursors, complete)
 
-    for table, rows in latest_data.items():
-        s3_save_as_json(rows, bucket, f"{current_timestamp}/{table}.json")
+    if lsn:
+        acknowledge_changes(conn, lsn, slot)
@@ -0,0 +1,282 @@
+"""
+Sharded extraction of whole tables, for the first run and full re-syncs.
+
+Reading all of sales_order, transaction or payment through one query each does not fit in
+the extract lambda's timeout. A bootstrap splits every table into primary key ranges of
+about SHARD_ROWS rows, sized from the planner's row estimate in pg_class and the table's
+min and max key, and extracts the ranges on BOOTSTRAP_MAX_WORKERS threads, each with its
+own database connection.
+
+Tables that fit in one range are written as the usual {table}.json. Larger tables are
+written one part file per range and listed in the batch's parts manifest, see
+table_parts, so the transform reads the parts as one table.
+
+The ranges are read in separate transactions with no common snapshot, so polling
+continues from each table's newest (last_updated, id) as read when the ranges are
+planned, not from the rows the ranges returned. Rows changed while the bootstrap runs are
+read again by the next poll.
+
+A bootstrap that reaches its deadline stops starting ranges and writes the ranges left,
+with the planned cursors, to the batch's {batch}/_bootstrap_pending.json. The next run
+resumes them into its own batch folder, see read_bootstrap_pending. A failed range also
+stops the bootstrap. Its batch is never transformed, so every range of the run, written
+or not, goes to the pending file before the failure is raised.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pg8000.native import identifier
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function, the layer modules are shipped in the dependency layer
+    from src.s3_save_utilities import s3_save_as_json
+    from metrics import stage_metrics
+    from storage import get_storage
+    from table_parts import part_key, write_parts_manifest
+    from watermarks import max_last_updated
+
+else:
+    # For local use
+    from lambda_extract.src.s3_save_utilities import s3_save_as_json
+    from lambda_layer.python.metrics import stage_metrics
+    from lambda_layer.python.storage import get_storage
+    from lambda_layer.python.table_parts import part_key, write_parts_manifest
+    from lambda_layer.python.watermarks import max_last_updated
+
+# Rows per primary key range, about 25 MB of JSON for sales_order
+SHARD_ROWS = 100_000
+
+# Ranges extracted at the same time, each worker holds one source connection
+BOOTSTRAP_MAX_WORKERS = 4
+
+BOOTSTRAP_PENDING_FILE = "_bootstrap_pending.json"
+
+
+def plan_shards(conn, table, shard_rows=SHARD_ROWS):
+    """
+    Splits a table into primary key ranges of about shard_rows rows
+
+    The row count comes from pg_class.reltuples, so no table scan is needed. A table that
+    was never analyzed has no estimate, and its key span is used instead.
+
+    Args:
+        conn (pg8000.native.Connection): source database connection
+        table (str): table name, its key is the totesys "{table}_id" column
+        shard_rows (int): rows per range
+
+    Returns:
+        list of (first, end) key ranges, end exclusive, empty for an empty table
+    """
+    key = identifier(f"{table}_id")
+    low, high = conn.run(f"SELECT min({key}), max({key}) FROM {identifier(table)}")[0]
+    if low is None:
+        return []
+    estimate = conn.run(
+        "SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)",
+        table=table,
+    )[0][0]
+    span = high - low + 1
+    rows = estimate if estimate and estimate > 0 else span
+    step = math.ceil(span / max(1, math.ceil(rows / shard_rows)))
+    return [
+        (first, min(first + step, high + 1)) for first in range(low, high + 1, step)
+    ]
+
+
+def plan_cursor(conn, table, sync_timestamp):
+    """
+    Returns the extract cursor after a table's newest row, read before its ranges are
+
+    Args:
+        conn (pg8000.native.Connection): source database connection
+        table (str): table name
+        sync_timestamp (str): cursor timestamp for an empty table
+
+    Returns:
+        cursor dictionary of "last_updated" and "id", see extract_cursors
+    """
+    key = identifier(f"{table}_id")
+    newest = conn.run(
+        f"SELECT last_updated, {key} FROM {identifier(table)} "
+        f"ORDER BY last_updated DESC, {key} DESC LIMIT 1"
+    )
+    if not newest:
+        return {"last_updated": sync_timestamp, "id": None}
+    return {"last_updated": newest[0][0], "id": newest[0][1]}
+
+
+def read_bootstrap_pending(storage, batch):
+    """
+    Reads the ranges a stopped bootstrap left in a batch folder
+
+    Args:
+        storage: bucket backend from get_storage
+        batch (str): batch folder
+
+    Returns:
+        dictionary of the "shards" left as [table, index, first, end], the "split" tables
+        written as parts and the planned "cursors", or None if the bootstrap finished
+    """
+    try:
+        return json.loads(storage.get(f"{batch}/{BOOTSTRAP_PENDING_FILE}"))
+    except FileNotFoundError:
+        return None
+
+
+def extract_shard(conn, table, first, end, sync_timestamp):
+    """
+    Retrieves the rows of one primary key range updated after sync_timestamp
+
+    Returns:
+        list of row dictionaries, as in get_latest_data
+    """
+    key = identifier(f"{table}_id")
+    with stage_metrics("extract_shard", table) as metrics:
+        rows = conn.run(
+            f"SELECT * FROM {identifier(table)} WHERE {key} >= :first AND {key} < :end "
+            "AND last_updated > :sync_timestamp",
+            first=first,
+            end=end,
+            sync_timestamp=sync_timestamp,
+        )
+        columns = [col["name"] for col in conn.columns]
+        metrics["rows_out"] = len(rows)
+        return [dict(zip(columns, row)) for row in rows]
+
+
+def bootstrap_extract(
+    conn,
+    connect,
+    tables,
+    bucket,
+    batch,
+    sync_timestamp="2000-01-01 00:00:00",
+    shard_rows=SHARD_ROWS,
+    max_workers=BOOTSTRAP_MAX_WORKERS,
+    deadline=None,
+    pending=None,
+):
+    """
+    Extracts whole tables in parallel primary key ranges and writes them to a batch folder
+
+    Args:
+        conn (pg8000.native.Connection): source connection used to plan the ranges
+        connect (callable): takes no arguments and returns a new source connection, called
+            once per worker thread. Worker connections are closed when the bootstrap ends
+        tables (list): source tables
+        bucket (str): ingestion bucket, or any location accepted by get_storage
+        batch (str): batch folder, e.g. "2024-11-19 14:30:00"
+        sync_timestamp (str): only rows updated after this are extracted
+        shard_rows (int): rows per range, see plan_shards
+        max_workers (int): ranges extracted at the same time
+        deadline (float): time.monotonic() value after which no range is started, None for
+            no limit
+        pending (dict): ranges left by a stopped bootstrap, from read_bootstrap_pending, to
+            resume instead of planning
+
+    Returns:
+        tuple of table names to their newest last_updated, as written to the source
+        watermark manifest, table names to the extract cursors planned before the ranges
+        were read, and False if ranges were left for the next run
+
+    Raises:
+        Exception: the first failed range, once the running ranges have finished and every
+            range of the run is written to the pending file
+    """
+    if pending is None:
+        # cursors first, rows changed while the ranges are read are polled again
+        cursors = {table: plan_cursor(conn, table, sync_timestamp) for table in tables}
+        # an empty table still gets its empty {table}.json, from a range that matches nothing
+        ranges = {
+            table: plan_shards(conn, table, shard_rows) or [(0, 0)] for table in tables
+        }
+        split = {
+            table for table, table_ranges in ranges.items() if len(table_ranges) > 1
+        }
+        shards = [
+            (table, index, first, end)
+            for table, table_ranges in ranges.items()
+            for index, (first, end) in enumerate(table_ranges)
+        ]
+    else:
+        cursors = pending["cursors"]
+        split = set(pending["split"])
+        shards = [tuple(shard) for shard in pending["shards"]]
+
+    local = threading.local()
+    opened = []
+
+    def run_shard(table, index, first, end):
+        if not hasattr(local, "conn"):
+            local.conn = connect()
+            opened.append(local.conn)
+        rows = extract_shard(local.conn, table, first, end, sync_timestamp)
+        key = part_key(table, index) if table in split else f"{table}.json"
+        s3_save_as_json(rows, bucket, f"{batch}/{key}", raise_errors=True)
+        return table, index, key, max_last_updated(rows)
+
+    planned = list(shards)
+    written = []
+    failures = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = set()
+            while shards or running:
+                # stop starting ranges at the deadline or a failure, the running ones
+                # still finish
+                while (
+                    shards
+                    and not failures
+                    and len(running) < max_workers
+                    and (deadline is None or time.monotonic() < deadline)
+                ):
+                    running.add(executor.submit(run_shard, *shards.pop(0)))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        written.append(future.result())
+                    except Exception as e:
+                        failures.append(e)
+    finally:
+        for worker_conn in opened:
+            worker_conn.close()
+    if failures:
+        # the failed run is not transformed, the next run extracts all of its ranges
+        shards = planned
+
+    storage = get_storage(bucket)
+    parts = {table: [] for table in tables if table in split}
+    single = set()
+    watermarks = {table: None for table in tables}
+    for table, index, key, watermark in sorted(written):
+        if table in split:
+            parts[table].append(key)
+        else:
+            single.add(table)
+        if watermark and (watermarks[table] is None or watermark > watermarks[table]):
+            watermarks[table] = watermark
+    # tables without a file in this batch are listed with no parts, so the transform
+    # reads them as empty
+    parts.update(
+        {table: [] for table in tables if table not in split and table not in single}
+    )
+    if parts:
+        write_parts_manifest(storage, batch, parts)
+    if shards:
+        storage.put(
+            f"{batch}/{BOOTSTRAP_PENDING_FILE}",
+            json.dumps(
+                {"shards": shards, "split": sorted(split), "cursors": cursors},
+                default=lambda value: value.isoformat(),
+            ),
+            content_type="application/json",
+        )
+    if failures:
+        raise failures[0]
+    return watermarks, cursors, not shards
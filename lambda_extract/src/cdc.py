@@ -0,0 +1,384 @@
+"""
+Change data capture from a PostgreSQL logical replication slot.
+
+Instead of polling every table with WHERE last_updated > :sync_timestamp, extract can read
+the row changes PostgreSQL has already decoded from its write-ahead log. A logical
+replication slot keeps every change since the last acknowledged position (LSN), and
+reading it does not scan the source tables.
+
+The slot is read through the SQL decoding functions over an ordinary pg8000 connection:
+    pg_logical_slot_peek_binary_changes   pgoutput, filtered by a publication
+    pg_logical_slot_peek_changes          test_decoding, when pgoutput is not available
+Peeking leaves the slot where it is. Only once the batch is written does extract call
+acknowledge_changes, which advances the slot past the last decoded commit, so a failed
+write is decoded again on the next run.
+
+The source database needs wal_level = logical and PostgreSQL 11 or later, for
+pg_replication_slot_advance. Every change of a batch is collapsed to the newest row per
+primary key, in the same per-table format get_latest_data returns.
+
+Deletes are dropped. A deleted row's key is written to DELETED_ROWS_FILE for reference,
+but neither transform nor load reads that file, so the row stays in the warehouse.
+"""
+
+import logging
+import os
+import re
+import struct
+from datetime import date, datetime
+from decimal import Decimal
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function, metrics is shipped in the dependency layer
+    from metrics import stage_metrics
+
+else:
+    # For local use
+    from lambda_layer.python.metrics import stage_metrics
+
+logger = logging.getLogger(__name__)
+
+# Slot and publication created for the extract lambda
+CDC_SLOT = "totesys_cdc"
+CDC_PUBLICATION = "totesys_cdc"
+
+# Changes decoded per run, whole transactions are always returned so a run can go over this
+CDC_MAX_CHANGES = 50_000
+
+# Written next to the table files of a batch, with the primary keys of deleted rows. No
+# later stage reads it, deletes are not applied to the warehouse
+DELETED_ROWS_FILE = "_deleted_rows.json"
+
+# Type OIDs of the totesys columns that are not kept as strings, numeric is read as
+# Decimal like pg8000 returns it to the polling path, so amounts are not rounded
+_PARSE_BY_OID = {
+    16: lambda text: text == "t",
+    20: int,
+    21: int,
+    23: int,
+    1082: date.fromisoformat,
+    1114: datetime.fromisoformat,
+    1700: Decimal,
+}
+
+# The same types by the names test_decoding prints
+_PARSE_BY_NAME = {
+    "boolean": lambda text: text == "true",
+    "bigint": int,
+    "smallint": int,
+    "integer": int,
+    "date": date.fromisoformat,
+    "timestamp without time zone": datetime.fromisoformat,
+    "numeric": Decimal,
+}
+
+
+def ensure_replication_slot(
+    conn, tables, slot=CDC_SLOT, publication=CDC_PUBLICATION, plugin="pgoutput"
+):
+    """
+    Creates the replication slot, and for pgoutput its publication, if they do not exist
+
+    Falls back to test_decoding when a pgoutput slot cannot be created.
+
+    Args:
+        conn (pg8000.native.Connection): source database connection
+        tables (list): tables the publication covers
+        slot (str): slot name
+        publication (str): publication name, only used by pgoutput
+        plugin (str): "pgoutput" or "test_decoding"
+
+    Returns:
+        tuple of the slot's output plugin and True if the slot was created by this call
+    """
+    existing = conn.run(
+        "SELECT plugin FROM pg_replication_slots WHERE slot_name = :slot", slot=slot
+    )
+    if existing:
+        return existing[0][0], False
+
+    if plugin == "pgoutput":
+        try:
+            if not conn.run(
+                "SELECT 1 FROM pg_publication WHERE pubname = :publication",
+                publication=publication,
+            ):
+                table_list = ", ".join(f'"{table}"' for table in tables)
+                conn.run(f'CREATE PUBLICATION "{publication}" FOR TABLE {table_list}')
+            conn.run(
+                "SELECT pg_create_logical_replication_slot(:slot, 'pgoutput')",
+                slot=slot,
+            )
+            return "pgoutput", True
+        except Exception as e:
+            logger.warning(f"pgoutput slot unavailable, using test_decoding: {e}")
+
+    conn.run(
+        "SELECT pg_create_logical_replication_slot(:slot, 'test_decoding')", slot=slot
+    )
+    return "test_decoding", True
+
+
+def peek_changes(
+    conn,
+    slot=CDC_SLOT,
+    plugin="pgoutput",
+    publication=CDC_PUBLICATION,
+    max_changes=CDC_MAX_CHANGES,
+):
+    """
+    Decodes the changes waiting in a slot without consuming them
+
+    Args:
+        conn (pg8000.native.Connection): source database connection
+        slot (str): slot name
+        plugin (str): the slot's output plugin
+        publication (str): publication name, only used by pgoutput
+        max_changes (int): stop decoding after the transaction that reaches this many rows
+
+    Returns:
+        tuple of a list of changes in commit order and the LSN to acknowledge them with,
+        None when the slot is empty. Each change is a dictionary of "table", "op" (insert,
+        update or delete), "row" and "key", the names of the primary key columns
+    """
+    if plugin == "pgoutput":
+        messages = conn.run(
+            "SELECT lsn::text, data FROM pg_logical_slot_peek_binary_changes("
+            ":slot, NULL, :max_changes, 'proto_version', '1', "
+            "'publication_names', :publication)",
+            slot=slot,
+            max_changes=max_changes,
+            publication=publication,
+        )
+        changes = decode_pgoutput(data for _, data in messages)
+    else:
+        messages = conn.run(
+            "SELECT lsn::text, data FROM pg_logical_slot_peek_changes("
+            ":slot, NULL, :max_changes, 'include-xids', '0')",
+            slot=slot,
+            max_changes=max_changes,
+        )
+        changes = decode_test_decoding(data for _, data in messages)
+    last_lsn = messages[-1][0] if messages else None
+    return changes, last_lsn
+
+
+def acknowledge_changes(conn, lsn, slot=CDC_SLOT):
+    """
+    Advances a slot past the changes decoded up to an LSN, they are not returned again
+
+    Args:
+        conn (pg8000.native.Connection): source database connection
+        lsn (str): LSN returned by peek_changes
+        slot (str): slot name
+    """
+    conn.run(
+        "SELECT pg_replication_slot_advance(:slot, CAST(:lsn AS pg_lsn))",
+        slot=slot,
+        lsn=lsn,
+    )
+
+
+class _Reader:
+    """Reads the big-endian fields of one pgoutput message"""
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.pos = 0
+
+    def byte(self):
+        value = self.data[self.pos : self.pos + 1].decode("ascii")
+        self.pos += 1
+        return value
+
+    def unpack(self, fmt):
+        (value,) = struct.unpack_from(f"!{fmt}", self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def string(self):
+        end = self.data.index(b"\0", self.pos)
+        value = self.data[self.pos : end].decode("utf-8")
+        self.pos = end + 1
+        return value
+
+    def tuple_data(self, columns):
+        row = {}
+        for name, type_oid in columns[: self.unpack("h")]:
+            kind = self.byte()
+            if kind == "n":
+                row[name] = None
+            elif kind == "t":
+                length = self.unpack("i")
+                text = self.data[self.pos : self.pos + length].decode("utf-8")
+                self.pos += length
+                row[name] = _PARSE_BY_OID.get(type_oid, str)(text)
+            # "u" is an unchanged TOASTed value, left out. totesys rows are far too small
+            # to be TOASTed
+        return row
+
+
+def decode_pgoutput(messages):
+    """
+    Decodes pgoutput protocol version 1 messages into row changes
+
+    Relation messages describe a table's columns before its first change in each
+    decoding call, and are kept to decode the tuples that follow.
+
+    Args:
+        messages (iterable): message bytes as returned by pg_logical_slot_peek_binary_changes
+
+    Returns:
+        list of change dictionaries, see peek_changes
+    """
+    relations = {}
+    changes = []
+    for data in messages:
+        reader = _Reader(data)
+        kind = reader.byte()
+        if kind == "R":
+            relation_id = reader.unpack("I")
+            reader.string()
+            table = reader.string()
+            reader.byte()
+            columns, key = [], []
+            for _ in range(reader.unpack("h")):
+                flags = reader.unpack("b")
+                name = reader.string()
+                type_oid = reader.unpack("I")
+                reader.unpack("i")
+                columns.append((name, type_oid))
+                if flags & 1:
+                    key.append(name)
+            relations[relation_id] = (table, columns, key)
+        elif kind in ("I", "U", "D"):
+            table, columns, key = relations[reader.unpack("I")]
+            part = reader.byte()
+            if kind == "U" and part in ("K", "O"):
+                # old key or row, sent when the key changed, the new row follows
+                reader.tuple_data(columns)
+                part = reader.byte()
+            row = reader.tuple_data(columns)
+            op = {"I": "insert", "U": "update", "D": "delete"}[kind]
+            changes.append({"table": table, "op": op, "row": row, "key": key})
+        # begin, commit, origin, type and truncate messages carry no rows
+    return changes
+
+
+_TEST_DECODING_CHANGE = re.compile(
+    r'^table (?:"[^"]+"|[^.]+)\.("?)(.+?)\1: (INSERT|UPDATE|DELETE): (.*)$'
+)
+_TEST_DECODING_COLUMN = re.compile(
+    r'("[^"]+"|[^\s\[]+)\[([^\]]+)\]:(\'(?:[^\']|\'\')*\'|\S+)'
+)
+
+
+def decode_test_decoding(lines):
+    """
+    Decodes test_decoding output into row changes
+
+    test_decoding does not mark key columns. Deletes print only the replica identity, so
+    its columns are the key, inserts and updates use the totesys "{table}_id" column.
+
+    Args:
+        lines (iterable): text rows as returned by pg_logical_slot_peek_changes
+
+    Returns:
+        list of change dictionaries, see peek_changes
+    """
+    changes = []
+    for line in lines:
+        match = _TEST_DECODING_CHANGE.match(line)
+        if not match:
+            continue
+        _, table, op, columns = match.groups()
+        if "new-tuple:" in columns:
+            # "old-key: ... new-tuple: ..." when an update changed the key
+            columns = columns.split("new-tuple:", 1)[1]
+        row = {}
+        for name, type_name, text in _TEST_DECODING_COLUMN.findall(columns):
+            if text == "null":
+                row[name.strip('"')] = None
+                continue
+            if text.startswith("'"):
+                # strings, dates and timestamps are quoted, numbers and booleans are not
+                text = text[1:-1].replace("''", "'")
+            row[name.strip('"')] = _PARSE_BY_NAME.get(type_name, str)(text)
+        if op == "DELETE":
+            key = list(row)
+        else:
+            key = [f"{table}_id"] if f"{table}_id" in row else list(row)
+        changes.append({"table": table, "op": op.lower(), "row": row, "key": key})
+    return changes
+
+
+def collapse_changes(changes, tables):
+    """
+    Keeps the newest change of every row, in the per-table format of get_latest_data
+
+    Args:
+        changes (list): change dictionaries in commit order
+        tables (list): tables to return, tables without changes map to empty lists
+
+    Returns:
+        tuple of {table: [row, ...]} for inserted or updated rows and
+        {table: [key, ...]} for deleted rows, keys being dictionaries of key columns
+    """
+    latest = {table: {} for table in tables}
+    for change in changes:
+        if change["table"] not in latest:
+            continue
+        key = tuple(change["row"].get(column) for column in change["key"])
+        rows = latest[change["table"]]
+        # a row updated several times, or deleted, ends up in its newest state
+        rows.pop(key, None)
+        rows[key] = change
+    rows = {
+        table: [c["row"] for c in by_key.values() if c["op"] != "delete"]
+        for table, by_key in latest.items()
+    }
+    deleted = {
+        table: [
+            {column: c["row"].get(column) for column in c["key"]}
+            for c in by_key.values()
+            if c["op"] == "delete"
+        ]
+        for table, by_key in latest.items()
+    }
+    return rows, {table: keys for table, keys in deleted.items() if keys}
+
+
+def capture_changes(
+    conn,
+    tables,
+    slot=CDC_SLOT,
+    publication=CDC_PUBLICATION,
+    max_changes=CDC_MAX_CHANGES,
+):
+    """
+    Reads the next batch of changes from the replication slot, creating it on first use
+
+    A new slot only holds changes made after it was created, so on the run that creates
+    it extract must read the tables themselves once, see the extract handler.
+
+    Args:
+        conn (pg8000.native.Connection): source database connection
+        tables (list): source tables
+        slot (str): slot name
+        publication (str): publication name
+        max_changes (int): see peek_changes
+
+    Returns:
+        None when the slot was just created, otherwise a tuple of rows and deleted keys per
+        table, see collapse_changes, and the LSN to pass to acknowledge_changes (None when
+        there was nothing to read)
+    """
+    plugin, created = ensure_replication_slot(conn, tables, slot, publication)
+    if created:
+        return None
+    with stage_metrics("extract_cdc") as metrics:
+        changes, lsn = peek_changes(conn, slot, plugin, publication, max_changes)
+        rows, deleted = collapse_changes(changes, tables)
+        metrics["rows_in"] = len(changes)
+        metrics["rows_out"] = sum(len(table_rows) for table_rows in rows.values())
+    return rows, deleted, lsn
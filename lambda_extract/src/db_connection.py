@@ -1,13 +1,32 @@
-from pg8000.native import Connection
+from pg8000.native import Connection, literal
 import json
 
+# Session limits for source-friendly extraction, see protect_session
+STATEMENT_TIMEOUT_MS = 30_000
+LOCK_TIMEOUT_MS = 1_000
 
-def create_conn(sm_params):
+
+def has_replica(sm_params):
+    """
+    Returns True if the database credentials name a read replica
+
+    Parameters:
+        sm_params (json): JSON object containing the database credentials, or None
+
+    Returns:
+        bool, False when "replica_host" is missing or empty
+    """
+    return bool(json.loads(sm_params or "{}").get("replica_host"))
+
+
+def create_conn(sm_params, replica=False):
     """
     Returns pg8000 database connection
 
     Parameters:
         sm_params (json): JSON object containing the database credentials.
+        replica (bool): Connect to the read replica named by "replica_host" (and optionally
+            "replica_port") in the secret, or to "host" when the secret has no replica.
 
     Returns:
         pg8000 connection object
@@ -24,15 +43,23 @@ def create_conn(sm_params):
     """
     try:
         db_params = json.loads(sm_params)
+        use_replica = replica and has_replica(sm_params)
         conn = Connection(
             database=db_params["database"],
             user=db_params["user"],
             password=db_params["password"],
-            host=db_params["host"],
-            port=db_params["port"],
+            host=db_params["replica_host"] if use_replica else db_params["host"],
+            port=(
+                db_params.get("replica_port", db_params["port"])
+                if use_replica
+                else db_params["port"]
+            ),
             timeout=10,
         )
-        print(f"Connected to database {db_params['database']}")
+        print(
+            f"Connected to database {db_params['database']}"
+            + (" on the read replica" if use_replica else "")
+        )
         return conn
 
     except Exception as e:
@@ -50,3 +77,27 @@ def close_conn(conn):
         Nothing
     """
     conn.close()
+
+
+def protect_session(
+    conn, statement_timeout_ms=STATEMENT_TIMEOUT_MS, lock_timeout_ms=LOCK_TIMEOUT_MS
+):
+    """
+    Limits how long the session's queries can run or wait for locks on the source database
+
+    A query over statement_timeout_ms is cancelled by the server instead of holding a
+    snapshot open on the OLTP database, and a query waiting more than lock_timeout_ms
+    for a lock gives up rather than queueing the business's writes behind it.
+
+    Parameters:
+        conn (pg8000 connection object): connection, or None when connecting failed
+        statement_timeout_ms (int): longest query, in milliseconds
+        lock_timeout_ms (int): longest wait for a lock, in milliseconds
+
+    Returns:
+        the same connection
+    """
+    if conn is not None:
+        conn.run(f"SET statement_timeout = {literal(int(statement_timeout_ms))}")
+        conn.run(f"SET lock_timeout = {literal(int(lock_timeout_ms))}")
+    return conn
@@ -1,7 +1,26 @@
+import logging
+import os
+import time
 from pg8000.native import identifier
 
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function, metrics is shipped in the dependency layer
+    from metrics import stage_metrics
 
-def get_latest_data(conn, tables, sync_timestamp):
+else:
+    # For local use
+    from lambda_layer.python.metrics import stage_metrics
+
+logger = logging.getLogger(__name__)
+
+# Rows per keyset page, the size adapts between the bounds to keep pages near the target time
+CHUNK_ROWS = 5_000
+MIN_CHUNK_ROWS = 500
+MAX_CHUNK_ROWS = 50_000
+TARGET_CHUNK_SECONDS = 0.5
+
+
+def get_latest_data(conn, tables, sync_timestamp, close_connection=True):
     """
     Retrieves rows from specified tables in a PostgreSQL database where the `last_updated`
     column is greater than a given sync timestamp.
@@ -13,6 +32,7 @@ def get_latest_data(conn, tables, sync_timestamp):
         conn: An active connection to the PostgreSQL database
         tables: A list of table names (strings) to query from the database
         sync_timestamp: Last sync timestamp (string)
+        close_connection: Close the connection when done, False keeps it for the next run
 
     Returns:
         A dictionary, where each key represents table and value represents list of dictionaries.
@@ -37,12 +57,128 @@ def get_latest_data(conn, tables, sync_timestamp):
     result = {}
     try:
         for table in tables:
-            rows = conn.run(
-                f"SELECT * FROM {identifier(table)} WHERE last_updated > :sync_timestamp",
-                sync_timestamp=sync_timestamp,
-            )
-            columns = [col["name"] for col in conn.columns]
-            result[table] = [dict(zip(columns, row)) for row in rows]
+            with stage_metrics("extract_query", table) as metrics:
+                rows = conn.run(
+                    f"SELECT * FROM {identifier(table)} WHERE last_updated > :sync_timestamp",
+                    sync_timestamp=sync_timestamp,
+                )
+                columns = [col["name"] for col in conn.columns]
+                result[table] = [dict(zip(columns, row)) for row in rows]
+                metrics["rows_out"] = len(rows)
         return result
     finally:
-        conn.close()
+        if close_connection:
+            conn.close()
+
+
+def next_chunk_size(
+    size,
+    seconds,
+    target_seconds=TARGET_CHUNK_SECONDS,
+    min_rows=MIN_CHUNK_ROWS,
+    max_rows=MAX_CHUNK_ROWS,
+):
+    """
+    Returns the rows to ask for in the next page, scaled by how long the last page took
+
+    Args:
+        size (int): rows asked for in the last page
+        seconds (float): how long the last page took
+        target_seconds (float): page time to aim for
+        min_rows (int): smallest page
+        max_rows (int): largest page
+
+    Returns:
+        the new page size, growing at most twofold per page so a quiet moment on the
+        database does not lead to one huge query
+    """
+    scale = target_seconds / seconds if seconds > 0 else 2
+    return int(min(max(size * min(scale, 2), min_rows), max_rows))
+
+
+def get_changes_after_cursors(
+    conn,
+    tables,
+    cursors,
+    chunk_rows=CHUNK_ROWS,
+    target_seconds=TARGET_CHUNK_SECONDS,
+    deadline=None,
+    close_connection=True,
+):
+    """
+    Retrieves the rows after each table's (last_updated, id) cursor, in keyset pages
+
+    Each page is ordered by (last_updated, {table}_id) and starts after the cursor:
+        WHERE (last_updated, design_id) > (:last_updated, :last_id)
+        ORDER BY last_updated, design_id LIMIT :size
+    so with an index on those columns, see db_sql/extract_indexes.sql, every page is a
+    short index range scan instead of one unbounded SELECT *. Rows sharing a last_updated
+    are told apart by their id, so none is skipped or read twice at a page or run
+    boundary. The page size adapts to the observed query time, see next_chunk_size.
+
+    When deadline passes, no further pages are read. The returned cursors point at the
+    last row read, so the next run resumes from there, mid-table if need be.
+
+    Parameters:
+        conn: An active connection to the PostgreSQL database
+        tables: A list of table names (strings) to query from the database
+        cursors: Table names to {"last_updated": ..., "id": ...}. An id of None reads
+            every row with a later last_updated, for runs without a previous cursor
+        chunk_rows: Rows in the first page of each table
+        target_seconds: Query time each page aims for
+        deadline: time.monotonic() value after which no page is started, None for no limit
+        close_connection: Close the connection when done, False keeps it for the next run
+
+    Returns:
+        A tuple of the rows per table, as get_latest_data (tables not reached map to empty
+        lists), the advanced cursors and True when every table was read to the end
+    """
+    result = {table: [] for table in tables}
+    cursors = {table: dict(cursors[table]) for table in tables}
+    complete = True
+    try:
+        for table in tables:
+            with stage_metrics("extract_query", table) as metrics:
+                key = identifier(f"{table}_id")
+                rows, cursor, size, pages = result[table], cursors[table], chunk_rows, 0
+                while True:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        complete = False
+                        break
+                    start = time.perf_counter()
+                    if cursor["id"] is None:
+                        page = conn.run(
+                            f"SELECT * FROM {identifier(table)} "
+                            "WHERE last_updated > :last_updated "
+                            f"ORDER BY last_updated, {key} LIMIT :size",
+                            last_updated=cursor["last_updated"],
+                            size=size,
+                        )
+                    else:
+                        page = conn.run(
+                            f"SELECT * FROM {identifier(table)} "
+                            f"WHERE (last_updated, {key}) > (:last_updated, :last_id) "
+                            f"ORDER BY last_updated, {key} LIMIT :size",
+                            last_updated=cursor["last_updated"],
+                            last_id=cursor["id"],
+                            size=size,
+                        )
+                    seconds = time.perf_counter() - start
+                    columns = [col["name"] for col in conn.columns]
+                    rows.extend(dict(zip(columns, row)) for row in page)
+                    pages += 1
+                    if page:
+                        cursor["last_updated"] = rows[-1]["last_updated"]
+                        cursor["id"] = rows[-1][f"{table}_id"]
+                    if len(page) < size:
+                        break
+                    size = next_chunk_size(size, seconds, target_seconds)
+                metrics["rows_out"] = len(rows)
+                logger.info(f"Extracted {len(rows)} {table} rows in {pages} pages")
+            if not complete:
+                logger.info(f"Out of time, resuming {table} after {cursor} next run")
+                break
+        return result, cursors, complete
+    finally:
+        if close_connection:
+            conn.close()
@@ -0,0 +1,107 @@
+"""
+Per-table extraction cursors, saved with every batch in the ingestion bucket.
+
+Each batch folder written by a polling run gets
+    {batch}/_extract_cursors.json
+    {"complete": true, "tables": {"sales_order": {"last_updated": "2024-11-19T14:29:51.371000",
+                                                  "id": 11235}, ...}}
+holding the (last_updated, {table}_id) of the last row read from every table. The next
+run reads the newest batch's cursors and continues after them, see
+get_changes_after_cursors. "complete" is false when a run stopped before its timeout with
+rows left to read.
+
+Bootstraps write cursors too. The newest batch that has cursors is used, so a run that
+failed before writing its cursors is simply read again. A bucket without any cursors, from
+before they existed, falls back to its newest folder timestamp.
+"""
+
+import json
+import time
+
+EXTRACT_CURSORS_FILE = "_extract_cursors.json"
+
+# Seconds of the lambda's time kept back for writing the batch once reading stops
+WRITE_RESERVE_SECONDS = 20
+
+
+def initial_cursors(tables, timestamp):
+    """
+    Returns cursors that read every row updated after a timestamp
+
+    Args:
+        tables (list): source tables
+        timestamp (str): e.g. "2000-01-01 00:00:00"
+
+    Returns:
+        dictionary of table names to cursors without an id
+    """
+    return {table: {"last_updated": timestamp, "id": None} for table in tables}
+
+
+def find_cursor_batch(keys):
+    """
+    Returns the newest batch folder with cursors, or None
+
+    Args:
+        keys (list): keys of the ingestion bucket, as listed by the extract handler
+    """
+    batches = [
+        key.rsplit("/", 1)[0]
+        for key in keys
+        if key.endswith(f"/{EXTRACT_CURSORS_FILE}")
+    ]
+    return max(batches, default=None)
+
+
+def read_extract_cursors(storage, batch, tables):
+    """
+    Reads the cursors of a batch folder
+
+    Args:
+        storage: bucket backend from get_storage
+        batch (str): batch folder, e.g. "2024-11-19 14:30:00"
+        tables (list): source tables
+
+    Returns:
+        dictionary of table names to cursors. Tables missing from the file start after
+        the batch's folder timestamp
+    """
+    saved = json.loads(storage.get(f"{batch}/{EXTRACT_CURSORS_FILE}"))["tables"]
+    return {**initial_cursors(tables, batch), **saved}
+
+
+def write_extract_cursors(storage, batch, cursors, complete=True):
+    """
+    Writes the cursors of a batch folder
+
+    Args:
+        storage: bucket backend from get_storage
+        batch (str): batch folder
+        cursors (dict): table names to cursors, last_updated as datetime or string
+        complete (bool): False when rows were left for the next run
+    """
+    storage.put(
+        f"{batch}/{EXTRACT_CURSORS_FILE}",
+        json.dumps(
+            {"complete": complete, "tables": cursors},
+            default=lambda value: value.isoformat(),
+        ),
+        content_type="application/json",
+    )
+
+
+def run_deadline(context, reserve_seconds=WRITE_RESERVE_SECONDS):
+    """
+    Returns the time.monotonic() value after which extraction should stop reading
+
+    Args:
+        context: lambda context, None when run locally
+        reserve_seconds (float): time kept back to write the batch
+
+    Returns:
+        deadline, or None when there is no time limit
+    """
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    remaining = context.get_remaining_time_in_millis() / 1000
+    return time.monotonic() + remaining - reserve_seconds
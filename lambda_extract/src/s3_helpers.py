@@ -1,5 +1,13 @@
 from datetime import datetime
-import boto3
+import os
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function, runtime_resources is shipped in the dependency layer
+    from storage import get_storage
+
+else:
+    # For local use
+    from lambda_layer.python.storage import get_storage
 
 
 def create_object_with_datetime_key(folder):
@@ -30,6 +38,7 @@ def retrieve_list_of_s3_files(bucket):
 
     This function retrieves and returns the names of all objects stored in the specified
     Amazon S3 bucket. If the bucket is empty, an empty list is returned.
+    Any location accepted by get_storage can be used instead of a bucket name.
 
     Parameters:
         bucket_name (str): The name of the S3 bucket to retrieve file names from.
@@ -46,9 +55,4 @@ def retrieve_list_of_s3_files(bucket):
         botocore.exceptions.NoCredentialsError: If AWS credentials are not available.
         botocore.exceptions.ClientError: For other client errors, such as permissions issues.
     """
-    s3 = boto3.client("s3")
-    response = s3.list_objects_v2(Bucket=bucket)
-
-    if "Contents" in response:
-        return [obj["Key"] for obj in response["Contents"]]
-    return []
+    return get_storage(bucket).list()
@@ -1,21 +1,35 @@
 import json
-import boto3
 import os
 import tempfile
 import csv
 from datetime import datetime
 from decimal import Decimal
 
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function, runtime_resources is shipped in the dependency layer
+    from runtime_resources import get_client
+    from storage import get_storage
+    from metrics import stage_metrics
 
-def s3_save_as_json(data, bucket, key):
+else:
+    # For local use
+    from lambda_layer.python.runtime_resources import get_client
+    from lambda_layer.python.storage import get_storage
+    from lambda_layer.python.metrics import stage_metrics
+
+
+def s3_save_as_json(data, bucket, key, raise_errors=False):
     """
     Saves data to an S3 bucket as a JSON file.
 
     Parameters:
     - data (dict): The data to be saved to the S3 bucket. This should be in dictionary format,
       which will be converted to JSON.
-    - bucket (str): The name of the S3 bucket where the data will be saved.
+    - bucket (str): The name of the S3 bucket where the data will be saved, or any location
+      accepted by get_storage.
     - key (str): The key (path/filename) for the JSON object within the S3 bucket.
+    - raise_errors (bool): Re-raise after printing the error, for callers that must know the
+      object was written.
 
     Returns:
     - None
@@ -33,17 +47,20 @@ def s3_save_as_json(data, bucket, key):
     >>> s3_save(data, bucket, key)
     Saved to my-s3-bucket/path/to/object.json
     """
-    s3_client = boto3.client("s3", region_name="eu-west-2")
+    table = os.path.splitext(os.path.basename(key))[0]
     try:
-        s3_client.put_object(
-            Bucket=bucket,
-            Key=key,
-            Body=json.dumps(data, default=custom_json_serializer),
-            ContentType="application/json",
-        )
+        with stage_metrics("serialize", table) as metrics:
+            body = json.dumps(data, default=custom_json_serializer).encode("utf-8")
+            metrics["rows_in"] = len(data)
+            metrics["bytes_written"] = len(body)
+        with stage_metrics("upload", table) as metrics:
+            get_storage(bucket).put(key, body, content_type="application/json")
+            metrics["bytes_written"] = len(body)
         print(f"Saved to {bucket}/{key}")
     except Exception as e:
         print(f"Error: {e}")
+        if raise_errors:
+            raise
 
 
 def s3_save_as_csv(data, headers, bucket, key):
@@ -57,7 +74,7 @@ def s3_save_as_csv(data, headers, bucket, key):
     - bucket: Name of the S3 bucket.
     - key: The S3 object key for the file location.
     """
-    s3_client = boto3.client("s3", region_name="eu-west-2")
+    s3_client = get_client("s3")
     with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as temp_file:
         temp_path = temp_file.name
 
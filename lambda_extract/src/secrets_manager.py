@@ -1,12 +1,21 @@
-import boto3
+import os
 from botocore.exceptions import ClientError
 
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function, runtime_resources is shipped in the dependency layer
+    from runtime_resources import get_secret_string
+
+else:
+    # For local use
+    from lambda_layer.python.runtime_resources import get_secret_string
+
 
 def get_secret(name):
     """Gets a secret from AWS Secret Manager.
 
     Finds the given secret name in the Secret Manager and returns the
-    value.
+    value. The value is cached for SECRET_TTL_SECONDS, so warm invocations
+    do not call Secrets Manager again.
 
     Args:
       name: secret name
@@ -15,11 +24,8 @@ def get_secret(name):
       String value of the secret or an informative error message.
 
     """
-    client = boto3.client("secretsmanager", region_name="eu-west-2")
     try:
-        response = client.get_secret_value(SecretId=name)
-        secret_value = response["SecretString"]
-        return secret_value
+        return get_secret_string(name)
     except ClientError as e:
         print(f">>> Secret {name} was not found")
         return None
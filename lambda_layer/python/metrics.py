@@ -0,0 +1,140 @@
+"""
+Per-stage pipeline metrics in CloudWatch Embedded Metric Format (EMF).
+
+Each measured stage prints one JSON line to stdout. CloudWatch Logs turns the lines of a
+lambda's log group into metrics in METRICS_NAMESPACE. Records of a table are reported under
+both dimension sets, records without one only under the first
+    Function, Stage            e.g. extract, extract_query
+    Function, Stage, Table     e.g. extract, extract_query, sales_order
+so alarms can target one stage of one lambda. Locally the same lines can be read back with
+parse_emf_records.
+
+This module is shipped in the shared dependency layer, next to runtime_resources.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "TotesysPipeline")
+
+# Keys a stage can fill in, with the EMF metric name and unit each is reported as
+STAGE_METRICS = {
+    "duration": ("Duration", "Milliseconds"),
+    "rows_in": ("RowsIn", "Count"),
+    "rows_out": ("RowsOut", "Count"),
+    "bytes_read": ("BytesRead", "Bytes"),
+    "bytes_written": ("BytesWritten", "Bytes"),
+    "retries": ("Retries", "Count"),
+    "lag_seconds": ("FreshnessLag", "Seconds"),
+    "errors": ("Errors", "Count"),
+}
+
+_print_lock = threading.Lock()
+
+
+def emit_metrics(stage, table=None, **values):
+    """
+    Prints one EMF record for a stage
+
+    Args:
+        stage (str): stage name, e.g. "upload"
+        table (str): source or star table the stage worked on, if any
+        values: metric values keyed as in STAGE_METRICS, e.g. rows_out=10
+
+    Returns:
+        the record that was printed
+    """
+    dimensions = {
+        "Function": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local"),
+        "Stage": stage,
+    }
+    # a table's record also counts towards its stage total
+    dimension_sets = [list(dimensions)]
+    if table is not None:
+        dimensions["Table"] = table
+        dimension_sets.insert(0, list(dimensions))
+    metrics = {
+        STAGE_METRICS[key][0]: value
+        for key, value in values.items()
+        if key in STAGE_METRICS and value is not None
+    }
+
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": dimension_sets,
+                    "Metrics": [
+                        {"Name": name, "Unit": unit}
+                        for name, unit in STAGE_METRICS.values()
+                        if name in metrics
+                    ],
+                }
+            ],
+        },
+        **dimensions,
+        **metrics,
+    }
+    # one write per record, so lines from concurrent stages never interleave
+    with _print_lock:
+        sys.stdout.write(json.dumps(record, default=str) + "\n")
+        sys.stdout.flush()
+    return record
+
+
+@contextmanager
+def stage_metrics(stage, table=None):
+    """
+    Times a block and emits its metrics when it finishes
+
+    The block fills in the yielded dictionary with any of the STAGE_METRICS keys. A block
+    that raises is still reported, with errors=1, and the exception is re-raised.
+
+    Args:
+        stage (str): stage name
+        table (str): table the stage works on, if any
+
+    Example:
+        >>> with stage_metrics("extract_query", "design") as metrics:
+        ...     metrics["rows_out"] = len(rows)
+    """
+    values = {"retries": 0, "errors": 0}
+    start = time.perf_counter()
+    try:
+        yield values
+    except Exception:
+        values["errors"] = 1
+        raise
+    finally:
+        values["duration"] = round((time.perf_counter() - start) * 1000, 3)
+        emit_metrics(stage, table, **values)
+
+
+def parse_emf_records(lines):
+    """
+    Returns the EMF records found in log lines, other lines are skipped
+
+    Args:
+        lines (iterable): log lines, e.g. captured stdout split into lines
+
+    Returns:
+        list of record dictionaries
+    """
+    records = []
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and "_aws" in record:
+            records.append(record)
+    return records
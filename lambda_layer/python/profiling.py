@@ -0,0 +1,171 @@
+"""
+Opt-in profiling of lambda handler invocations.
+
+Handlers are wrapped with @profiled. An invocation is profiled when its event has a
+"profile" field, or when the PROFILE_HANDLER environment variable is "true":
+    {"profile": true}                          write to PROFILE_LOCATION
+    {"profile": "file:///tmp/profiles"}        write to this location, a bucket name or
+                                               s3://, file:// or memory:// location
+    {"profile": false}                         off, also "false" and "0"
+Any other value turns profiling off and logs a warning.
+The invocation then runs under cProfile and tracemalloc, and three artifacts are written
+under profiles/{function}/{timestamp}/ through get_storage:
+    handler.prof       cProfile stats, open with pstats or snakeviz
+    functions.txt      top PROFILE_TOP_N functions by cumulative time
+    allocations.txt    top PROFILE_TOP_N source lines by memory still allocated at the end,
+                       and the traced peak
+
+When profiling is off the wrapper only checks the event and the environment, and
+cProfile, pstats and tracemalloc are never imported.
+
+This module is shipped in the shared dependency layer, next to runtime_resources.
+"""
+
+import functools
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function
+    from storage import get_storage
+
+else:
+    # For local use
+    from lambda_layer.python.storage import get_storage
+
+logger = logging.getLogger()
+
+# Where profiles go when the event does not name a location, a bucket or file:// folder
+PROFILE_LOCATION = os.environ.get("PROFILE_LOCATION", "file:///tmp/profiles")
+
+# Event strings that switch profiling on or off rather than naming a location
+PROFILE_ON = {"true", "1", "yes"}
+PROFILE_OFF = {"false", "0", "no", ""}
+
+# Locations get_storage accepts, a URL of a known backend or an S3 bucket name
+PROFILE_LOCATION_PATTERN = re.compile(
+    r"^((s3|file|memory)://.+|[a-z0-9][a-z0-9.-]{1,61}[a-z0-9])$"
+)
+
+# Lines in the function and allocation reports
+PROFILE_TOP_N = 25
+
+# Stack frames kept per traced allocation, more frames cost more memory and time
+TRACEMALLOC_FRAMES = 5
+
+
+def profile_location(event):
+    """
+    Returns where an invocation's profile should be written, or None when profiling is off
+
+    Args:
+        event (dict): lambda event
+
+    Returns:
+        location accepted by get_storage, or None
+    """
+    requested = event.get("profile") if isinstance(event, dict) else None
+    if requested is None:
+        on = os.environ.get("PROFILE_HANDLER", "").lower() == "true"
+        return PROFILE_LOCATION if on else None
+    if isinstance(requested, bool):
+        return PROFILE_LOCATION if requested else None
+    if isinstance(requested, str):
+        if requested.strip().lower() in PROFILE_ON:
+            return PROFILE_LOCATION
+        if requested.strip().lower() in PROFILE_OFF:
+            return None
+        if PROFILE_LOCATION_PATTERN.match(requested):
+            return requested
+    logger.warning(f"Profiling off, {requested!r} is not a boolean or location")
+    return None
+
+
+def write_profile(location, profiler, snapshot, traced_peak, seconds):
+    """
+    Writes the profile artifacts of one invocation
+
+    Args:
+        location (str): bucket name or file:// / memory:// location
+        profiler (cProfile.Profile): stopped profiler
+        snapshot (tracemalloc.Snapshot): allocations at the end of the invocation
+        traced_peak (int): peak traced memory in bytes
+        seconds (float): wall time of the invocation
+
+    Returns:
+        list of written keys
+    """
+    import io
+    import marshal
+    import pstats
+
+    function = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")
+    prefix = f"profiles/{function}/{datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')}"
+    storage = get_storage(location)
+
+    profiler.create_stats()
+    storage.put(f"{prefix}/handler.prof", marshal.dumps(profiler.stats))
+
+    report = io.StringIO()
+    report.write(f"Invocation took {seconds:.3f}s\n\n")
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(
+        PROFILE_TOP_N
+    )
+    storage.put(f"{prefix}/functions.txt", report.getvalue())
+
+    lines = [
+        f"Traced peak: {traced_peak / 2**20:.1f} MiB",
+        f"Top {PROFILE_TOP_N} lines by memory still allocated:",
+    ]
+    for stat in snapshot.statistics("lineno")[:PROFILE_TOP_N]:
+        frame = stat.traceback[0]
+        lines.append(
+            f"{stat.size / 2**10:10.1f} KiB {stat.count:8d} blocks  "
+            f"{frame.filename}:{frame.lineno}"
+        )
+    storage.put(f"{prefix}/allocations.txt", "\n".join(lines) + "\n")
+
+    keys = [
+        f"{prefix}/{name}"
+        for name in ("handler.prof", "functions.txt", "allocations.txt")
+    ]
+    logger.info(f"Profile written to {storage.url(prefix)}")
+    return keys
+
+
+def profiled(handler):
+    """
+    Decorates a lambda handler so invocations can be profiled on demand, see profile_location
+    """
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        location = profile_location(event)
+        if location is None:
+            return handler(event, context)
+
+        import cProfile
+        import tracemalloc
+
+        profiler = cProfile.Profile()
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return handler(event, context)
+        finally:
+            profiler.disable()
+            seconds = time.perf_counter() - start
+            snapshot = tracemalloc.take_snapshot()
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            try:
+                write_profile(location, profiler, snapshot, traced_peak, seconds)
+            except Exception as e:
+                # a profile that cannot be written must not fail the invocation
+                logger.error(f"Could not write profile to {location}: {e}")
+
+    return wrapper
@@ -0,0 +1,260 @@
+"""
+Per-run accounting of S3, Secrets Manager and database requests.
+
+Every AWS API call made through boto3's default session, which includes the clients from
+runtime_resources.get_client and the ones awswrangler creates, is counted through botocore
+event hooks. Database round trips are counted by wrapping pg8000 connections with
+AccountedConnection. For each operation, e.g. "s3.PutObject" or "sql.INSERT", the ledger
+keeps the number of calls, errors, retries, bytes sent and received, and a latency histogram.
+
+Handlers are wrapped with @accounted, which starts a fresh ledger for every invocation and
+prints its summary as one JSON line when the invocation ends. Tests can call
+start_run and request_summary directly to assert on the number of calls, e.g. that a load
+does not make one round trip per row.
+
+This module is shipped in the shared dependency layer, next to runtime_resources.
+"""
+
+import functools
+import json
+import threading
+import time
+import boto3
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+_lock = threading.Lock()
+_ledger = {}
+_hooked_sessions = set()
+
+
+def _new_entry():
+    return {
+        "calls": 0,
+        "errors": 0,
+        "retries": 0,
+        "bytes_sent": 0,
+        "bytes_received": 0,
+        "total_ms": 0.0,
+        "max_ms": 0.0,
+        "latency_ms": {str(b): 0 for b in LATENCY_BUCKETS_MS} | {"inf": 0},
+    }
+
+
+def record_request(
+    operation, seconds, bytes_sent=0, bytes_received=0, retries=0, error=False
+):
+    """
+    Adds one request to the ledger of the current run
+
+    Args:
+        operation (str): e.g. "s3.GetObject" or "sql.SELECT"
+        seconds (float): latency, including retries
+        bytes_sent (int): request body size
+        bytes_received (int): response body size
+        retries (int): retries made by the client before it returned
+        error (bool): True if the request failed
+    """
+    ms = seconds * 1000
+    bucket = next((str(b) for b in LATENCY_BUCKETS_MS if ms <= b), "inf")
+    with _lock:
+        entry = _ledger.setdefault(operation, _new_entry())
+        entry["calls"] += 1
+        entry["errors"] += int(error)
+        entry["retries"] += retries
+        entry["bytes_sent"] += bytes_sent
+        entry["bytes_received"] += bytes_received
+        entry["total_ms"] += ms
+        entry["max_ms"] = max(entry["max_ms"], ms)
+        entry["latency_ms"][bucket] += 1
+
+
+def start_run():
+    """Clears the ledger, called at the start of every invocation"""
+    with _lock:
+        _ledger.clear()
+
+
+def request_summary():
+    """
+    Returns the requests counted since start_run
+
+    Returns:
+        dictionary of operation names to their counters, e.g.
+        {"s3.PutObject": {"calls": 11, "bytes_sent": 5120, "latency_ms": {"25": 11, ...}, ...}}
+    """
+    with _lock:
+        return {
+            operation: {
+                **entry,
+                "total_ms": round(entry["total_ms"], 3),
+                "max_ms": round(entry["max_ms"], 3),
+                "latency_ms": dict(entry["latency_ms"]),
+            }
+            for operation, entry in sorted(_ledger.items())
+        }
+
+
+def print_request_summary():
+    """Prints the run's request summary as one JSON line and returns it"""
+    summary = request_summary()
+    print(json.dumps({"request_summary": summary}))
+    return summary
+
+
+def _body_size(body):
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    if hasattr(body, "seek") and hasattr(body, "tell"):
+        # botocore wraps upload bodies in file objects, size them without reading
+        position = body.tell()
+        size = body.seek(0, 2) - position
+        body.seek(position)
+        return size
+    return 0
+
+
+def _before_call(model, params, context, **kwargs):
+    # after-call-error has no operation model and its event name uses the hyphenated
+    # service id, e.g. "secrets-manager", so the operation is named here for both hooks
+    context["request_accounting"] = (
+        time.perf_counter(),
+        _body_size(params.get("body")),
+        f"{model.service_model.service_name}.{model.name}",
+    )
+
+
+def _after_call(model, http_response, parsed, context, **kwargs):
+    start, bytes_sent, operation = context.pop(
+        "request_accounting",
+        (
+            time.perf_counter(),
+            0,
+            f"{model.service_model.service_name}.{model.name}",
+        ),
+    )
+    record_request(
+        operation,
+        time.perf_counter() - start,
+        bytes_sent=bytes_sent,
+        bytes_received=int(http_response.headers.get("content-length") or 0),
+        retries=parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+        error=http_response.status_code >= 400,
+    )
+
+
+def _after_call_error(event_name, context, **kwargs):
+    # the event name is "after-call-error.<service id>.<operation>", only used when
+    # before-call did not run
+    _, service, operation = event_name.split(".", 2)
+    start, bytes_sent, operation = context.pop(
+        "request_accounting", (time.perf_counter(), 0, f"{service}.{operation}")
+    )
+    record_request(
+        operation,
+        time.perf_counter() - start,
+        bytes_sent=bytes_sent,
+        error=True,
+    )
+
+
+def install_botocore_hooks(session=None):
+    """
+    Registers the accounting hooks on a boto3 session, once per session
+
+    Clients copy their session's hooks when they are created, so this must run before the
+    clients to be counted are made.
+
+    Args:
+        session (boto3.Session): defaults to boto3's default session, used by boto3.client
+            and awswrangler
+    """
+    if session is None:
+        # boto3.client and awswrangler both create their clients from this session
+        session = boto3._get_default_session()
+    if id(session) in _hooked_sessions:
+        return
+    events = session.events
+    events.register("before-call", _before_call, unique_id="accounting-before")
+    events.register("after-call", _after_call, unique_id="accounting-after")
+    events.register(
+        "after-call-error", _after_call_error, unique_id="accounting-after-error"
+    )
+    _hooked_sessions.add(id(session))
+
+
+class AccountedConnection:
+    """
+    A pg8000.native.Connection whose run calls are counted as "sql.<first keyword>"
+
+    Every run is one round trip, so N+1 query patterns show up as call counts. COPY FROM
+    STDIN streams are measured as bytes_sent. Every other attribute is passed through to the
+    wrapped connection.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def run(self, sql, stream=None, **params):
+        operation = f"sql.{sql.split(None, 1)[0].upper()}" if sql.strip() else "sql"
+        sent = 0
+        if stream is not None and not hasattr(stream, "read"):
+            original = stream
+
+            def counted():
+                nonlocal sent
+                for chunk in original:
+                    sent += len(
+                        chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+                    )
+                    yield chunk
+
+            stream = counted()
+
+        start = time.perf_counter()
+        try:
+            if stream is None:
+                result = self._conn.run(sql, **params)
+            else:
+                result = self._conn.run(sql, stream=stream, **params)
+        except Exception:
+            record_request(operation, time.perf_counter() - start, sent, error=True)
+            raise
+        record_request(operation, time.perf_counter() - start, sent)
+        return result
+
+
+def account_connection(conn):
+    """
+    Wraps a pg8000 connection in AccountedConnection
+
+    Args:
+        conn (pg8000.native.Connection): connection, or None when connecting failed
+
+    Returns:
+        AccountedConnection, or None
+    """
+    return None if conn is None else AccountedConnection(conn)
+
+
+def accounted(handler):
+    """
+    Decorates a lambda handler to count the requests of each invocation and print a summary
+    """
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        install_botocore_hooks()
+        start_run()
+        try:
+            return handler(event, context)
+        finally:
+            print_request_summary()
+
+    return wrapper
@@ -0,0 +1,157 @@
+"""
+Resources kept between warm invocations of the extract, transform and load lambdas.
+
+This module is shipped in the shared dependency layer, so all three lambdas import the
+same code. Everything is cached at module level: a lambda container handles one event at
+a time and module state survives until the container is recycled.
+"""
+
+import logging
+import os
+import threading
+import time
+import boto3
+from botocore.config import Config
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function
+    from request_accounting import install_botocore_hooks
+
+else:
+    # For local use
+    from lambda_layer.python.request_accounting import install_botocore_hooks
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Shared by every cached client. The connection pool is sized for the thread pools that
+# read and write star tables concurrently, botocore's default of 10 would make them queue
+CLIENT_CONFIG = Config(
+    region_name="eu-west-2",
+    max_pool_connections=32,
+    retries={"max_attempts": 5, "mode": "standard"},
+    tcp_keepalive=True,
+)
+
+# Seconds a secret is reused before it is fetched again, so rotated credentials are picked up
+SECRET_TTL_SECONDS = 300
+
+_lock = threading.Lock()
+_clients = {}
+_secrets = {}
+_connections = {}
+
+
+def get_client(service_name):
+    """
+    Returns a boto3 client for an AWS service, created once per container
+
+    boto3 clients are thread safe once created, but creating them is not, so creation
+    happens under a lock. Calls made with the client are counted by request_accounting.
+
+    Args:
+        service_name (str): e.g. "s3" or "secretsmanager"
+
+    Returns:
+        boto3 client configured with CLIENT_CONFIG
+    """
+    with _lock:
+        if service_name not in _clients:
+            # the client copies the session's hooks when it is created
+            install_botocore_hooks()
+            _clients[service_name] = boto3.client(service_name, config=CLIENT_CONFIG)
+        return _clients[service_name]
+
+
+def get_secret_string(name, ttl=SECRET_TTL_SECONDS):
+    """
+    Returns the SecretString of a Secrets Manager secret, cached for ttl seconds
+
+    Args:
+        name (str): secret name
+        ttl (int): seconds a fetched value is reused, 0 always fetches
+
+    Returns:
+        string value of the secret
+
+    Raises:
+        botocore.exceptions.ClientError: if the secret cannot be retrieved
+    """
+    cached = _secrets.get(name)
+    if cached is not None and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+
+    response = get_client("secretsmanager").get_secret_value(SecretId=name)
+    secret_string = response.get("SecretString")
+    _secrets[name] = (time.monotonic(), secret_string)
+    return secret_string
+
+
+def is_connection_alive(conn):
+    """
+    Checks a pg8000 connection with a single round trip
+
+    Args:
+        conn (pg8000.native.Connection): connection to check
+
+    Returns:
+        True if the database answered
+    """
+    try:
+        conn.run("SELECT 1")
+        return True
+    except Exception:
+        return False
+
+
+def get_db_connection(key, connect):
+    """
+    Returns the database connection stored under key, reconnecting when it has gone away
+
+    The stored connection is checked with is_connection_alive before it is handed out. A
+    dead connection is closed and replaced by calling connect.
+
+    Args:
+        key (str): cache key, normally the secret name
+        connect (callable): takes no arguments and returns a new connection, or None on failure
+
+    Returns:
+        pg8000 connection, or None if connect failed
+    """
+    conn = _connections.get(key)
+    if conn is not None:
+        if is_connection_alive(conn):
+            return conn
+        logger.info(f"Database connection {key} is no longer alive, reconnecting")
+        discard_db_connection(key)
+
+    conn = connect()
+    if conn is not None:
+        _connections[key] = conn
+    return conn
+
+
+def discard_db_connection(key):
+    """
+    Closes and forgets the database connection stored under key
+
+    Args:
+        key (str): cache key used with get_db_connection
+    """
+    conn = _connections.pop(key, None)
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def clear_runtime_resources():
+    """
+    Forgets every cached client and secret and closes cached connections, e.g. between tests
+    """
+    for key in list(_connections):
+        discard_db_connection(key)
+    with _lock:
+        _clients.clear()
+    _secrets.clear()
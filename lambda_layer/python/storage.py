@@ -0,0 +1,163 @@
+"""
+Object storage backends for the data lake buckets.
+
+Every stage addresses a bucket by a location string and gets a backend from get_storage:
+    "my-bucket" or "s3://my-bucket"   S3Storage, the deployed pipeline
+    "file:///tmp/lake/ingestion"      LocalStorage, a folder on disk
+    "memory://ingestion"              MemoryStorage, a dict shared inside the process
+
+All backends store bytes under "/" separated keys and list keys in sorted order, so the
+timestamped batch folders written by the lambdas work the same everywhere. Reading a key
+that does not exist raises FileNotFoundError.
+
+This module is shipped in the shared dependency layer, next to runtime_resources.
+"""
+
+import os
+import shutil
+from botocore.exceptions import ClientError
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function
+    from runtime_resources import get_client
+
+else:
+    # For local use
+    from lambda_layer.python.runtime_resources import get_client
+
+_memory_stores = {}
+
+
+class S3Storage:
+    """Objects in an S3 bucket, through the cached client from runtime_resources"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def url(self, key):
+        return f"s3://{self.bucket}/{key}"
+
+    def put(self, key, body, content_type=None):
+        kwargs = {"ContentType": content_type} if content_type else {}
+        get_client("s3").put_object(Bucket=self.bucket, Key=key, Body=body, **kwargs)
+
+    def get(self, key):
+        try:
+            response = get_client("s3").get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                raise FileNotFoundError(self.url(key))
+            raise
+        return response["Body"].read()
+
+    def download(self, key, fileobj):
+        get_client("s3").download_fileobj(self.bucket, key, fileobj)
+
+    def list(self, prefix=None, start_after=None):
+        kwargs = {"Bucket": self.bucket}
+        if prefix:
+            kwargs["Prefix"] = prefix
+        if start_after:
+            kwargs["StartAfter"] = start_after
+
+        keys = []
+        while True:
+            response = get_client("s3").list_objects_v2(**kwargs)
+            keys.extend(obj["Key"] for obj in response.get("Contents", []))
+            if not response.get("IsTruncated"):
+                return keys
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+class LocalStorage:
+    """Files under a root folder, the key is the path relative to the root"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def url(self, key):
+        return f"file://{os.path.join(self.root, key)}"
+
+    def put(self, key, body, content_type=None):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(body.encode("utf-8") if isinstance(body, str) else body)
+
+    def get(self, key):
+        with open(os.path.join(self.root, key), "rb") as file:
+            return file.read()
+
+    def download(self, key, fileobj):
+        with open(os.path.join(self.root, key), "rb") as file:
+            shutil.copyfileobj(file, fileobj)
+
+    def list(self, prefix=None, start_after=None):
+        keys = []
+        for folder, _, files in os.walk(self.root):
+            relative = os.path.relpath(folder, self.root).replace(os.sep, "/")
+            for name in files:
+                keys.append(name if relative == "." else f"{relative}/{name}")
+        return _filter_keys(keys, prefix, start_after)
+
+
+class MemoryStorage:
+    """Objects in a dict, for tests and single process runs"""
+
+    def __init__(self, name="memory"):
+        self.name = name
+        self.objects = {}
+
+    def url(self, key):
+        return f"memory://{self.name}/{key}"
+
+    def put(self, key, body, content_type=None):
+        self.objects[key] = body.encode("utf-8") if isinstance(body, str) else body
+
+    def get(self, key):
+        try:
+            return self.objects[key]
+        except KeyError:
+            raise FileNotFoundError(self.url(key))
+
+    def download(self, key, fileobj):
+        fileobj.write(self.get(key))
+
+    def list(self, prefix=None, start_after=None):
+        return _filter_keys(self.objects, prefix, start_after)
+
+
+def _filter_keys(keys, prefix, start_after):
+    return sorted(
+        key
+        for key in keys
+        if (not prefix or key.startswith(prefix))
+        and (not start_after or key > start_after)
+    )
+
+
+def get_storage(location):
+    """
+    Returns the storage backend for a bucket location
+
+    Args:
+        location (str): bucket name, or an s3://, file:// or memory:// location
+
+    Returns:
+        S3Storage, LocalStorage or MemoryStorage. Memory stores with the same name are shared.
+
+    Example:
+        >>> get_storage("file:///tmp/lake/processed").url("dim_design.parquet")
+        'file:///tmp/lake/processed/dim_design.parquet'
+    """
+    if location.startswith("memory://"):
+        name = location.removeprefix("memory://")
+        return _memory_stores.setdefault(name, MemoryStorage(name))
+    if location.startswith("file://"):
+        return LocalStorage(location.removeprefix("file://"))
+    return S3Storage(location.removeprefix("s3://"))
+
+
+def clear_memory_storage():
+    """Drops every memory:// store"""
+    _memory_stores.clear()
@@ -0,0 +1,70 @@
+"""
+Tables written as several part files within one batch folder.
+
+A bootstrap extract splits large tables into primary key ranges and writes each range to
+its own file, and lists them in a manifest next to the other files of the batch:
+    {batch}/_parts.json
+    {"sales_order": ["sales_order/part-00000.json", "sales_order/part-00001.json"], ...}
+Tables missing from the manifest, and batches without one, are the single {table}.json
+file. read_table_keys gives the keys to read for a table either way, so the transform
+treats a table's parts as one table.
+
+This module is shipped in the shared dependency layer, next to runtime_resources.
+"""
+
+import json
+
+PARTS_MANIFEST_FILE = "_parts.json"
+
+
+def part_key(table, index):
+    """Returns the key of a table's part file within its batch folder"""
+    return f"{table}/part-{index:05d}.json"
+
+
+def write_parts_manifest(storage, batch, parts):
+    """
+    Writes the part manifest of a batch folder
+
+    Args:
+        storage: bucket backend from get_storage
+        batch (str): batch folder, e.g. "2024-11-19 14:30:00"
+        parts (dict): table names to their part keys, relative to the batch folder
+    """
+    storage.put(
+        f"{batch}/{PARTS_MANIFEST_FILE}",
+        json.dumps(parts),
+        content_type="application/json",
+    )
+
+
+def read_parts_manifest(storage, batch):
+    """
+    Reads the part manifest of a batch folder
+
+    Args:
+        storage: bucket backend from get_storage
+        batch (str): batch folder
+
+    Returns:
+        dictionary of table names to part keys, empty for batches written without one
+    """
+    try:
+        return json.loads(storage.get(f"{batch}/{PARTS_MANIFEST_FILE}"))
+    except FileNotFoundError:
+        return {}
+
+
+def read_table_keys(manifest, batch, table):
+    """
+    Returns the keys holding a table's rows in a batch folder
+
+    Args:
+        manifest (dict): from read_parts_manifest
+        batch (str): batch folder
+        table (str): source table name
+
+    Returns:
+        list of keys, the part files in order or the single {table}.json file
+    """
+    return [f"{batch}/{key}" for key in manifest.get(table, [f"{table}.json"])]
@@ -0,0 +1,71 @@
+"""
+Source watermarks carried with every batch from extract through to load.
+
+Next to the files of each batch folder, extract and transform write a small manifest:
+    {batch}/_source_watermarks.json
+    {"extracted_at": "2024-11-19 14:30:00", "tables": {"sales_order": "2024-11-19T14:29:51.371000", ...}}
+where each table maps to the newest source last_updated of the rows in the batch. In the
+ingestion bucket the tables are source tables, in the processed bucket they are star tables.
+The load lambda compares them with its commit time to measure data freshness.
+
+Timestamps are ISO strings in the source database's time zone (UTC), so they compare as strings.
+
+This module is shipped in the shared dependency layer, next to runtime_resources.
+"""
+
+import json
+
+SOURCE_WATERMARKS_FILE = "_source_watermarks.json"
+
+
+def max_last_updated(rows):
+    """
+    Returns the newest last_updated of a list of rows as an ISO string
+
+    Args:
+        rows (list): row dictionaries, last_updated as datetime or ISO string
+
+    Returns:
+        string, or None when there are no rows
+    """
+    values = [row["last_updated"] for row in rows if row.get("last_updated")]
+    if not values:
+        return None
+    return max(
+        value.isoformat() if hasattr(value, "isoformat") else str(value)
+        for value in values
+    )
+
+
+def write_source_watermarks(storage, batch, watermarks, extracted_at):
+    """
+    Writes the watermark manifest of a batch folder
+
+    Args:
+        storage: bucket backend from get_storage
+        batch (str): batch folder, e.g. "2024-11-19 14:30:00"
+        watermarks (dict): table names to newest last_updated, None for tables without rows
+        extracted_at (str): when extract read the source
+    """
+    storage.put(
+        f"{batch}/{SOURCE_WATERMARKS_FILE}",
+        json.dumps({"extracted_at": extracted_at, "tables": watermarks}),
+        content_type="application/json",
+    )
+
+
+def read_source_watermarks(storage, batch):
+    """
+    Reads the watermark manifest of a batch folder
+
+    Args:
+        storage: bucket backend from get_storage
+        batch (str): batch folder
+
+    Returns:
+        dictionary with "extracted_at" and "tables", or None for batches written without one
+    """
+    try:
+        return json.loads(storage.get(f"{batch}/{SOURCE_WATERMARKS_FILE}"))
+    except FileNotFoundError:
+        return None
@@ -6,26 +6,53 @@ if os.environ.get("AWS_EXECUTION_ENV") is not None:
     from src.warehouse_load_functions_pg8000 import (
         get_secret,
         create_conn,
-        close_conn,
-        load_data_into_warehouse,
     )
-    from src.load_parquet_data import read_parquet_data_to_dataframe
+    from runtime_resources import get_db_connection
+    from storage import get_storage
+    from profiling import profiled
+    from request_accounting import accounted, account_connection
+    from src.load_parquet_data import (
+        get_load_checkpoint,
+        save_load_checkpoint,
+        list_pending_table_keys,
+    )
 
 else:
     # For local use
     from lambda_load.src.warehouse_load_functions_pg8000 import (
         get_secret,
         create_conn,
-        close_conn,
-        load_data_into_warehouse,
     )
-    from lambda_load.src.load_parquet_data import read_parquet_data_to_dataframe
+    from lambda_layer.python.runtime_resources import get_db_connection
+    from lambda_layer.python.storage import get_storage
+    from lambda_layer.python.profiling import profiled
+    from lambda_layer.python.request_accounting import accounted, account_connection
+    from lambda_load.src.load_parquet_data import (
+        get_load_checkpoint,
+        save_load_checkpoint,
+        list_pending_table_keys,
+    )
 
 
+@accounted
+@profiled
 def lambda_handler(event, context):
     """
     AWS Lambda Handler to load parquet data from S3 into the data warehouse.
 
+    Parquet row groups are streamed straight into the warehouse with COPY, so memory use
+    does not grow with the size of the batch.
+
+    Every batch written since the load checkpoint, up to MAX_PENDING_BATCHES, is loaded in
+    one pass, keeping the latest row per primary key, and the checkpoint only moves once all
+    tables are committed.
+
+    The lag between the newest source change of each star table and the warehouse commit
+    is recorded in the pipeline_run_ledger table and emitted as a FreshnessLag metric.
+
+    The S3 client, secret and warehouse connection are reused by warm invocations.
+    pyarrow is only imported once there is data to load.
+
     Events format:
         {
             "secret": "aws_secretsmanager_secret_name",
@@ -35,17 +62,19 @@ def lambda_handler(event, context):
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
 
-    conn = None
     try:
         secret = event.get("secret")
         bucket = event.get("bucket")
 
         logger.info("Passed event: secret=%s, bucket=%s", secret, bucket)
 
-        # Retrieve most recent set of parquet files from bucket and return as dataframes
-        data = read_parquet_data_to_dataframe(bucket)
+        storage = get_storage(bucket)
+
+        # Find every batch of parquet files not yet loaded
+        checkpoint = get_load_checkpoint(storage)
+        table_keys, batches = list_pending_table_keys(storage, checkpoint)
 
-        if not data:
+        if not table_keys:
             logger.warning("No data to load")
             return {"statusCode": 200, "body": "No data to load"}
 
@@ -55,21 +84,33 @@ def lambda_handler(event, context):
             logger.error("Failed to retrieve database credentials")
             return {"statusCode": 500, "body": "Failed to retrieve credentials"}
 
-        conn = create_conn(secret_value)
+        conn = get_db_connection(
+            secret, lambda: account_connection(create_conn(secret_value))
+        )
         if not conn:
             logger.error("Failed to connect to database")
             return {"statusCode": 500, "body": "Failed to connect to database"}
 
-        # Load dataframes into warehouse
-        load_data_into_warehouse(data, conn)
+        if os.environ.get("AWS_EXECUTION_ENV") is not None:
+            from src.copy_load import stream_load_into_warehouse
+            from src.run_ledger import record_load_run
+        else:
+            from lambda_load.src.copy_load import stream_load_into_warehouse
+            from lambda_load.src.run_ledger import record_load_run
+
+        # Stream parquet files into warehouse
+        loaded = stream_load_into_warehouse(storage, table_keys, conn)
+        save_load_checkpoint(storage, batches[-1])
 
-        logger.info("Successfully loaded data into warehouse")
+        # freshness is recorded after the commit, a failure here must not fail the load
+        try:
+            record_load_run(conn, storage, batches, loaded)
+        except Exception as e:
+            logger.error(f"Could not record load run: {e}")
+
+        logger.info("Successfully loaded %d batches: %s", len(batches), loaded)
         return {"statusCode": 200, "body": "Data loaded successfully"}
 
     except Exception as e:
         logger.error(f"Error in lambda_handler: {e}")
         return {"statusCode": 500, "body": str(e)}
-
-    finally:
-        if conn:
-            close_conn(conn)
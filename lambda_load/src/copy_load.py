@@ -0,0 +1,316 @@
+import logging
+import os
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time
+from itertools import chain
+from pg8000.native import identifier
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function
+    from src.load_parquet_data import WAREHOUSE_COLUMNS, get_partition_values
+    from src.warehouse_load_functions_pg8000 import ordered_tables_with_primary_keys
+    from metrics import stage_metrics
+
+else:
+    # For local use
+    from lambda_load.src.load_parquet_data import (
+        WAREHOUSE_COLUMNS,
+        get_partition_values,
+    )
+    from lambda_load.src.warehouse_load_functions_pg8000 import (
+        ordered_tables_with_primary_keys,
+    )
+    from lambda_layer.python.metrics import stage_metrics
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Rows encoded and sent to Postgres at a time, peak memory is about one batch plus one row group
+COPY_BATCH_SIZE = 50_000
+
+# Star tables whose primary key is only unique within one transform batch, sales_record_id
+# restarts at 1 in every batch. Their pending batches are merged one at a time, oldest
+# first, instead of keeping one row per key across all of them
+BATCH_LOCAL_KEY_TABLES = {"fact_sales_order"}
+
+# Column added to the rows of batch-local tables, holding each row's batch folder
+LOAD_BATCH_COLUMN = "_load_batch"
+
+# Parquet files downloaded ahead of the one being copied, fact_sales_order is one file per
+# created_date so a catch-up load reads hundreds of small files
+PREFETCH_FILES = 8
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def encode_copy_value(value):
+    """
+    Encodes a Python value as a field of the Postgres COPY text format
+
+    Args:
+        value: value read from Parquet
+
+    Returns:
+        string, \\N for nulls
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, float) and value != value:
+        return "NaN"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def encode_copy_batch(batch):
+    """
+    Encodes an Arrow record batch as Postgres COPY text format rows
+
+    Args:
+        batch (pyarrow.RecordBatch): rows to encode
+
+    Returns:
+        string with one tab separated, newline terminated line per row
+    """
+    columns = [column.to_pylist() for column in batch.columns]
+    return "".join(
+        "\t".join(encode_copy_value(value) for value in row) + "\n"
+        for row in zip(*columns)
+    )
+
+
+def download_parquet_file(storage, key, table=None):
+    """
+    Downloads one Parquet file to a temporary file, reported as a "read" stage metric
+
+    Args:
+        storage: processed bucket backend from get_storage
+        key (str): S3 key of the file
+        table (str): star table name the metrics are reported under
+
+    Returns:
+        tempfile.NamedTemporaryFile holding the file, the caller closes it
+    """
+    temp_file = tempfile.NamedTemporaryFile(suffix=".parquet")
+    try:
+        with stage_metrics("read", table) as metrics:
+            storage.download(key, temp_file)
+            temp_file.flush()
+            metrics["bytes_read"] = temp_file.tell()
+            metrics["rows_out"] = pq.read_metadata(temp_file.name).num_rows
+    except Exception:
+        temp_file.close()
+        raise
+    return temp_file
+
+
+def iter_parquet_batches(
+    storage,
+    keys,
+    columns,
+    batch_size=COPY_BATCH_SIZE,
+    table=None,
+    prefetch_files=PREFETCH_FILES,
+    batch_column=None,
+):
+    """
+    Streams the rows of a star table's Parquet files as Arrow record batches
+
+    Files are downloaded to temporary files on a thread pool, up to prefetch_files ahead of
+    the file being read, so a partitioned table of hundreds of small files is not bound by
+    one round trip after another. Each file is read one row group at a time and only the
+    requested columns are decoded, so only a single batch is held in memory. Hive partition
+    values in the key are added as columns.
+
+    Args:
+        storage: processed bucket backend from get_storage
+        keys (list): S3 keys of the Parquet files making up the table
+        columns (list): Columns to yield, in order
+        batch_size (int): maximum rows per batch
+        table (str): star table name the metrics are reported under
+        prefetch_files (int): files downloaded ahead of the one being read
+        batch_column (str): name of an extra last column holding each file's batch folder,
+            None to leave it out
+
+    Yields:
+        pyarrow.RecordBatch with the requested columns, files in the order of keys
+    """
+    with ThreadPoolExecutor(max_workers=prefetch_files) as executor:
+        downloads = deque(
+            (key, executor.submit(download_parquet_file, storage, key, table))
+            for key in keys[:prefetch_files]
+        )
+        remaining = iter(keys[prefetch_files:])
+        try:
+            while downloads:
+                key, future = downloads.popleft()
+                next_key = next(remaining, None)
+                if next_key is not None:
+                    downloads.append(
+                        (
+                            next_key,
+                            executor.submit(
+                                download_parquet_file, storage, next_key, table
+                            ),
+                        )
+                    )
+                partition_values = get_partition_values(key)
+                with future.result() as temp_file:
+                    parquet_file = pq.ParquetFile(temp_file.name, memory_map=True)
+                    file_columns = [
+                        col for col in columns if col in parquet_file.schema_arrow.names
+                    ]
+                    for batch in parquet_file.iter_batches(
+                        batch_size=batch_size, columns=file_columns, use_threads=True
+                    ):
+                        arrays = dict(zip(batch.schema.names, batch.columns))
+                        for name, value in partition_values.items():
+                            arrays[name] = pa.array(
+                                [value] * batch.num_rows, pa.string()
+                            )
+                        names = [col for col in columns if col in arrays]
+                        if batch_column:
+                            arrays[batch_column] = pa.array(
+                                [key.split("/", 1)[0]] * batch.num_rows, pa.string()
+                            )
+                            names.append(batch_column)
+                        yield pa.RecordBatch.from_arrays(
+                            [arrays[col] for col in names], names=names
+                        )
+        finally:
+            # a stream stopped early, or a failed file, still removes the prefetched files
+            for _, future in downloads:
+                if not future.cancel() and future.exception() is None:
+                    future.result().close()
+
+
+def copy_upsert_table(
+    conn, table, primary_key, batches, schema="public", merge_by=None
+):
+    """
+    Upserts a stream of record batches into a warehouse table with COPY
+
+    Batches are encoded as they are consumed and streamed into a temporary staging table
+    with COPY FROM STDIN, then merged into the target table with INSERT ... ON CONFLICT in
+    one statement. Everything runs in one transaction.
+
+    The staging table numbers rows in arrival order, and only the last row per primary key
+    is merged, so batches from several runs can be streamed together oldest first. With
+    merge_by, rows are merged one value of that column at a time in sorted order, for
+    tables whose primary key only identifies a row within one batch.
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        table (str): star table name
+        primary_key (str): conflict column of the target table
+        batches (iterable): pyarrow.RecordBatch objects, all with the same columns
+        schema (str): warehouse schema
+        merge_by (str): column of the batches that is only staged, e.g. LOAD_BATCH_COLUMN
+
+    Returns:
+        number of rows copied
+    """
+    batches = iter(batches)
+    first_batch = next(batches, None)
+    if first_batch is None:
+        return 0
+
+    copy_columns = first_batch.schema.names
+    columns = [col for col in copy_columns if col != merge_by]
+    row_count = 0
+
+    def stream():
+        nonlocal row_count
+        for batch in chain([first_batch], batches):
+            row_count += batch.num_rows
+            yield encode_copy_batch(batch)
+
+    stage = identifier(f"stage_{table}")
+    target = f"{identifier(schema)}.{identifier(table)}"
+    cols = ", ".join(identifier(col) for col in columns)
+    copy_cols = ", ".join(identifier(col) for col in copy_columns)
+    updates = ", ".join(
+        f"{identifier(col)} = EXCLUDED.{identifier(col)}" for col in columns
+    )
+
+    conn.run("START TRANSACTION")
+    try:
+        conn.run(
+            f"CREATE TEMP TABLE {stage} (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        conn.run(
+            f"ALTER TABLE {stage} ADD COLUMN _load_seq BIGINT GENERATED ALWAYS AS IDENTITY"
+        )
+        if merge_by:
+            conn.run(f"ALTER TABLE {stage} ADD COLUMN {identifier(merge_by)} TEXT")
+        conn.run(f"COPY {stage} ({copy_cols}) FROM STDIN", stream=stream())
+        merge_value = f" WHERE {identifier(merge_by)} = :value" if merge_by else ""
+        merge = (
+            f"INSERT INTO {target} ({cols}) "
+            f"SELECT DISTINCT ON ({identifier(primary_key)}) {cols} FROM {stage}"
+            f"{merge_value} ORDER BY {identifier(primary_key)}, _load_seq DESC "
+            f"ON CONFLICT ({identifier(primary_key)}) DO UPDATE SET {updates}"
+        )
+        if merge_by:
+            for (value,) in conn.run(
+                f"SELECT DISTINCT {identifier(merge_by)} FROM {stage} ORDER BY 1"
+            ):
+                conn.run(merge, value=value)
+        else:
+            conn.run(merge)
+        conn.run("COMMIT")
+    except Exception:
+        conn.run("ROLLBACK")
+        raise
+    return row_count
+
+
+def stream_load_into_warehouse(storage, table_keys, conn, schema="public"):
+    """
+    Streams the latest star tables from Parquet into the warehouse
+
+    Tables are loaded dimensions first, each with copy_upsert_table. Only the star tables
+    present in table_keys are loaded. Keys of several batches must be listed oldest first.
+
+    Args:
+        storage: processed bucket backend from get_storage
+        table_keys (dict): star table names as keys, lists of S3 keys as values, e.g. from
+            list_pending_table_keys
+        conn (pg8000.native.Connection): warehouse connection
+        schema (str): warehouse schema
+
+    Returns:
+        dictionary of star table names to rows upserted
+
+    Raises:
+        Exception: the first table that fails to load stops the run
+    """
+    loaded = {}
+    for table, primary_key in ordered_tables_with_primary_keys.items():
+        if table not in table_keys:
+            logger.info(f"No changes for table: {table}")
+            continue
+
+        logger.info(f"Streaming table: {table} ({len(table_keys[table])} files)")
+        merge_by = LOAD_BATCH_COLUMN if table in BATCH_LOCAL_KEY_TABLES else None
+        batches = iter_parquet_batches(
+            storage,
+            table_keys[table],
+            WAREHOUSE_COLUMNS[table],
+            table=table,
+            batch_column=merge_by,
+        )
+        # files are read as they are copied, so the upsert duration includes the reads
+        with stage_metrics("upsert", table) as metrics:
+            loaded[table] = copy_upsert_table(
+                conn, table, primary_key, batches, schema, merge_by=merge_by
+            )
+            metrics["rows_out"] = loaded[table]
+        logger.info(f"Successfully upserted table: {table} (Rows: {loaded[table]})")
+    return loaded
@@ -1,112 +1,178 @@
-import boto3
+import json
 import re
-import awswrangler as wr
 import logging
-from datetime import datetime
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Columns read from each star table, everything else in the file is skipped on decode
+WAREHOUSE_COLUMNS = {
+    "fact_sales_order": [
+        "sales_record_id",
+        "sales_order_id",
+        "created_date",
+        "created_time",
+        "last_updated_date",
+        "last_updated_time",
+        "sales_staff_id",
+        "counterparty_id",
+        "units_sold",
+        "unit_price",
+        "currency_id",
+        "design_id",
+        "agreed_payment_date",
+        "agreed_delivery_date",
+        "agreed_delivery_location_id",
+    ],
+    "dim_staff": [
+        "staff_id",
+        "first_name",
+        "last_name",
+        "department_name",
+        "location",
+        "email_address",
+    ],
+    "dim_location": [
+        "location_id",
+        "address_line_1",
+        "address_line_2",
+        "district",
+        "city",
+        "postal_code",
+        "country",
+        "phone",
+    ],
+    "dim_design": ["design_id", "design_name", "file_location", "file_name"],
+    "dim_date": [
+        "date_id",
+        "year",
+        "month",
+        "day",
+        "day_of_week",
+        "day_name",
+        "month_name",
+        "quarter",
+    ],
+    "dim_currency": ["currency_id", "currency_code", "currency_name"],
+    "dim_counterparty": [
+        "counterparty_id",
+        "counterparty_legal_name",
+        "counterparty_legal_address_line_1",
+        "counterparty_legal_address_line_2",
+        "counterparty_legal_district",
+        "counterparty_legal_city",
+        "counterparty_legal_postal_code",
+        "counterparty_legal_country",
+        "counterparty_legal_phone_number",
+    ],
+}
+
+
+# Object in the processed bucket recording the newest batch folder committed to the warehouse
+LOAD_CHECKPOINT_KEY = "load_checkpoint.json"
+
+# Batch folder written by transform: YYYY-MM-DD HH:MM:SS.ffffff, or YYYY-MM-DD HH:MM for
+# folders written before batches had a unique name per run
+BATCH_FOLDER_PATTERN = re.compile(
+    r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}(?::\d{2}\.\d{6})?)/"
+)
+
+# Batches loaded by one run at most. A bucket without a checkpoint, e.g. on first deploy,
+# or a long outage is caught up over several runs, oldest batches first
+MAX_PENDING_BATCHES = 100
+
+
+def get_partition_values(key):
+    """
+    Returns the Hive partition values encoded in an S3 key
+
+    Parameters:
+        key (str): S3 key, e.g. "2024-11-19 14:30/fact_sales_order/created_date=2024-11-19/a.parquet"
 
-def retrive_list_of_files(bucket):
+    Returns:
+        dictionary of partition column names to string values, e.g. {"created_date": "2024-11-19"}
     """
-    List all file names in an Amazon S3 bucket.
+    return dict(
+        folder.split("=", 1) for folder in key.split("/")[1:-1] if "=" in folder
+    )
 
-    This function retrieves and returns the names of all objects stored in the specified
-    Amazon S3 bucket. If the bucket is empty, an empty list is returned.
+
+def get_load_checkpoint(storage):
+    """
+    Returns the newest batch folder already loaded into the warehouse
 
     Parameters:
-        bucket_name (str): The name of the S3 bucket to retrieve file names from.
+        storage: processed bucket backend from get_storage
 
     Returns:
-        list: A list of file names (str) in the bucket. Returns an empty list if the bucket
-              contains no files.
+        batch folder name, e.g. "2024-11-19 14:30:05.123456", or None if nothing has been
+        loaded yet
+    """
+    try:
+        return json.loads(storage.get(LOAD_CHECKPOINT_KEY))["batch"]
+    except FileNotFoundError:
+        return None
 
-    Example:
-        >>> retrieve_list_of_s3_files('my-bucket')
-        ["2024-11-19 21:05:55/staff.json", "2024-11-19 21:05:55/transaction.json"]
 
-    Raises:
-        botocore.exceptions.NoCredentialsError: If AWS credentials are not available.
-        botocore.exceptions.ClientError: For other client errors, such as permissions issues.
+def save_load_checkpoint(storage, batch):
     """
+    Records a batch folder as loaded, so the next run starts after it
 
-    s3_client = boto3.client("s3")
-    timestamp = datetime.now().strftime("%Y-%m-%d")
-    response = s3_client.list_objects_v2(Bucket=bucket, Prefix=timestamp)
-    if "Contents" in response:
-        return [obj["Key"] for obj in response["Contents"]]
-    return []
+    Parameters:
+        storage: processed bucket backend from get_storage
+        batch (str): batch folder name, e.g. "2024-11-19 14:30:05.123456"
+    """
+    storage.put(LOAD_CHECKPOINT_KEY, json.dumps({"batch": batch}))
+    logger.info(f"Load checkpoint moved to {batch}")
 
 
-def read_parquet_data_to_dataframe(bucket):
+def list_pending_table_keys(storage, checkpoint=None, max_batches=MAX_PENDING_BATCHES):
     """
-    Retrives data from objects in s3 bucket and reads them to DataFrame
+    Finds the Parquet files of the batch folders written after the load checkpoint
+
+    Keys of all pending batches are grouped by star table, oldest batch first, so a
+    catch-up run loads each table once instead of once per batch. Only the oldest
+    max_batches are returned, the rest are left for the next run once the checkpoint moves.
 
-    This function retrieves and returns the dictionary with all last updated objects
-    stored in the specified Amazon S3 bucket in DataFrame format.
+    Without a checkpoint every batch in the bucket is pending, so the first run after a
+    deploy replays the bucket's history max_batches at a time. Upserts make the replay safe.
 
     Parameters:
-        bucket_name (str): The name of the S3 bucket to retrieve file names from.
-        tables (str): List of table names which are to be added to data warehouse
+        storage: processed bucket backend from get_storage
+        checkpoint (str): newest batch folder already loaded, None to list every batch
+        max_batches (int): batches returned at most
 
     Returns:
-        A dictionary, where each key represents table and value represents a parquet file converted to DataFrame.
+        tuple of a dictionary with star table names as keys and lists of S3 keys as values,
+        and the sorted list of pending batch folder names
 
     Example:
-        >>> read_parquet_data_to_dataframe('my-bucket')
-            {'dim_design':    design_id design_name file_location                  file_name
-                0        477      Bronze          /lib  bronze-20230409-joj9.json,
-            'dim_date':       date_id  year  month  day  day_of_week   day_name month_name  quarter
-                0  2024-11-19  2024     11   19            1    Tuesday   November        4}
-
-    Raises:
-        Exception: Any exception raised will be caught, printed, and re-raised.
+        >>> list_pending_table_keys(get_storage('my-bucket'), '2024-11-19 14:30:05.123456')
+        ({'dim_design': ['2024-11-19 14:35:05.004817/dim_design.parquet', '2024-11-19 14:40:04.981202/dim_design.parquet']},
+         ['2024-11-19 14:35:05.004817', '2024-11-19 14:40:04.981202'])
     """
+    # "/" sorts just below "0", so this skips the checkpoint folder and everything before it
+    keys = storage.list(start_after=f"{checkpoint}0" if checkpoint else None)
 
-    tables = [
-        "fact_sales_order",
-        "dim_staff",
-        "dim_location",
-        "dim_design",
-        "dim_date",
-        "dim_currency",
-        "dim_counterparty",
-    ]
-    try:
-        object_list = retrive_list_of_files(bucket)
-        if not object_list:
-            logger.warning(f"No files found in bucket {bucket}")
-            return {}
-
-        result = {}
-        sorted_files_list = sorted(object_list)
-        last_object_list = sorted_files_list[-1]
-
-        # Match timestamp format: YYYY-MM-DD HH:MM (produced by transform)
-        match = re.match(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2})/", last_object_list)
+    batch_keys = {}
+    for key in sorted(keys):
+        match = BATCH_FOLDER_PATTERN.match(key)
         if not match:
-            logger.error(f"Could not parse timestamp from: {last_object_list}")
-            raise ValueError(f"Invalid S3 key format: {last_object_list}")
-
-        last_sync_timestamp = match.group(1)
-        logger.info(f"Loading parquet files from timestamp: {last_sync_timestamp}")
-
-        for table in tables:
-            try:
-                path = f"s3://{bucket}/{last_sync_timestamp}/{table}.parquet"
-                logger.info(f"Reading parquet: {path}")
-                result[table] = wr.s3.read_parquet(path=[path])
-                logger.info(f"Loaded {table}: {len(result[table])} rows")
-            except Exception as parquet_error:
-                # Log warning but continue - not all tables may have new data
-                logger.warning(f"Could not load {table}.parquet: {parquet_error}")
-
-        if not result:
-            logger.error("No parquet files were loaded successfully")
-            raise RuntimeError("Failed to load any parquet files")
-
-        return result
-    except Exception as e:
-        logger.error(f"Error in read_parquet_data_to_dataframe: {e}")
-        raise
+            continue
+        table = key.split("/")[1].removesuffix(".parquet")
+        if table in WAREHOUSE_COLUMNS:
+            batch_keys.setdefault(match.group(1), []).append((table, key))
+
+    batches = sorted(batch_keys)
+    if len(batches) > max_batches:
+        logger.info(f"{len(batches)} batches pending, loading the oldest {max_batches}")
+        batches = batches[:max_batches]
+
+    table_keys = {}
+    for batch in batches:
+        for table, key in batch_keys[batch]:
+            table_keys.setdefault(table, []).append(key)
+
+    if batches:
+        logger.info(f"{len(batches)} batches pending: {batches[0]} to {batches[-1]}")
+    return table_keys, batches
@@ -0,0 +1,145 @@
+import logging
+import os
+from datetime import datetime, timezone
+from pg8000.native import identifier
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function
+    from metrics import emit_metrics
+    from watermarks import read_source_watermarks
+
+else:
+    # For local use
+    from lambda_layer.python.metrics import emit_metrics
+    from lambda_layer.python.watermarks import read_source_watermarks
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Warehouse table with one row per star table per load run
+RUN_LEDGER_TABLE = "pipeline_run_ledger"
+
+RUN_LEDGER_COLUMNS = [
+    "run_batch",
+    "table_name",
+    "batches_loaded",
+    "rows_loaded",
+    "source_last_updated",
+    "extracted_at",
+    "committed_at",
+    "lag_seconds",
+]
+
+
+def ensure_run_ledger(conn, schema="public"):
+    """
+    Creates the run ledger table if it does not exist
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        schema (str): warehouse schema
+    """
+    conn.run(
+        f"CREATE TABLE IF NOT EXISTS {identifier(schema)}.{RUN_LEDGER_TABLE} ("
+        "run_batch VARCHAR NOT NULL, "
+        "table_name VARCHAR NOT NULL, "
+        "batches_loaded INT NOT NULL, "
+        "rows_loaded INT NOT NULL, "
+        "source_last_updated TIMESTAMP, "
+        "extracted_at TIMESTAMP, "
+        "committed_at TIMESTAMP NOT NULL, "
+        "lag_seconds NUMERIC(12, 3), "
+        "PRIMARY KEY (run_batch, table_name))"
+    )
+
+
+def get_load_watermarks(storage, batches):
+    """
+    Combines the star table watermarks of the batches being loaded
+
+    Args:
+        storage: processed bucket backend from get_storage
+        batches (list): batch folders loaded in this run
+
+    Returns:
+        tuple of a dictionary of star table names to their newest source last_updated, and
+        the latest extracted_at, both from the batch manifests. Batches without a manifest
+        are skipped.
+    """
+    watermarks = {}
+    extracted_at = None
+    for batch in batches:
+        manifest = read_source_watermarks(storage, batch)
+        if manifest is None:
+            continue
+        extracted_at = max(filter(None, [extracted_at, manifest["extracted_at"]]))
+        for table, watermark in manifest["tables"].items():
+            if watermark and (table not in watermarks or watermark > watermarks[table]):
+                watermarks[table] = watermark
+    return watermarks, extracted_at
+
+
+def record_load_run(conn, storage, batches, loaded, schema="public", committed_at=None):
+    """
+    Records the freshness of a committed load in the run ledger and as FreshnessLag metrics
+
+    The lag of a star table is the time between the newest source change it carries and
+    the warehouse commit. Source timestamps are UTC without a time zone.
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        storage: processed bucket backend from get_storage
+        batches (list): batch folders loaded in this run, oldest first
+        loaded (dict): star table names to rows upserted, from stream_load_into_warehouse
+        schema (str): warehouse schema
+        committed_at (datetime): commit time, defaults to now in UTC
+
+    Returns:
+        dictionary of star table names to lag in seconds, None when the source time is unknown
+    """
+    committed_at = committed_at or datetime.now(timezone.utc).replace(tzinfo=None)
+    watermarks, extracted_at = get_load_watermarks(storage, batches)
+
+    lags = {}
+    rows = []
+    for table, rows_loaded in loaded.items():
+        watermark = watermarks.get(table)
+        source_last_updated = datetime.fromisoformat(watermark) if watermark else None
+        lag = (
+            round((committed_at - source_last_updated).total_seconds(), 3)
+            if source_last_updated
+            else None
+        )
+        lags[table] = lag
+        rows.append(
+            [
+                batches[-1],
+                table,
+                len(batches),
+                rows_loaded,
+                source_last_updated,
+                datetime.fromisoformat(extracted_at) if extracted_at else None,
+                committed_at,
+                lag,
+            ]
+        )
+        if lag is not None:
+            emit_metrics("freshness", table, lag_seconds=lag, rows_out=rows_loaded)
+
+    if rows:
+        ensure_run_ledger(conn, schema)
+        params = {}
+        values = []
+        for i, row in enumerate(rows):
+            names = [f"{col}_{i}" for col in RUN_LEDGER_COLUMNS]
+            params.update(zip(names, row))
+            values.append("(" + ", ".join(f":{name}" for name in names) + ")")
+        updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in RUN_LEDGER_COLUMNS[2:])
+        conn.run(
+            f"INSERT INTO {identifier(schema)}.{RUN_LEDGER_TABLE} "
+            f"({', '.join(RUN_LEDGER_COLUMNS)}) VALUES {', '.join(values)} "
+            f"ON CONFLICT (run_batch, table_name) DO UPDATE SET {updates}",
+            **params,
+        )
+    logger.info(f"Freshness lag in seconds: {lags}")
+    return lags
@@ -1,21 +1,49 @@
 # new secrets manager
 # connect to db
 # load dataframes as sql into warehouse
+import io
+import os
 import json
-import boto3
 import logging
 from botocore.exceptions import ClientError
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function
+    from src.copy_load import encode_copy_value
+    from runtime_resources import get_secret_string
+
+else:
+    # For local use
+    from lambda_load.src.copy_load import encode_copy_value
+    from lambda_layer.python.runtime_resources import get_secret_string
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Rows pandas hands to copy_from_stdin at a time, each chunk is one COPY statement
+COPY_CHUNKSIZE = 50_000
+
+# The lambda handles one event at a time, so a single pooled connection is enough.
+# Connections are checked before use and recycled before RDS drops them as idle
+ENGINE_OPTIONS = {
+    "pool_size": 1,
+    "max_overflow": 0,
+    "pool_pre_ping": True,
+    "pool_recycle": 300,
+}
+
+# Engine kept between warm invocations of the lambda, see get_engine
+_engine = None
+
 
 def get_secret(name):
     """Gets a secret from AWS Secret Manager with CloudWatch logging.
 
     Finds the given secret name in the Secret Manager and returns the
     value as a dictionary, logging key events and potential errors.
+    The secret string is cached for SECRET_TTL_SECONDS by runtime_resources.
 
     Args:
       name: secret name
@@ -23,13 +51,10 @@ def get_secret(name):
     Returns:
       Dictionary containing the secret or None if not found.
     """
-    secretsmanager_client = boto3.client("secretsmanager", region_name="eu-west-2")
-
     try:
         logger.info(f"Retrieving: {name}")
 
-        response = secretsmanager_client.get_secret_value(SecretId=name)
-        secret_string = response.get("SecretString")
+        secret_string = get_secret_string(name)
 
         if secret_string is None:
             logger.error(f"Secret '{name}' has no string value.")
@@ -57,9 +82,61 @@ def get_secret(name):
         return None
 
 
+def build_connection_url(db_params):
+    """
+    Builds the SQLAlchemy URL for the warehouse from the secret values
+
+    pg8000 is used as the driver, as it is the Postgres driver shipped in the lambda layer.
+
+    Parameters:
+        db_params (dict): secret with username, password, host, port and dbname keys
+
+    Returns:
+        sqlalchemy.engine.URL, special characters in the password are escaped
+    """
+    return URL.create(
+        "postgresql+pg8000",
+        username=db_params["username"],
+        password=db_params["password"],
+        host=db_params["host"],
+        port=int(db_params["port"]),
+        database=db_params["dbname"],
+    )
+
+
+def get_engine(db_params):
+    """
+    Returns the pooled SQLAlchemy engine for the warehouse, creating it on first use
+
+    The engine is stored at module level, so warm invocations of the lambda reuse its
+    pooled connection instead of reconnecting. A new engine is only created when the
+    credentials change, e.g. after a secret rotation.
+
+    Parameters:
+        db_params (dict): secret with username, password, host, port and dbname keys
+
+    Returns:
+        A SQLAlchemy engine object.
+    """
+    global _engine
+
+    url = build_connection_url(db_params)
+    if _engine is not None and _engine.url == url:
+        return _engine
+
+    if _engine is not None:
+        _engine.dispose()
+
+    logger.info(f"Creating engine: {url.render_as_string(hide_password=True)}")
+    _engine = create_engine(url, **ENGINE_OPTIONS)
+    return _engine
+
+
 def alchemy_db_connection(name):
     """
-    Establishes a connection to the PostgreSQL database using SQLAlchemy.
+    Returns the pooled SQLAlchemy engine for the warehouse credentials in a secret.
+
+    No connection is opened here, the pool connects (and pre-pings) on first use.
 
     Parameters:
         name (str): The name of the secret to retrieve the database credentials.
@@ -68,32 +145,19 @@ def alchemy_db_connection(name):
         A SQLAlchemy engine object.
 
     Raises:
-        Exception: If database connection fails.
+        ValueError: If the credentials cannot be retrieved.
+        Exception: If the engine cannot be created.
     """
     try:
         logger.info(f"Attempting to retrieve credentials for secret: {name}")
 
-        db_params_json = get_secret(name)
+        db_params = get_secret(name)
 
-        if not db_params_json:
+        if not db_params:
             logger.error(f"Failed to retrieve credentials for secret: {name}")
             raise ValueError(f"Could not retrieve credentials for {name}")
 
-        db_params = json.loads(db_params_json)
-
-        masked_conn_str = f"postgresql+psycopg2://{db_params['username']}:****@{db_params['host']}:{db_params['port']}/{db_params['dbname']}"
-        logger.info(f"Attempting to create connection: {masked_conn_str}")
-
-        conn_str = f"postgresql+psycopg2://{db_params['username']}:{db_params['password']}@{db_params['host']}:{db_params['port']}/{db_params['dbname']}"
-
-        engine = create_engine(conn_str)
-
-        with engine.connect() as connection:
-            logger.info(
-                f"Successfully established database connection to {db_params['host']}:{db_params['port']}/{db_params['dbname']}"
-            )
-
-        return engine
+        return get_engine(db_params)
 
     except ValueError as ve:
         logger.error(f"Validation error in database connection: {ve}")
@@ -107,40 +171,110 @@ def alchemy_close_connection(engine):
     """
     Properly closes the database engine and releases resources.
 
+    Only needed outside the lambda, closing the pooled engine stops warm invocations reusing it.
+
     Parameters:
         engine (sqlalchemy.engine.base.Engine): The SQLAlchemy engine to close.
     """
+    global _engine
+
     try:
         if engine:
             engine.dispose()
+            if engine is _engine:
+                _engine = None
             logger.info("Database connection engine closed")
     except Exception as e:
         logger.error(f"Error closing engine connection: {e}")
 
 
-def load_data_into_warehouse(dataframes, db_params, schema="public"):
+def copy_from_stdin(pd_table, conn, keys, data_iter):
     """
-    Loads DataFrames into a data warehouse (e.g., PostgreSQL).
+    DataFrame.to_sql insert method that writes each chunk with COPY FROM STDIN
+
+    Rows are encoded in the Postgres COPY text format and sent in one round trip, instead
+    of the one INSERT per row that to_sql runs by default.
+
+    Parameters:
+        pd_table (pandas.io.sql.SQLTable): table being written, gives the name and schema
+        conn (sqlalchemy.engine.Connection): connection of the to_sql transaction
+        keys (list): column names
+        data_iter (iterable): rows of the chunk
+
+    Returns:
+        number of rows copied
+    """
+    buffer = io.StringIO()
+    rows = 0
+    for row in data_iter:
+        buffer.write("\t".join(encode_copy_value(value) for value in row) + "\n")
+        rows += 1
+    buffer.seek(0)
+
+    table = (
+        f'"{pd_table.schema}"."{pd_table.name}"'
+        if pd_table.schema
+        else f'"{pd_table.name}"'
+    )
+    columns = ", ".join(f'"{key}"' for key in keys)
+
+    cursor = conn.connection.driver_connection.cursor()
+    cursor.execute(f"COPY {table} ({columns}) FROM STDIN", stream=buffer)
+    return rows
+
+
+def copy_dataframes_to_sql(
+    dataframes, engine, schema="public", chunksize=COPY_CHUNKSIZE
+):
+    """
+    Appends DataFrames to warehouse tables with copy_from_stdin
 
     Parameters:
         dataframes (dict): A dictionary where each key is a table name and the value is a DataFrame.
-        db_params (dict): A dictionary containing the database connection parameters.
+        engine (sqlalchemy.engine.base.Engine): warehouse engine
         schema (str): The schema name in the data warehouse. Defaults to 'public'.
+        chunksize (int): rows per COPY statement
 
-    Example:
-        >>> load_data_into_warehouse(dataframes, db_params)
+    Side Effects:
+        Failed tables are logged and skipped
     """
-    engine = alchemy_db_connection(db_params)
-
     for table, df in dataframes.items():
         try:
             logger.info(f"Loading table: {table} (Rows: {len(df)})")
 
             df.to_sql(
-                name=table, con=engine, schema=schema, if_exists="append", index=False
+                name=table,
+                con=engine,
+                schema=schema,
+                if_exists="append",
+                index=False,
+                method=copy_from_stdin,
+                chunksize=chunksize,
             )
 
             logger.info(f"Successfully loaded table: {table}")
 
         except Exception as load_error:
             logger.error(f"Failed to load table {table}: {load_error}")
+
+
+def load_data_into_warehouse(
+    dataframes, name, schema="public", chunksize=COPY_CHUNKSIZE
+):
+    """
+    Loads DataFrames into a data warehouse (e.g., PostgreSQL).
+
+    The pooled engine from alchemy_db_connection is reused across calls, and rows are
+    appended with COPY through copy_dataframes_to_sql.
+
+    Parameters:
+        dataframes (dict): A dictionary where each key is a table name and the value is a DataFrame.
+        name (str): The name of the secret holding the database credentials.
+        schema (str): The schema name in the data warehouse. Defaults to 'public'.
+        chunksize (int): rows per COPY statement
+
+    Example:
+        >>> load_data_into_warehouse(dataframes, 'warehouse-credentials')
+    """
+    engine = alchemy_db_connection(name)
+    copy_dataframes_to_sql(dataframes, engine, schema, chunksize)
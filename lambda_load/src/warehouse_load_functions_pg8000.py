@@ -1,19 +1,55 @@
+import os
 import json
-import boto3
 import logging
 from botocore.exceptions import ClientError
-import pandas as pd
+from datetime import date, time
 from pg8000.native import Connection
 
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function, runtime_resources is shipped in the dependency layer
+    from runtime_resources import get_secret_string
+
+else:
+    # For local use
+    from lambda_layer.python.runtime_resources import get_secret_string
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Star tables in load order (dimensions before the fact) with their primary keys
+ordered_tables_with_primary_keys = {
+    "dim_date": "date_id",
+    "dim_staff": "staff_id",
+    "dim_location": "location_id",
+    "dim_design": "design_id",
+    "dim_currency": "currency_id",
+    "dim_counterparty": "counterparty_id",
+    "fact_sales_order": "sales_record_id",
+}
+
+# Warehouse DATE and TIME columns per table. Values are bound as datetime.date / datetime.time
+# so pg8000 sends them as typed parameters and Postgres does no text conversion on upsert
+WAREHOUSE_DATE_COLUMNS = {
+    "dim_date": ["date_id"],
+    "fact_sales_order": [
+        "created_date",
+        "last_updated_date",
+        "agreed_payment_date",
+        "agreed_delivery_date",
+    ],
+}
+
+WAREHOUSE_TIME_COLUMNS = {
+    "fact_sales_order": ["created_time", "last_updated_time"],
+}
+
 
 def get_secret(name):
     """Gets a secret from AWS Secret Manager.
 
     Finds the given secret name in the Secret Manager and returns the
-    value.
+    value. The value is cached for SECRET_TTL_SECONDS, so warm invocations
+    do not call Secrets Manager again.
 
     Args:
       name: secret name
@@ -22,11 +58,8 @@ def get_secret(name):
       String value of the secret or an informative error message.
 
     """
-    client = boto3.client("secretsmanager")
     try:
-        response = client.get_secret_value(SecretId=name)
-        secret_value = response["SecretString"]
-        return secret_value
+        return get_secret_string(name)
     except ClientError as e:
         print(f">>> Secret {name} was not found")
         return None
@@ -82,10 +115,56 @@ def close_conn(conn):
     conn.close()
 
 
+def to_warehouse_types(table, df):
+    """
+    Coerces the DATE and TIME columns of a star schema DataFrame to native Python values.
+
+    Parquet files written with date32/time64 columns are already read back as datetime.date
+    and datetime.time, so this is a no-op for them. Files written before typed encoding hold
+    dates as datetime64 and times as strings, and are converted here, as are Hive partition
+    columns which are read back as strings.
+
+    Parameters:
+        table (str): star schema table name
+        df (DataFrame): table data
+
+    Returns:
+        DataFrame with date and time columns holding datetime.date / datetime.time objects
+    """
+    # imported here so the load handler can use get_secret and create_conn without pandas
+    import pandas as pd
+
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+    for col in WAREHOUSE_DATE_COLUMNS.get(table, []):
+        if col not in df.columns:
+            continue
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.date
+        else:
+            # partition columns are read back as YYYY-MM-DD strings
+            df[col] = [
+                date.fromisoformat(value) if isinstance(value, str) else value
+                for value in df[col]
+            ]
+    for col in WAREHOUSE_TIME_COLUMNS.get(table, []):
+        if col in df.columns:
+            df[col] = [
+                time.fromisoformat(value) if isinstance(value, str) else value
+                for value in df[col]
+            ]
+    return df
+
+
 def load_data_into_warehouse(dataframes, conn, schema="public"):
     """
     Loads DataFrames into a data warehouse (e.g., PostgreSQL) using pg8000.
 
+    Only the star tables present in dataframes are upserted, transform writes nothing for
+    star tables that did not change.
+
     Parameters:
         dataframes (dict): A dictionary where each key is a table name and the value is a DataFrame.
         conn (pg8000.Connection): The database connection object.
@@ -95,17 +174,10 @@ def load_data_into_warehouse(dataframes, conn, schema="public"):
         >>> load_data_into_warehouse(dataframes, conn)
     """
 
-    ordered_tables_with_primary_keys = {
-        "dim_date": "date_id",
-        "dim_staff": "staff_id",
-        "dim_location": "location_id",
-        "dim_design": "design_id",
-        "dim_currency": "currency_id",
-        "dim_counterparty": "counterparty_id",
-        "fact_sales_order": "sales_record_id",
-    }
-
     for table, primary_key in ordered_tables_with_primary_keys.items():
+        if table not in dataframes:
+            logger.info(f"No changes for table: {table}")
+            continue
         df = dataframes[table]
 
         try:
@@ -121,7 +193,7 @@ def load_data_into_warehouse(dataframes, conn, schema="public"):
                 SET {updates};
             """
 
-            for row in df.to_dict(orient="records"):
+            for row in to_warehouse_types(table, df).to_dict(orient="records"):
                 conn.run(query, **row)
 
             logger.info(f"Successfully upserted table: {table}")
@@ -1,10 +1,49 @@
 import pandas as pd
 
+# A string column becomes categorical when its distinct values make up no more than
+# this share of its rows, e.g. country, department_name, currency_code, transaction_type
+CATEGORICAL_MAX_UNIQUE_RATIO = 0.5
+
+
+def convert_low_cardinality_columns(df, max_unique_ratio=CATEGORICAL_MAX_UNIQUE_RATIO):
+    """
+    Converts repetitive string columns of a DataFrame to the pandas category dtype
+
+    Each string column's distinct value count is compared with its row count, and columns
+    at or below max_unique_ratio are stored as categoricals. Categoricals are carried through
+    the star transforms and are written to Parquet as dictionary encoded columns.
+
+    Parameters:
+        df (DataFrame): DataFrame to convert
+        max_unique_ratio (float): highest distinct values / rows ratio to convert
+
+    Returns:
+        DataFrame with low cardinality string columns converted to category
+
+    Example:
+        >>> convert_low_cardinality_columns(pd.DataFrame({'city': ['Leeds', 'Leeds']}))
+        Returns DataFrame where 'city' has dtype category
+    """
+    if len(df) < 2:
+        return df
+
+    for column in df.columns:
+        values = df[column]
+        if values.dtype != object:
+            continue
+        if pd.api.types.infer_dtype(values, skipna=True) != "string":
+            continue
+        if values.nunique() / len(values) <= max_unique_ratio:
+            df[column] = values.astype("category")
+    return df
+
 
 def convert_dictionary_to_dataframe(data_dict):
     """
     Takes a nested dictionary with dictionaries stored as values, and returns a new nested dictionary where values have been converted into DataFrames
 
+    Low cardinality string columns are converted to categoricals with convert_low_cardinality_columns.
+
     Parameters:
         data_dict (dict): dictionary object with table names as keys, and dictionaries as values
 
@@ -21,7 +60,9 @@ def convert_dictionary_to_dataframe(data_dict):
     try:
         new_dict = {}
         for table in data_dict:
-            new_dict[table] = pd.DataFrame(data_dict[table])
+            new_dict[table] = convert_low_cardinality_columns(
+                pd.DataFrame(data_dict[table])
+            )
         print("Dict converted to DataFrame")
         return new_dict
     except Exception as e:
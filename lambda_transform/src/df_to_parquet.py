@@ -1,20 +1,193 @@
+import io
+import os
 import awswrangler as wr
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function, storage is shipped in the dependency layer
+    from storage import S3Storage, get_storage
+    from metrics import emit_metrics
 
-def convert_dataframe_to_parquet(table_name, table_df, bucket):
+else:
+    # For local use
+    from lambda_layer.python.storage import S3Storage, get_storage
+    from lambda_layer.python.metrics import emit_metrics
+
+# Columns cast to date32 on write. Time-of-day columns need no entry here as
+# transform_sales_order already holds them as datetime.time, which maps to time64[us]
+PARQUET_DTYPES = {
+    "fact_sales_order": {
+        "created_date": "date",
+        "last_updated_date": "date",
+        "agreed_payment_date": "date",
+        "agreed_delivery_date": "date",
+    },
+    "dim_date": {"date_id": "date"},
+}
+
+# Batch folder written by each transform run, e.g. "2024-11-19 14:30:05.123456". The
+# microseconds keep two runs in the same minute apart, so the load checkpoint never skips
+# files written after it moved past a folder
+BATCH_FOLDER_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# Number of star tables serialised and uploaded at the same time by write_star_tables
+PARQUET_WRITE_MAX_WORKERS = 4
+
+# Parquet write settings per star table, merged over "default"
+#   compression: snappy (fast) or zstd (smaller)
+#   row_group_size: rows per row group, each row group carries min/max statistics
+#   sort_by: columns rows are sorted by before writing, normally the primary key
+#   partition_cols: Hive style partition columns, e.g. created_date=2024-11-19/
+#   use_dictionary: True, False or a list of columns to dictionary encode
+#   upload_threads: concurrent multipart part uploads per file
+PARQUET_WRITE_CONFIG = {
+    "default": {
+        "upload_threads": 4,
+        "compression": "snappy",
+        "row_group_size": 100_000,
+        "sort_by": None,
+        "partition_cols": None,
+        "use_dictionary": True,
+    },
+    "fact_sales_order": {
+        "compression": "zstd",
+        "sort_by": ["sales_record_id"],
+        "partition_cols": ["created_date"],
+        "use_dictionary": [
+            "sales_staff_id",
+            "counterparty_id",
+            "currency_id",
+            "design_id",
+            "agreed_delivery_location_id",
+        ],
+    },
+    "dim_date": {"sort_by": ["date_id"]},
+    "dim_staff": {"sort_by": ["staff_id"]},
+    "dim_location": {"sort_by": ["location_id"]},
+    "dim_design": {"sort_by": ["design_id"]},
+    "dim_currency": {"sort_by": ["currency_id"]},
+    "dim_counterparty": {"sort_by": ["counterparty_id"]},
+}
+
+
+def get_write_config(table_name):
+    """
+    Returns the Parquet write settings for a star table
+
+    Parameters:
+        table_name (str): star table name
+
+    Returns:
+        dictionary of settings from PARQUET_WRITE_CONFIG, table settings override the defaults
+    """
+    return {
+        **PARQUET_WRITE_CONFIG["default"],
+        **PARQUET_WRITE_CONFIG.get(table_name, {}),
+    }
+
+
+def dataframe_to_arrow(table_name, table_df):
+    """
+    Converts a star table DataFrame to an Arrow table with the types used in Parquet
+
+    Date columns listed in PARQUET_DTYPES become date32, time-of-day columns become
+    time64[us] and categoricals become dictionary columns, as awswrangler writes them.
+
+    Parameters:
+        table_name (str): star table name
+        table_df (DataFrame): star table
+
+    Returns:
+        pyarrow Table
+    """
+    table = pa.Table.from_pandas(table_df, preserve_index=False)
+    for column in PARQUET_DTYPES.get(table_name, {}):
+        if column in table.column_names and pa.types.is_timestamp(
+            table.schema.field(column).type
+        ):
+            table = table.set_column(
+                table.column_names.index(column),
+                column,
+                pc.cast(table[column], pa.date32()),
+            )
+    return table
+
+
+def write_parquet_to_storage(storage, table, prefix, config, partition_cols):
+    """
+    Writes an Arrow table as Parquet through a storage backend, without awswrangler
+
+    Used for local and in-memory buckets. The file layout matches awswrangler's: a single
+    {prefix}.parquet file, or Hive partition folders under {prefix}/ when partition_cols is set.
+
+    Parameters:
+        storage: backend from get_storage
+        table (pyarrow.Table): rows to write
+        prefix (str): key without extension, e.g. "2024-11-19 14:30:05.123456/dim_design"
+        config (dict): settings from get_write_config
+        partition_cols (list): partition columns, may be empty
+
+    Returns:
+        dictionary of written keys to their size in bytes
+    """
+
+    def write(key, part):
+        buffer = io.BytesIO()
+        pq.write_table(
+            part,
+            buffer,
+            compression=config["compression"],
+            row_group_size=config["row_group_size"],
+            use_dictionary=config["use_dictionary"],
+            write_statistics=True,
+        )
+        storage.put(key, buffer.getvalue())
+        return {key: buffer.tell()}
+
+    if not partition_cols:
+        return write(f"{prefix}.parquet", table)
+
+    written = {}
+    groups = table.group_by(partition_cols).aggregate([]).to_pylist()
+    for values in groups:
+        mask = None
+        for col in partition_cols:
+            match = pc.equal(table[col], values[col])
+            mask = match if mask is None else pc.and_(mask, match)
+        folders = "/".join(f"{col}={values[col]}" for col in partition_cols)
+        part = table.filter(mask).drop_columns(partition_cols)
+        written.update(write(f"{prefix}/{folders}/part-0.parquet", part))
+    return written
+
+
+def convert_dataframe_to_parquet(table_name, table_df, bucket, batch=None):
     """
     Save a dataframe to s3 bucket
 
     This function retrieves a desired table_name, dataframe, and s3 bucket name, converts the dataframe to parquet file format and uploads this file to the bucket using awswrangler.
 
+    Date columns listed in PARQUET_DTYPES are written as date32 and time-of-day columns as time64[us],
+    so they can be bound straight to the warehouse DATE/TIME columns on load.
+
+    Codec, row group size, sort order, partitioning and dictionary encoding are taken from
+    PARQUET_WRITE_CONFIG. Partitioned tables are written as a dataset folder instead of a single file.
+
+    S3 buckets are written with awswrangler, local and in-memory locations from get_storage
+    with write_parquet_to_storage.
+
     Parameters:
         table_name (str): The name of the table which you want to
         table_df (DataFrame): The DataFrame object which you want to convert to parquet
-        bucket (str): The name of the S3 bucket you want to upload the file to
+        bucket (str): The name of the S3 bucket you want to upload the file to, or any location accepted by get_storage
+        batch (str): batch folder to write to, defaults to the current time in BATCH_FOLDER_FORMAT
 
     Returns:
-        Nothing
+        dictionary with the written paths, rows, bytes and seconds taken, or the error on failure
 
     Side Effects:
         On success - Parquet file added to S3 bucket
@@ -22,19 +195,162 @@ def convert_dataframe_to_parquet(table_name, table_df, bucket):
 
     Example:
         >>> convert_dataframe_to_parquet('example_table', dataframe, 'example-bucket')
-        Print - Saved to s3://{bucket-name/timestamp/table-name}.parquet
+        {'paths': ['s3://example-bucket/2024-11-19 14:30:05.123456/example_table.parquet'], 'rows': 10, 'bytes': 2347, 'seconds': 0.21}
+
+        >>> convert_dataframe_to_parquet('fact_sales_order', dataframe, 'example-bucket')
+        {'paths': ['s3://example-bucket/2024-11-19 14:30:05.123456/fact_sales_order/created_date=2024-11-19/...zstd.parquet'], ...}
     """
 
+    start = time.perf_counter()
     try:
         # creates current timestamp for s3 file name
-        current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+        current_timestamp = batch or datetime.now().strftime(BATCH_FOLDER_FORMAT)
 
-        # set the desired location for the parquet file
-        path = f"s3://{bucket}/{current_timestamp}/{table_name}.parquet"
+        config = get_write_config(table_name)
+
+        # only cast the columns actually present in this DataFrame
+        dtype = {
+            column: athena_type
+            for column, athena_type in PARQUET_DTYPES.get(table_name, {}).items()
+            if column in table_df.columns
+        }
+
+        sort_by = [col for col in config["sort_by"] or [] if col in table_df.columns]
+        if sort_by:
+            table_df = table_df.sort_values(sort_by, ignore_index=True)
+
+        partition_cols = [
+            col for col in config["partition_cols"] or [] if col in table_df.columns
+        ]
+        if partition_cols and not table_df.empty:
+            # partition folders are named by value, so dates are written as YYYY-MM-DD
+            table_df = table_df.copy()
+            for col in partition_cols:
+                if col in dtype:
+                    table_df[col] = table_df[col].dt.strftime("%Y-%m-%d")
+                    del dtype[col]
+        else:
+            partition_cols = []
+
+        storage = get_storage(bucket)
+        if not isinstance(storage, S3Storage):
+            written = write_parquet_to_storage(
+                storage,
+                dataframe_to_arrow(table_name, table_df),
+                f"{current_timestamp}/{table_name}",
+                config,
+                partition_cols,
+            )
+            return record_parquet_write(
+                table_name,
+                {
+                    "paths": [storage.url(key) for key in written],
+                    "rows": len(table_df),
+                    "bytes": sum(written.values()),
+                    "seconds": round(time.perf_counter() - start, 3),
+                },
+            )
+
+        bucket = storage.bucket
+        if partition_cols:
+            path = f"s3://{bucket}/{current_timestamp}/{table_name}/"
+            dataset_kwargs = {"dataset": True, "partition_cols": partition_cols}
+        else:
+            # set the desired location for the parquet file
+            path = f"s3://{bucket}/{current_timestamp}/{table_name}.parquet"
+            dataset_kwargs = {}
 
         # convert the DataFrame to parquet and save to path in s3 bucket
-        output = wr.s3.to_parquet(table_df, path)
+        output = wr.s3.to_parquet(
+            table_df,
+            path,
+            dtype=dtype or None,
+            compression=config["compression"],
+            use_threads=config["upload_threads"],
+            pyarrow_additional_kwargs={
+                "use_dictionary": config["use_dictionary"],
+                "write_statistics": True,
+                "write_table_args": {"row_group_size": config["row_group_size"]},
+            },
+            **dataset_kwargs,
+        )
 
-        print("Added to bucket: ", output)
+        sizes = wr.s3.size_objects(output["paths"])
+        return record_parquet_write(
+            table_name,
+            {
+                "paths": output["paths"],
+                "rows": len(table_df),
+                "bytes": sum(size or 0 for size in sizes.values()),
+                "seconds": round(time.perf_counter() - start, 3),
+            },
+        )
     except Exception as e:
         print(f"Error processing {table_name}: {e}")
+        return record_parquet_write(
+            table_name,
+            {"error": str(e), "seconds": round(time.perf_counter() - start, 3)},
+        )
+
+
+def record_parquet_write(table_name, result):
+    """
+    Emits the "parquet_write" stage metrics of a convert_dataframe_to_parquet result
+
+    Returns:
+        result, unchanged
+    """
+    emit_metrics(
+        "parquet_write",
+        table_name,
+        duration=result["seconds"] * 1000,
+        rows_in=result.get("rows", 0),
+        bytes_written=result.get("bytes", 0),
+        retries=0,
+        errors=int("error" in result),
+    )
+    return result
+
+
+def write_star_tables(
+    tables, bucket, max_workers=PARQUET_WRITE_MAX_WORKERS, batch=None
+):
+    """
+    Save several dataframes to s3 bucket concurrently
+
+    Every table is serialised and uploaded by convert_dataframe_to_parquet on a bounded thread pool.
+
+    Parameters:
+        tables (dict): star table names as keys, DataFrames as values
+        bucket (str): The name of the S3 bucket you want to upload the files to
+        max_workers (int): The number of tables written at the same time
+        batch (str): batch folder shared by every table, defaults to the current time in BATCH_FOLDER_FORMAT
+
+    Returns:
+        dictionary with per table results from convert_dataframe_to_parquet, total bytes and seconds
+
+    Example:
+        >>> write_star_tables({'dim_design': dataframe}, 'example-bucket')
+        {'tables': {'dim_design': {'paths': [...], 'rows': 10, 'bytes': 3059, 'seconds': 0.2}}, 'batch': '2024-11-19 14:30:05.123456', 'bytes': 3059, 'seconds': 0.21, 'failed': []}
+    """
+    start = time.perf_counter()
+    # one folder for the whole batch, even if the writes straddle a second
+    batch = batch or datetime.now().strftime(BATCH_FOLDER_FORMAT)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            table_name: executor.submit(
+                convert_dataframe_to_parquet, table_name, table_df, bucket, batch
+            )
+            for table_name, table_df in tables.items()
+        }
+        results = {
+            table_name: future.result() for table_name, future in futures.items()
+        }
+
+    return {
+        "tables": results,
+        "batch": batch,
+        "bytes": sum(result.get("bytes", 0) for result in results.values()),
+        "seconds": round(time.perf_counter() - start, 3),
+        "failed": [table for table, result in results.items() if "error" in result],
+    }
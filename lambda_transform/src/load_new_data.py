@@ -1,8 +1,29 @@
 import json
-import boto3
+import os
 import re
 from datetime import datetime
-from pprint import pprint
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function, storage is shipped in the dependency layer
+    from storage import get_storage
+    from metrics import stage_metrics
+    from watermarks import read_source_watermarks
+    from table_parts import (
+        PARTS_MANIFEST_FILE,
+        read_parts_manifest,
+        read_table_keys,
+    )
+
+else:
+    # For local use
+    from lambda_layer.python.storage import get_storage
+    from lambda_layer.python.metrics import stage_metrics
+    from lambda_layer.python.watermarks import read_source_watermarks
+    from lambda_layer.python.table_parts import (
+        PARTS_MANIFEST_FILE,
+        read_parts_manifest,
+        read_table_keys,
+    )
 
 
 def retrive_list_of_files(bucket):
@@ -28,13 +49,8 @@ def retrive_list_of_files(bucket):
         botocore.exceptions.ClientError: For other client errors, such as permissions issues.
     """
 
-    s3_client = boto3.client("s3")
     timestamp = datetime.now().strftime("%Y-%m-%d")
-    response = s3_client.list_objects_v2(Bucket=bucket, Prefix=timestamp)
-
-    if "Contents" in response:
-        return [obj["Key"] for obj in response["Contents"]]
-    return []
+    return get_storage(bucket).list(prefix=timestamp)
 
 
 def load_new_data(bucket, tables):
@@ -45,7 +61,8 @@ def load_new_data(bucket, tables):
     stored in the specified Amazon S3 bucket.
 
     Parameters:
-        bucket_name (str): The name of the S3 bucket to retrieve file names from.
+        bucket_name (str): The name of the S3 bucket to retrieve file names from, or any
+            location accepted by get_storage.
         tables (str): List of table names to query from the db
 
     Returns:
@@ -79,7 +96,7 @@ def load_new_data(bucket, tables):
         Exception: Any exception raised by boto3's put_object function will be caught, printed, and re-raised.
     """
 
-    s3_client = boto3.client("s3")
+    storage = get_storage(bucket)
     tables = [
         "design",
         "sales_order",
@@ -101,13 +118,43 @@ def load_new_data(bucket, tables):
         last_sync_timestamp = re.match(
             r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})/", last_object_list
         ).group(1)
+        # tables extracted in primary key ranges are read part by part, as one table. The
+        # listing already shows whether the batch has a manifest, so others skip the GET
+        manifest = (
+            read_parts_manifest(storage, last_sync_timestamp)
+            if f"{last_sync_timestamp}/{PARTS_MANIFEST_FILE}" in object_list
+            else {}
+        )
         for table in tables:
-            response = s3_client.get_object(
-                Bucket=bucket, Key=f"{last_sync_timestamp}/{table}.json"
-            )
-            data = json.loads(response["Body"].read().decode("utf-8"))
-            result[table] = data
-        # pprint(result)
+            with stage_metrics("fetch", table) as metrics:
+                data = []
+                metrics["bytes_read"] = 0
+                for key in read_table_keys(manifest, last_sync_timestamp, table):
+                    body = storage.get(key)
+                    data.extend(json.loads(body.decode("utf-8")))
+                    metrics["bytes_read"] += len(body)
+                result[table] = data
+                metrics["rows_out"] = len(data)
         return result
     except Exception as e:
         print(f"Error: {e}")
+
+
+def load_source_watermarks(bucket):
+    """
+    Reads the source watermark manifest of the newest batch folder in the ingestion bucket
+
+    Parameters:
+        bucket (str): ingestion bucket name, or any location accepted by get_storage
+
+    Returns:
+        dictionary with "extracted_at" and source table watermarks under "tables", or None
+        if the batch has no manifest
+    """
+    object_list = sorted(retrive_list_of_files(bucket))
+    if not object_list:
+        return None
+    match = re.match(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})/", object_list[-1])
+    if not match:
+        return None
+    return read_source_watermarks(get_storage(bucket), match.group(1))
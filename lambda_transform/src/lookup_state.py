@@ -0,0 +1,100 @@
+"""
+Full copies of the source tables the star transforms look rows up in.
+
+An extract batch only holds the rows that changed, so a batch that changes counterparty but
+not address has no addresses to join. Lookup tables, see get_lookup_tables in
+transform_graph, are kept whole in the processed bucket:
+    lookup_state/address.json
+    [{"address_id": 1, "address_line_1": "6826 Herzog Via", ...}, ...]
+Every transform run merges the batch's rows into the copy by primary key. A missing copy,
+e.g. on first deploy, is built once from every batch in the ingestion bucket.
+
+The load lists the processed bucket by batch folder, so it never reads these files.
+"""
+
+import json
+import os
+import re
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function, storage is shipped in the dependency layer
+    from storage import get_storage
+    from table_parts import (
+        PARTS_MANIFEST_FILE,
+        read_parts_manifest,
+        read_table_keys,
+    )
+
+else:
+    # For local use
+    from lambda_layer.python.storage import get_storage
+    from lambda_layer.python.table_parts import (
+        PARTS_MANIFEST_FILE,
+        read_parts_manifest,
+        read_table_keys,
+    )
+
+LOOKUP_STATE_PREFIX = "lookup_state"
+
+# Batch folder written by extract: YYYY-MM-DD HH:MM:SS
+EXTRACT_BATCH_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})/")
+
+
+def merge_rows(rows_by_key, table, rows):
+    """Overwrites rows by their "{table}_id", later rows win"""
+    for row in rows:
+        rows_by_key[row[f"{table}_id"]] = row
+    return rows_by_key
+
+
+def read_all_batches(storage, table):
+    """
+    Reads every version of a table's rows from all batches of the ingestion bucket
+
+    Parameters:
+        storage: ingestion bucket backend from get_storage
+        table (str): source table name
+
+    Returns:
+        dictionary of primary keys to the newest row
+    """
+    keys = set(storage.list())
+    batches = sorted({m.group(1) for m in map(EXTRACT_BATCH_PATTERN.match, keys) if m})
+    rows_by_key = {}
+    for batch in batches:
+        manifest = (
+            read_parts_manifest(storage, batch)
+            if f"{batch}/{PARTS_MANIFEST_FILE}" in keys
+            else {}
+        )
+        for key in read_table_keys(manifest, batch, table):
+            if key in keys:
+                merge_rows(rows_by_key, table, json.loads(storage.get(key)))
+    return rows_by_key
+
+
+def update_lookup_tables(data_bucket, state_bucket, new_rows):
+    """
+    Merges a batch's rows into the saved copies of lookup tables and returns the copies
+
+    Parameters:
+        data_bucket (str): ingestion bucket, read when a table has no saved copy yet
+        state_bucket (str): processed bucket holding the copies
+        new_rows (dict): lookup table names to the batch's rows, may be empty lists
+
+    Returns:
+        dictionary of lookup table names to all their rows
+    """
+    state = get_storage(state_bucket)
+    tables = {}
+    for table, rows in new_rows.items():
+        key = f"{LOOKUP_STATE_PREFIX}/{table}.json"
+        try:
+            rows_by_key = merge_rows({}, table, json.loads(state.get(key)))
+        except FileNotFoundError:
+            # the batch's own rows are already in the ingestion bucket
+            rows_by_key = read_all_batches(get_storage(data_bucket), table)
+        merge_rows(rows_by_key, table, rows)
+        tables[table] = list(rows_by_key.values())
+        state.put(key, json.dumps(tables[table]), content_type="application/json")
+    return tables
@@ -0,0 +1,224 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+if os.environ.get("AWS_EXECUTION_ENV") is not None:
+    # For use in lambda function
+    from src.transform_star import (
+        transform_counterparty,
+        transform_design,
+        transform_sales_order,
+        transform_staff,
+        transform_date,
+        transform_currency,
+        transform_location,
+    )
+    from metrics import stage_metrics
+
+else:
+    # For local use
+    from lambda_transform.src.transform_star import (
+        transform_counterparty,
+        transform_design,
+        transform_sales_order,
+        transform_staff,
+        transform_date,
+        transform_currency,
+        transform_location,
+    )
+    from lambda_layer.python.metrics import stage_metrics
+
+# Star table -> (transform function, inputs). Inputs are either extracted source tables
+# or other star tables, and are passed to the transform function in the order listed.
+# The first input is the node's primary input, the node is rebuilt when it has new rows.
+# Source tables after it are lookups, read whole from lookup_state rather than the batch
+TRANSFORM_GRAPH = {
+    "dim_design": (transform_design, ["design"]),
+    "dim_currency": (transform_currency, ["currency"]),
+    "dim_counterparty": (transform_counterparty, ["counterparty", "address"]),
+    "dim_location": (transform_location, ["address"]),
+    "dim_staff": (transform_staff, ["staff", "department"]),
+    "fact_sales_order": (transform_sales_order, ["sales_order"]),
+    "dim_date": (transform_date, ["fact_sales_order"]),
+}
+
+
+def get_execution_order(graph):
+    """
+    Orders the nodes of a transform graph so every node comes after the star tables it depends on
+
+    Args:
+        graph (dict): star table names as keys, (function, inputs) tuples as values
+
+    Returns:
+        list of star table names
+
+    Raises:
+        ValueError: if the graph contains a cycle
+    """
+    order = []
+    remaining = dict(graph)
+    while remaining:
+        ready = [
+            node
+            for node, (_, inputs) in remaining.items()
+            if not any(i in remaining for i in inputs)
+        ]
+        if not ready:
+            raise ValueError(f"Transform graph has a cycle: {sorted(remaining)}")
+        for node in ready:
+            order.append(node)
+            del remaining[node]
+    return order
+
+
+def get_lookup_tables(extracted_data, graph=TRANSFORM_GRAPH):
+    """
+    Returns the lookup tables a batch needs whole
+
+    A lookup table is needed when a node using it has new rows in its primary input. Lookup
+    tables with new rows of their own are returned too, so their saved copies stay current.
+
+    Args:
+        extracted_data (dict): source table names as keys, rows or DataFrames as values
+        graph (dict): star table names as keys, (function, inputs) tuples as values
+
+    Returns:
+        sorted list of source table names
+    """
+    lookups = set()
+    for _, (primary, *others) in graph.values():
+        for table in others:
+            if table in graph:
+                continue
+            if len(extracted_data.get(primary, [])) or len(
+                extracted_data.get(table, [])
+            ):
+                lookups.add(table)
+    return sorted(lookups)
+
+
+def get_star_watermarks(source_watermarks, star_tables, graph=TRANSFORM_GRAPH):
+    """
+    Maps source table watermarks onto the star tables built from them
+
+    A star table is as fresh as the newest source change it was built from, so it gets the
+    newest watermark of its inputs. Star table inputs, e.g. fact_sales_order for dim_date,
+    are followed back to their source tables.
+
+    Args:
+        source_watermarks (dict): source table names to newest last_updated ISO strings
+        star_tables (iterable): star tables that were written
+        graph (dict): star table names as keys, (function, inputs) tuples as values
+
+    Returns:
+        dictionary of star table names to newest last_updated, None when unknown
+    """
+
+    def sources(node):
+        found = []
+        for i in graph[node][1]:
+            found.extend(sources(i) if i in graph else [i])
+        return found
+
+    star_watermarks = {}
+    for table in star_tables:
+        values = [source_watermarks.get(s) for s in sources(table)]
+        values = [value for value in values if value]
+        star_watermarks[table] = max(values) if values else None
+    return star_watermarks
+
+
+def run_measured_transform(node, transform, frames):
+    """
+    Runs one transform of the graph and emits its "transform" stage metrics
+
+    Args:
+        node (str): star table built by the transform
+        transform (callable): transform function
+        frames (list): input DataFrames, in the order the function takes them
+
+    Returns:
+        the transformed DataFrame
+    """
+    with stage_metrics("transform", node) as metrics:
+        metrics["rows_in"] = sum(len(frame) for frame in frames)
+        output = transform(*frames)
+        metrics["rows_out"] = 0 if output is None else len(output)
+    return output
+
+
+def run_transform_graph(
+    extracted_data_df, graph=TRANSFORM_GRAPH, max_workers=None, lookup_data_df=None
+):
+    """
+    Runs the star schema transforms declared in a transform graph
+
+    Nodes are run on a thread pool as soon as the star tables they depend on are built, so
+    independent dimensions are transformed concurrently. DataFrames are shared between
+    threads without being copied or pickled.
+
+    A node is skipped when its primary input, the first, is missing or empty, and nodes
+    that produce an empty DataFrame are dropped, so the result only holds star tables with
+    new data. Lookup inputs are taken from lookup_data_df when it has them, so a batch that
+    changes counterparty but not address still builds dim_counterparty.
+
+    Args:
+        extracted_data_df (dict): source table names as keys, DataFrames as values
+        graph (dict): star table names as keys, (function, inputs) tuples as values
+        max_workers (int): thread pool size, defaults to the number of CPUs
+        lookup_data_df (dict): lookup table names as keys, DataFrames of all their rows as
+            values, see get_lookup_tables
+
+    Returns:
+        dictionary with changed star table names as keys, transformed DataFrames as values
+
+    Raises:
+        ValueError: if the graph contains a cycle
+
+    Side Effects:
+        Outputs a message for every skipped star table
+    """
+    # validate the graph up front so scheduling below always makes progress
+    get_execution_order(graph)
+
+    transformed_data_df = {}
+    pending = dict(graph)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        while pending or running:
+            ready = [
+                node
+                for node, (_, inputs) in pending.items()
+                if not any(i in pending or i in running.values() for i in inputs)
+            ]
+            for node in ready:
+                transform, inputs = pending.pop(node)
+                frames = [
+                    transformed_data_df.get(i, extracted_data_df.get(i)) for i in inputs
+                ]
+                frames[1:] = [
+                    (lookup_data_df or {}).get(i, frame)
+                    for i, frame in zip(inputs[1:], frames[1:])
+                ]
+                if frames[0] is None or frames[0].empty:
+                    print(f"{node} - skipped, no new data in {inputs[0]}")
+                    continue
+                if any(frame is None for frame in frames):
+                    print(f"{node} - skipped, no data in {inputs}")
+                    continue
+                running[
+                    executor.submit(run_measured_transform, node, transform, frames)
+                ] = node
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                output = future.result()
+                if output is None or output.empty:
+                    print(f"{node} - skipped, transform produced no rows")
+                    continue
+                transformed_data_df[node] = output
+    return transformed_data_df
@@ -1,5 +1,6 @@
 import pandas as pd
-from currency_codes import get_currency_by_code
+from functools import lru_cache
+from currency_codes import get_all_currencies
 
 
 def transform_sales_order(sales_order_df):
@@ -7,6 +8,7 @@ def transform_sales_order(sales_order_df):
     Transform loaded sales order data into star schema
         - renames columns
         - splits out timestamp into date and time
+        - times are kept as datetime.time objects so they are written as time64[us]
     Args:
         df (sales order dataframe): original data
     Returns:
@@ -48,9 +50,7 @@ def transform_sales_order(sales_order_df):
         fact_sales_order["created_date"] = fact_sales_order[
             "created_at"
         ].dt.date.astype("datetime64[ns]")
-        fact_sales_order["created_time"] = fact_sales_order[
-            "created_at"
-        ].dt.time.astype(str)
+        fact_sales_order["created_time"] = fact_sales_order["created_at"].dt.time
 
         # Create 2 Columns for last_updated
         fact_sales_order["last_updated"] = pd.to_datetime(
@@ -59,9 +59,7 @@ def transform_sales_order(sales_order_df):
         fact_sales_order["last_updated_date"] = fact_sales_order[
             "last_updated"
         ].dt.date.astype("datetime64[ns]")
-        fact_sales_order["last_updated_time"] = fact_sales_order[
-            "last_updated"
-        ].dt.time.astype(str)
+        fact_sales_order["last_updated_time"] = fact_sales_order["last_updated"].dt.time
 
         # Convert
         fact_sales_order["agreed_payment_date"] = pd.to_datetime(
@@ -292,10 +290,26 @@ def transform_date(fact_sales_order_df):
         print(e)
 
 
+@lru_cache(maxsize=None)
+def get_currency_names():
+    """
+    Builds a currency code to currency name lookup from the currency_codes library.
+
+    The lookup is built once per process and cached at module level, so warm Lambda
+    invocations reuse it. Where a code appears more than once the first entry wins,
+    matching get_currency_by_code.
+
+    RETURNS: dictionary of upper case currency codes to currency names"""
+    names = {}
+    for currency in get_all_currencies():
+        names.setdefault(currency.code, currency.name)
+    return names
+
+
 def transform_currency(currency_df):
     """
-    This function uses get_currency_by_code library in order to get a currency name by its international
-    code, in order to test it we compared 2 pandas dataframes.
+    This function looks up a currency name by its international code using the cached
+    get_currency_names mapping, in order to test it we compared 2 pandas dataframes.
     This function removes unneeded columns.
 
     ARGS: currency dataframe:original data
@@ -307,10 +321,9 @@ def transform_currency(currency_df):
 
     try:
         dim_currency = currency_df.copy()
-        currency_codes = list(dim_currency["currency_code"])
-        dim_currency["currency_name"] = [
-            get_currency_by_code(code).name for code in currency_codes
-        ]
+        dim_currency["currency_name"] = (
+            dim_currency["currency_code"].str.upper().map(get_currency_names())
+        )
         return dim_currency[["currency_id", "currency_code", "currency_name"]]
     except Exception as e:
         print(e)
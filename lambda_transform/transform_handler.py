@@ -1,43 +1,32 @@
 import logging
 import os
 
+# Only the light S3 reader is imported at module load. pandas, awswrangler and the star
+# transforms are imported inside lambda_handler once there is new data to transform
 if os.environ.get("AWS_EXECUTION_ENV") is not None:
     # For use in lambda function
     from src.load_new_data import load_new_data
-    from src.convert_to_dataframe import convert_dictionary_to_dataframe
-    from src.df_to_parquet import convert_dataframe_to_parquet
-    from src.transform_star import (
-        transform_counterparty,
-        transform_design,
-        transform_sales_order,
-        transform_staff,
-        transform_date,
-        transform_currency,
-        transform_location,
-    )
+    from profiling import profiled
+    from request_accounting import accounted
 
 else:
     # For local use
     from lambda_transform.src.load_new_data import load_new_data
-    from lambda_transform.src.convert_to_dataframe import (
-        convert_dictionary_to_dataframe,
-    )
-    from lambda_transform.src.df_to_parquet import convert_dataframe_to_parquet
-    from lambda_transform.src.transform_star import (
-        transform_counterparty,
-        transform_design,
-        transform_sales_order,
-        transform_staff,
-        transform_date,
-        transform_currency,
-        transform_location,
-    )
+    from lambda_layer.python.profiling import profiled
+    from lambda_layer.python.request_accounting import accounted
 
 
+@accounted
+@profiled
 def lambda_handler(event, context):
     """
     AWS Lambda Handler to retrieve JSON files from an S3 bucket, convert them into DataFrames, Transform them into a star schema using Pandas, and save to a different S3 Bucket in Parquet format
 
+    Only star tables whose primary input has new data are written, see TRANSFORM_GRAPH in src/transform_graph.py.
+    Lookup tables such as address are read whole from the processed bucket, see src/lookup_state.py
+
+    Runs with no new data return before pandas or awswrangler are imported.
+
     Event Format:
         {
             "data_bucket": "bucket-name"
@@ -74,43 +63,84 @@ def lambda_handler(event, context):
         # load new JSON files from data bucket + return nested dictionary
         extracted_data_dict = load_new_data(data_bucket, tables)
 
-        # convert dictionaries inside extracted_data_dict into dataframes
-        if extracted_data_dict:
-            extracted_data_df = convert_dictionary_to_dataframe(extracted_data_dict)
-        else:
+        if not extracted_data_dict or not any(extracted_data_dict.values()):
             print("nothing in dictionary")
             return
 
-        # create a blank dict to store the transformed dataframes
-        transformed_data_df = {}
+        if os.environ.get("AWS_EXECUTION_ENV") is not None:
+            from src.convert_to_dataframe import convert_dictionary_to_dataframe
+            from src.df_to_parquet import write_star_tables
+            from src.transform_graph import (
+                get_lookup_tables,
+                get_star_watermarks,
+                run_transform_graph,
+            )
+            from src.load_new_data import load_source_watermarks
+            from src.lookup_state import update_lookup_tables
+            from storage import get_storage
+            from watermarks import write_source_watermarks
+        else:
+            from lambda_transform.src.convert_to_dataframe import (
+                convert_dictionary_to_dataframe,
+            )
+            from lambda_transform.src.df_to_parquet import write_star_tables
+            from lambda_transform.src.transform_graph import (
+                get_lookup_tables,
+                get_star_watermarks,
+                run_transform_graph,
+            )
+            from lambda_transform.src.load_new_data import load_source_watermarks
+            from lambda_transform.src.lookup_state import update_lookup_tables
+            from lambda_layer.python.storage import get_storage
+            from lambda_layer.python.watermarks import write_source_watermarks
 
-        # invoke each transform function, passing the relevant dataframe from extracted_data_df as an arg and saving this as a value on a key in transformed_dfs
+        # convert dictionaries inside extracted_data_dict into dataframes
+        extracted_data_df = convert_dictionary_to_dataframe(extracted_data_dict)
 
-        transformed_data_df["dim_design"] = transform_design(
-            extracted_data_df["design"]
-        )
-        transformed_data_df["dim_currency"] = transform_currency(
-            extracted_data_df["currency"]
-        )
-        transformed_data_df["dim_counterparty"] = transform_counterparty(
-            extracted_data_df["counterparty"], extracted_data_df["address"]
-        )
-        transformed_data_df["dim_location"] = transform_location(
-            extracted_data_df["address"]
-        )
-        transformed_data_df["dim_staff"] = transform_staff(
-            extracted_data_df["staff"], extracted_data_df["department"]
-        )
-        transformed_data_df["fact_sales_order"] = transform_sales_order(
-            extracted_data_df["sales_order"]
+        # tables like address are joined whole, not just the rows in this batch
+        lookup_data = update_lookup_tables(
+            data_bucket,
+            processed_bucket,
+            {
+                table: extracted_data_dict.get(table) or []
+                for table in get_lookup_tables(extracted_data_dict)
+            },
         )
-        transformed_data_df["dim_date"] = transform_date(
-            transformed_data_df["fact_sales_order"]
+
+        # run the transforms declared in the transform graph, only star tables whose primary input has new data are rebuilt
+        transformed_data_df = run_transform_graph(
+            extracted_data_df,
+            lookup_data_df=(
+                convert_dictionary_to_dataframe(lookup_data) if lookup_data else None
+            ),
         )
 
-        # loop through the dataframes in transformed_dfs, passing the table name, dataframe & target bucket into convert_dataframes_to_parquet to be convert to parquet and save to processed bucket
-        for table_name, dataframe in transformed_data_df.items():
-            convert_dataframe_to_parquet(table_name, dataframe, processed_bucket)
+        if not transformed_data_df:
+            logger.info("No star tables changed")
+            return
+
+        # convert each changed star table to parquet and save to processed bucket, tables are written concurrently
+        write_result = write_star_tables(transformed_data_df, processed_bucket)
+
+        for table_name, result in write_result["tables"].items():
+            logger.info("Wrote %s: %s", table_name, result)
+        if write_result["failed"]:
+            logger.error("Failed to write tables: %s", write_result["failed"])
+
+        # carry the source watermarks of the extract batch over to the star tables written
+        source = load_source_watermarks(data_bucket)
+        if source:
+            written = [
+                t for t in transformed_data_df if t not in write_result["failed"]
+            ]
+            write_source_watermarks(
+                get_storage(processed_bucket),
+                write_result["batch"],
+                get_star_watermarks(source["tables"], written),
+                source["extracted_at"],
+            )
+
+        return write_result
 
     except Exception as e:
         logger.info(e)
@@ -0,0 +1,203 @@
+"""
+Long-running micro-batch runner for low-latency ingestion.
+
+Instead of the 20 minute EventBridge schedule, one process polls the source database
+every few seconds and pushes whatever changed straight through the extract, transform and
+load functions into the warehouse:
+    get_changes_after_cursors -> run_transform_graph -> copy_upsert_table
+
+The source and warehouse connections are opened once and checked before every poll, so
+a dropped connection is replaced instead of failing the runner. Polling follows a
+(last_updated, id) cursor per table, the last row loaded from it, as the extract lambda
+does. Rows sharing a last_updated with the last loaded row are read on the next poll, and
+one busy table does not move the others on. A row committed after a poll with a
+last_updated older than its table's cursor is still missed.
+
+The poll interval adapts: it halves towards --min-interval while batches keep arriving,
+drops straight to the minimum for a busy batch, and doubles towards --max-interval while
+the source is idle.
+
+Usage:
+    python -m local_pipeline.micro_batch --since "2024-11-19 00:00:00"
+    python -m local_pipeline.micro_batch --min-interval 1 --max-interval 30 --busy-rows 5000
+"""
+
+import argparse
+import json
+import logging
+import signal
+import threading
+import time
+from dotenv import load_dotenv
+from lambda_extract.src.db_query import get_changes_after_cursors
+from lambda_extract.src.extract_cursors import initial_cursors
+from lambda_layer.python.runtime_resources import get_db_connection
+from local_pipeline.runner import (
+    SOURCE_TABLES,
+    connect_from_env,
+    load_tables,
+    transform_tables,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between polls, the interval moves between these bounds
+MIN_POLL_INTERVAL = 2
+MAX_POLL_INTERVAL = 60
+
+# A batch with at least this many source rows polls again at the minimum interval
+BUSY_BATCH_ROWS = 1000
+
+
+def next_interval(
+    interval,
+    rows,
+    min_interval=MIN_POLL_INTERVAL,
+    max_interval=MAX_POLL_INTERVAL,
+    busy_rows=BUSY_BATCH_ROWS,
+):
+    """
+    Returns the seconds to wait before the next poll
+
+    Args:
+        interval (float): current interval
+        rows (int): source rows in the batch just processed
+        min_interval (float): shortest interval
+        max_interval (float): longest interval
+        busy_rows (int): batch size that counts as busy
+
+    Returns:
+        the new interval, doubled when idle, halved when rows arrived, the minimum when busy
+    """
+    if rows == 0:
+        return min(interval * 2, max_interval)
+    if rows >= busy_rows:
+        return min_interval
+    return max(interval / 2, min_interval)
+
+
+def run_micro_batch(source_conn, warehouse_conn, cursors, schema="public"):
+    """
+    Extracts, transforms and loads the rows changed after each table's cursor
+
+    Args:
+        source_conn (pg8000.native.Connection): source database, left open
+        warehouse_conn (pg8000.native.Connection): warehouse connection
+        cursors (dict): source table names to {"last_updated": ..., "id": ...}, see
+            get_changes_after_cursors
+        schema (str): warehouse schema
+
+    Returns:
+        tuple of the new cursors and a dictionary with the rows extracted, rows loaded
+        per star table and seconds taken
+    """
+    from lambda_transform.src.df_to_parquet import dataframe_to_arrow
+
+    start = time.perf_counter()
+    extracted_rows, next_cursors, _ = get_changes_after_cursors(
+        source_conn, SOURCE_TABLES, cursors, close_connection=False
+    )
+    rows = sum(len(table_rows) for table_rows in extracted_rows.values())
+    stats = {"rows": rows, "loaded": {}}
+    if rows:
+        star_frames = transform_tables(extracted_rows)
+        star_tables = {
+            table: dataframe_to_arrow(table, frame)
+            for table, frame in star_frames.items()
+        }
+        stats["loaded"] = load_tables(warehouse_conn, star_tables, schema)
+        # the cursors only move once the batch is committed, so a failed load is retried
+        cursors = next_cursors
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return cursors, stats
+
+
+def run_micro_batches(
+    connect_source,
+    connect_warehouse,
+    since="2000-01-01 00:00:00",
+    schema="public",
+    min_interval=MIN_POLL_INTERVAL,
+    max_interval=MAX_POLL_INTERVAL,
+    busy_rows=BUSY_BATCH_ROWS,
+    stop=None,
+    max_batches=None,
+):
+    """
+    Polls the source and loads micro-batches until stopped
+
+    Args:
+        connect_source (callable): takes no arguments and returns a source connection
+        connect_warehouse (callable): takes no arguments and returns a warehouse connection
+        since (str): rows updated after this are loaded first
+        schema (str): warehouse schema
+        min_interval (float): shortest poll interval in seconds
+        max_interval (float): longest poll interval in seconds
+        busy_rows (int): batch size that counts as busy, see next_interval
+        stop (threading.Event): set to stop after the current batch
+        max_batches (int): stop after this many polls, None runs until stopped
+
+    Returns:
+        dictionary with the final cursors, polls, batches with rows and rows loaded
+    """
+    stop = stop or threading.Event()
+    cursors = initial_cursors(SOURCE_TABLES, since)
+    interval = min_interval
+    totals = {"polls": 0, "batches": 0, "rows": 0}
+
+    while not stop.is_set() and (max_batches is None or totals["polls"] < max_batches):
+        source_conn = get_db_connection("micro_batch_source", connect_source)
+        warehouse_conn = get_db_connection("micro_batch_warehouse", connect_warehouse)
+        try:
+            cursors, stats = run_micro_batch(
+                source_conn, warehouse_conn, cursors, schema
+            )
+        except Exception as e:
+            # keep the cursors, the same rows are retried after the back-off
+            logger.error(f"Micro-batch failed: {e}")
+            stats = {"rows": 0, "loaded": {}}
+
+        totals["polls"] += 1
+        if stats["rows"]:
+            totals["batches"] += 1
+            totals["rows"] += stats["rows"]
+            logger.info(f"Loaded {stats}")
+
+        interval = next_interval(
+            interval, stats["rows"], min_interval, max_interval, busy_rows
+        )
+        stop.wait(interval)
+
+    totals["cursors"] = cursors
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--since", default="2000-01-01 00:00:00")
+    parser.add_argument("--schema", default="public")
+    parser.add_argument("--min-interval", type=float, default=MIN_POLL_INTERVAL)
+    parser.add_argument("--max-interval", type=float, default=MAX_POLL_INTERVAL)
+    parser.add_argument("--busy-rows", type=int, default=BUSY_BATCH_ROWS)
+    parser.add_argument("--env-file", default=".env.test")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv(args.env_file)
+
+    # stop cleanly between batches on Ctrl+C or when a container is stopped
+    stop_event = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop_event.set())
+
+    totals = run_micro_batches(
+        lambda: connect_from_env("DB"),
+        lambda: connect_from_env("WAREHOUSE_DB", fallback_prefix="DB"),
+        since=args.since,
+        schema=args.schema,
+        min_interval=args.min_interval,
+        max_interval=args.max_interval,
+        busy_rows=args.busy_rows,
+        stop=stop_event,
+    )
+    print(json.dumps(totals, indent=2, default=str))
@@ -0,0 +1,190 @@
+"""
+Single process runner for the extract, transform and load stages.
+
+The stages run back to back in one interpreter. Extracted rows are handed to transform as
+Python objects and star tables to load as Arrow tables, so nothing is serialised between
+stages. Pass --lake to also write the JSON and Parquet files the lambdas would write, to
+a local folder (file://) or an in-process store (memory://).
+
+Connection details are read from an env file:
+    DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT                  source database
+    WAREHOUSE_DB_NAME, WAREHOUSE_DB_USER, ...                        warehouse, defaults to DB_*
+
+Usage:
+    python -m local_pipeline.runner --since "2000-01-01 00:00:00"
+    python -m local_pipeline.runner --lake file:///tmp/lake
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from pg8000.native import Connection
+from lambda_extract.src.db_query import get_latest_data
+from lambda_extract.src.s3_save_utilities import s3_save_as_json
+from lambda_transform.src.convert_to_dataframe import convert_dictionary_to_dataframe
+from lambda_transform.src.df_to_parquet import dataframe_to_arrow, write_star_tables
+from lambda_transform.src.transform_graph import run_transform_graph
+from lambda_load.src.copy_load import COPY_BATCH_SIZE, copy_upsert_table
+from lambda_load.src.load_parquet_data import WAREHOUSE_COLUMNS
+from lambda_load.src.warehouse_load_functions_pg8000 import (
+    ordered_tables_with_primary_keys,
+)
+
+SOURCE_TABLES = [
+    "design",
+    "sales_order",
+    "staff",
+    "currency",
+    "counterparty",
+    "address",
+    "department",
+    "purchase_order",
+    "payment_type",
+    "payment",
+    "transaction",
+]
+
+
+def connect_from_env(prefix, fallback_prefix=None):
+    """
+    Opens a pg8000 connection from {prefix}_NAME, _USER, _PASSWORD, _HOST and _PORT variables
+
+    Args:
+        prefix (str): variable prefix, e.g. "DB"
+        fallback_prefix (str): prefix used for variables that are not set
+
+    Returns:
+        pg8000.native.Connection
+    """
+
+    def setting(name):
+        value = os.getenv(f"{prefix}_{name}")
+        if value is None and fallback_prefix:
+            value = os.getenv(f"{fallback_prefix}_{name}")
+        return value
+
+    return Connection(
+        database=setting("NAME"),
+        user=setting("USER"),
+        password=setting("PASSWORD"),
+        host=setting("HOST"),
+        port=int(setting("PORT")),
+    )
+
+
+def transform_tables(extracted_rows):
+    """
+    Runs the star transforms on extracted rows
+
+    Args:
+        extracted_rows (dict): source table names as keys, lists of row dictionaries as values
+
+    Returns:
+        dictionary of changed star table names to DataFrames
+    """
+    if not any(extracted_rows.values()):
+        return {}
+    return run_transform_graph(convert_dictionary_to_dataframe(extracted_rows))
+
+
+def load_tables(conn, star_tables, schema="public"):
+    """
+    Upserts star tables held as Arrow tables into the warehouse, dimensions first
+
+    Args:
+        conn (pg8000.native.Connection): warehouse connection
+        star_tables (dict): star table names as keys, pyarrow Tables as values
+        schema (str): warehouse schema
+
+    Returns:
+        dictionary of star table names to rows upserted
+    """
+    loaded = {}
+    for table, primary_key in ordered_tables_with_primary_keys.items():
+        if table not in star_tables:
+            continue
+        arrow_table = star_tables[table]
+        columns = [
+            col for col in WAREHOUSE_COLUMNS[table] if col in arrow_table.column_names
+        ]
+        batches = arrow_table.select(columns).to_batches(max_chunksize=COPY_BATCH_SIZE)
+        loaded[table] = copy_upsert_table(conn, table, primary_key, batches, schema)
+    return loaded
+
+
+def run_pipeline(
+    source_conn,
+    warehouse_conn,
+    since="2000-01-01 00:00:00",
+    lake=None,
+    schema="public",
+):
+    """
+    Runs extract, transform and load back to back in this process
+
+    Args:
+        source_conn (pg8000.native.Connection): source database, closed by extract
+        warehouse_conn (pg8000.native.Connection): warehouse connection
+        since (str): rows with last_updated after this timestamp are extracted
+        lake (str): optional file:// or memory:// location, JSON is written to
+            {lake}/ingestion and Parquet to {lake}/processed as the lambdas would
+        schema (str): warehouse schema
+
+    Returns:
+        dictionary with rows and seconds per stage
+    """
+    stats = {}
+
+    start = time.perf_counter()
+    extracted_rows = get_latest_data(source_conn, SOURCE_TABLES, since)
+    if lake:
+        folder = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for table, rows in extracted_rows.items():
+            s3_save_as_json(rows, f"{lake}/ingestion", f"{folder}/{table}.json")
+    stats["extract"] = {
+        "rows": sum(len(rows) for rows in extracted_rows.values()),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+    start = time.perf_counter()
+    star_frames = transform_tables(extracted_rows)
+    star_tables = {
+        table: dataframe_to_arrow(table, frame) for table, frame in star_frames.items()
+    }
+    if lake and star_frames:
+        write_star_tables(star_frames, f"{lake}/processed")
+    stats["transform"] = {
+        "rows": sum(table.num_rows for table in star_tables.values()),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+    start = time.perf_counter()
+    loaded = load_tables(warehouse_conn, star_tables, schema)
+    stats["load"] = {
+        "rows": sum(loaded.values()),
+        "tables": loaded,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--since", default="2000-01-01 00:00:00")
+    parser.add_argument("--lake", default=None)
+    parser.add_argument("--schema", default="public")
+    parser.add_argument("--env-file", default=".env.test")
+    args = parser.parse_args()
+
+    load_dotenv(args.env_file)
+    warehouse_conn = connect_from_env("WAREHOUSE_DB", fallback_prefix="DB")
+    try:
+        stats = run_pipeline(
+            connect_from_env("DB"), warehouse_conn, args.since, args.lake, args.schema
+        )
+    finally:
+        warehouse_conn.close()
+    print(json.dumps(stats, indent=2))
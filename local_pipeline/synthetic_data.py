@@ -0,0 +1,490 @@
+"""
+Synthetic totesys data for load testing the pipeline against a local Postgres.
+
+Seeds the 11 source tables of db_sql/create_tables.sql at a chosen scale factor with COPY,
+and can then keep producing change traffic (updated and new rows with a fresh last_updated)
+while a benchmark runs. The same seed always produces the same rows.
+
+At scale 1 there are 10,000 sales orders, so --scale 1000 gives 10M. currency, department
+and payment_type are reference tables and do not scale.
+
+Usage:
+    make all
+    python -m local_pipeline.synthetic_data --scale 10 --seed 42
+    python -m local_pipeline.synthetic_data --no-seed --changes-per-second 200 --duration 600
+"""
+
+import argparse
+import time
+import numpy as np
+from datetime import datetime
+from dotenv import load_dotenv
+from lambda_load.src.copy_load import encode_copy_value
+from local_pipeline.runner import connect_from_env
+
+# Rows per table at scale factor 1
+BASE_ROWS = {
+    "currency": 3,
+    "department": 8,
+    "payment_type": 4,
+    "design": 1_000,
+    "address": 300,
+    "staff": 200,
+    "counterparty": 200,
+    "sales_order": 10_000,
+    "purchase_order": 2_000,
+}
+
+FIXED_TABLES = ["currency", "department", "payment_type"]
+
+# Seeding order, referenced tables first. Every order has one transaction and one payment
+SEED_ORDER = [
+    "currency",
+    "department",
+    "payment_type",
+    "design",
+    "address",
+    "staff",
+    "counterparty",
+    "sales_order",
+    "purchase_order",
+    "transaction",
+    "payment",
+]
+
+# Rows generated and streamed to COPY at a time
+CHUNK_ROWS = 100_000
+
+# created_at of seeded rows is spread over this window, in id order
+HISTORY_START = np.datetime64("2022-11-03T14:20:00")
+HISTORY_END = np.datetime64("2024-11-19T14:00:00")
+
+CURRENCY_CODES = ["GBP", "USD", "EUR"]
+DEPARTMENTS = [
+    ("Sales", "Manchester"),
+    ("Purchasing", "Manchester"),
+    ("Production", "Leeds"),
+    ("Dispatch", "Leds"),
+    ("Finance", "Manchester"),
+    ("Facilities", "Manchester"),
+    ("Communications", "Leeds"),
+    ("HR", "Leeds"),
+]
+PAYMENT_TYPES = ["SALES_RECEIPT", "SALES_REFUND", "PURCHASE_PAYMENT", "PURCHASE_REFUND"]
+DESIGN_NAMES = ["Wooden", "Bronze", "Granite", "Steel", "Concrete", "Rubber", "Cotton"]
+FIRST_NAMES = ["Jeremie", "Deron", "Jeanette", "Ana", "Magdalena", "Korey", "Raphael"]
+LAST_NAMES = ["Franey", "Beier", "Erdman", "Glover", "Zieme", "Kreiger", "Rippin"]
+CITIES = ["New Patienceburgh", "Aliso Viejo", "Lake Charles", "Suffolk", "Olsonside"]
+COUNTRIES = ["Austria", "Turkey", "Greenland", "Cayman Islands", "San Marino"]
+DISTRICTS = ["Avon", "Buckinghamshire", "Cambridgeshire", "Bedfordshire", None]
+
+
+def scaled_row_counts(scale):
+    """
+    Returns the number of rows per source table at a scale factor
+
+    Args:
+        scale (float): 1 gives BASE_ROWS
+
+    Returns:
+        dictionary of table names to row counts, in SEED_ORDER
+    """
+    counts = {
+        table: rows if table in FIXED_TABLES else max(1, int(rows * scale))
+        for table, rows in BASE_ROWS.items()
+    }
+    counts["transaction"] = counts["sales_order"] + counts["purchase_order"]
+    counts["payment"] = counts["transaction"]
+    return {table: counts[table] for table in SEED_ORDER}
+
+
+def _timestamps(rng, ids, total, start, end):
+    # rows are created in id order, with jitter inside each row's slot
+    span = (end - start).astype("timedelta64[ms]").astype(np.int64)
+    offsets = (ids - 1) * span // max(total, 1) + rng.integers(
+        0, max(span // max(total, 1), 1), len(ids)
+    )
+    created = start + offsets.astype("timedelta64[ms]")
+    updated = np.minimum(
+        created + rng.integers(0, 30 * 86_400_000, len(ids)).astype("timedelta64[ms]"),
+        end,
+    )
+    return created.astype(str).tolist(), updated.astype(str).tolist()
+
+
+def _dates(rng, created_at, days):
+    # agreed dates fall within a number of days after the order was created
+    offsets = rng.integers(0, days, len(created_at)).astype("timedelta64[D]")
+    return (np.array(created_at, dtype="datetime64[D]") + offsets).astype(str).tolist()
+
+
+def _ints(rng, low, high, count):
+    return rng.integers(low, high + 1, count).tolist()
+
+
+def _choice(rng, values, count):
+    return [values[i] for i in rng.integers(0, len(values), count)]
+
+
+def generate_columns(table, rng, ids, counts, start=HISTORY_START, end=HISTORY_END):
+    """
+    Generates the columns of a source table for a range of ids
+
+    Args:
+        table (str): source table name
+        rng (numpy.random.Generator): random generator for this chunk
+        ids (numpy.ndarray): primary keys to generate, 1 based
+        counts (dict): row counts per table, used for foreign keys
+        start (numpy.datetime64): earliest created_at
+        end (numpy.datetime64): latest created_at and last_updated
+
+    Returns:
+        dictionary of column names to lists of values, in table column order
+    """
+    n = len(ids)
+    total = int(ids[-1]) if table in FIXED_TABLES else counts[table]
+    created_at, last_updated = _timestamps(rng, ids, total, start, end)
+    id_list = ids.tolist()
+    stamps = {"created_at": created_at, "last_updated": last_updated}
+
+    if table == "currency":
+        return {
+            "currency_id": id_list,
+            "currency_code": [CURRENCY_CODES[i - 1] for i in id_list],
+            **stamps,
+        }
+    if table == "department":
+        return {
+            "department_id": id_list,
+            "department_name": [DEPARTMENTS[i - 1][0] for i in id_list],
+            "location": [DEPARTMENTS[i - 1][1] for i in id_list],
+            "manager": _choice(rng, FIRST_NAMES, n),
+            **stamps,
+        }
+    if table == "payment_type":
+        return {
+            "payment_type_id": id_list,
+            "payment_type_name": [PAYMENT_TYPES[i - 1] for i in id_list],
+            **stamps,
+        }
+    if table == "design":
+        names = _choice(rng, DESIGN_NAMES, n)
+        return {
+            "design_id": id_list,
+            **stamps,
+            "design_name": names,
+            "file_location": _choice(rng, ["/usr", "/private", "/lib", "/System"], n),
+            "file_name": [
+                f"{name.lower()}-{i}.json" for name, i in zip(names, id_list)
+            ],
+        }
+    if table == "address":
+        return {
+            "address_id": id_list,
+            "address_line_1": [f"{i} Zieme Mountains" for i in id_list],
+            "address_line_2": _choice(rng, ["Alexie Cliffs", None], n),
+            "district": _choice(rng, DISTRICTS, n),
+            "city": _choice(rng, CITIES, n),
+            "postal_code": [f"{code:05d}" for code in _ints(rng, 0, 99_999, n)],
+            "country": _choice(rng, COUNTRIES, n),
+            "phone": [f"1803 {p:06d}" for p in _ints(rng, 0, 999_999, n)],
+            **stamps,
+        }
+    if table == "staff":
+        first = _choice(rng, FIRST_NAMES, n)
+        last = _choice(rng, LAST_NAMES, n)
+        return {
+            "staff_id": id_list,
+            "first_name": first,
+            "last_name": last,
+            "department_id": _ints(rng, 1, counts["department"], n),
+            "email_address": [
+                f"{f.lower()}.{l.lower()}{i}@terrifictotes.com"
+                for f, l, i in zip(first, last, id_list)
+            ],
+            **stamps,
+        }
+    if table == "counterparty":
+        return {
+            "counterparty_id": id_list,
+            "counterparty_legal_name": [
+                f"{l} LLC {i}" for l, i in zip(_choice(rng, LAST_NAMES, n), id_list)
+            ],
+            "legal_address_id": _ints(rng, 1, counts["address"], n),
+            "commercial_contact": _choice(rng, FIRST_NAMES, n),
+            "delivery_contact": _choice(rng, FIRST_NAMES, n),
+            **stamps,
+        }
+    if table in ("sales_order", "purchase_order"):
+        order_columns = {
+            f"{table}_id": id_list,
+            **stamps,
+        }
+        if table == "sales_order":
+            order_columns.update(
+                {
+                    "design_id": _ints(rng, 1, counts["design"], n),
+                    "staff_id": _ints(rng, 1, counts["staff"], n),
+                    "counterparty_id": _ints(rng, 1, counts["counterparty"], n),
+                    "units_sold": _ints(rng, 1000, 100_000, n),
+                    "unit_price": (rng.integers(200, 401, n) / 100).tolist(),
+                }
+            )
+        else:
+            order_columns.update(
+                {
+                    "staff_id": _ints(rng, 1, counts["staff"], n),
+                    "counterparty_id": _ints(rng, 1, counts["counterparty"], n),
+                    "item_code": [f"ITEM{c:04d}" for c in _ints(rng, 0, 9_999, n)],
+                    "item_quantity": _ints(rng, 1, 1000, n),
+                    "item_unit_price": (rng.integers(300, 100_001, n) / 100).tolist(),
+                }
+            )
+        order_columns.update(
+            {
+                "currency_id": _ints(rng, 1, counts["currency"], n),
+                "agreed_delivery_date": _dates(rng, created_at, 30),
+                "agreed_payment_date": _dates(rng, created_at, 30),
+                "agreed_delivery_location_id": _ints(rng, 1, counts["address"], n),
+            }
+        )
+        return order_columns
+    if table == "transaction":
+        sales = counts["sales_order"]
+        return {
+            "transaction_id": id_list,
+            "transaction_type": ["SALE" if i <= sales else "PURCHASE" for i in id_list],
+            "sales_order_id": [i if i <= sales else None for i in id_list],
+            "purchase_order_id": [None if i <= sales else i - sales for i in id_list],
+            **stamps,
+        }
+    if table == "payment":
+        return {
+            "payment_id": id_list,
+            **stamps,
+            "transaction_id": id_list,
+            "counterparty_id": _ints(rng, 1, counts["counterparty"], n),
+            "payment_amount": (rng.integers(100, 100_000_000, n) / 100).tolist(),
+            "currency_id": _ints(rng, 1, counts["currency"], n),
+            "payment_type_id": _ints(rng, 1, counts["payment_type"], n),
+            "paid": (rng.random(n) < 0.8).tolist(),
+            "payment_date": _dates(rng, created_at, 30),
+            "company_ac_number": _ints(rng, 10_000_000, 99_999_999, n),
+            "counterparty_ac_number": _ints(rng, 10_000_000, 99_999_999, n),
+        }
+    raise ValueError(f"Unknown source table: {table}")
+
+
+def iter_copy_chunks(table, seed, first_id, count, counts, **window):
+    """
+    Yields COPY text for rows first_id to first_id + count - 1 of a source table
+
+    Each chunk has its own generator seeded from (seed, table, chunk), so output depends
+    only on the seed and the ids.
+
+    Args:
+        table (str): source table name
+        seed (int): random seed
+        first_id (int): first primary key
+        count (int): number of rows
+        counts (dict): row counts per table, used for foreign keys
+        window: optional start and end passed to generate_columns
+
+    Yields:
+        tuple of column names and the COPY text of one chunk
+    """
+    table_index = SEED_ORDER.index(table)
+    for chunk_start in range(first_id, first_id + count, CHUNK_ROWS):
+        chunk_end = min(chunk_start + CHUNK_ROWS, first_id + count)
+        rng = np.random.default_rng([seed, table_index, chunk_start])
+        columns = generate_columns(
+            table, rng, np.arange(chunk_start, chunk_end), counts, **window
+        )
+        text = "".join(
+            "\t".join(encode_copy_value(value) for value in row) + "\n"
+            for row in zip(*columns.values())
+        )
+        yield list(columns), text
+
+
+def copy_rows(conn, table, seed, first_id, count, counts, **window):
+    """
+    Generates rows of a source table and streams them into Postgres with one COPY
+
+    Returns:
+        number of rows copied
+    """
+    chunks = iter_copy_chunks(table, seed, first_id, count, counts, **window)
+    first = next(chunks, None)
+    if first is None:
+        return 0
+    columns, text = first
+
+    def stream():
+        yield text
+        for _, chunk_text in chunks:
+            yield chunk_text
+
+    cols = ", ".join(f'"{col}"' for col in columns)
+    conn.run(f'COPY "{table}" ({cols}) FROM STDIN', stream=stream())
+    return count
+
+
+def seed_database(conn, scale=1, seed=0):
+    """
+    Replaces the contents of the 11 source tables with synthetic rows
+
+    Args:
+        conn (pg8000.native.Connection): connection to a database created from db_sql/create_tables.sql
+        scale (float): scale factor, 1 gives 10,000 sales orders
+        seed (int): random seed
+
+    Returns:
+        dictionary of table names to rows seeded
+    """
+    counts = scaled_row_counts(scale)
+    tables = ", ".join(f'"{table}"' for table in SEED_ORDER)
+    conn.run(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+
+    for table, rows in counts.items():
+        start = time.perf_counter()
+        copy_rows(conn, table, seed, 1, rows, counts)
+        # ids were copied explicitly, move the SERIAL sequence past them
+        conn.run(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', '{table}_id'), {rows})"
+        )
+        print(f"{table}: {rows} rows in {time.perf_counter() - start:.1f}s")
+    return counts
+
+
+# Share of change traffic per kind of change
+CHANGE_MIX = {
+    "update_sales_order": 0.5,
+    "update_dimension": 0.1,
+    "new_sales_order": 0.4,
+}
+
+DIMENSION_UPDATES = {
+    "design": "design_name = design_name || ' v2'",
+    "staff": "email_address = 'updated.' || email_address",
+    "address": "phone = '1803 000000'",
+    "counterparty": "delivery_contact = 'Updated Contact'",
+}
+
+
+def generate_changes(conn, seed=0, changes_per_second=100, duration=60, counts=None):
+    """
+    Produces change traffic on the source tables, as the live totesys database would
+
+    Every second existing sales orders and dimension rows are updated, and new sales orders
+    are inserted with their transactions, all with last_updated set to now.
+
+    Args:
+        conn (pg8000.native.Connection): source database connection
+        seed (int): random seed, picks which rows change
+        changes_per_second (int): rows changed or inserted per second
+        duration (float): seconds to run for
+        counts (dict): current row counts, read from the database if None
+
+    Returns:
+        dictionary with the number of updated and inserted rows
+    """
+    rng = np.random.default_rng([seed, len(SEED_ORDER)])
+    if counts is None:
+        counts = {
+            table: conn.run(f'SELECT COALESCE(MAX("{table}_id"), 0) FROM "{table}"')[0][
+                0
+            ]
+            for table in SEED_ORDER
+        }
+    stats = {"updated": 0, "inserted": 0}
+
+    deadline = time.monotonic() + duration
+    tick = 0
+    while time.monotonic() < deadline:
+        tick_start = time.monotonic()
+        now = np.datetime64(datetime.now(), "ms")
+
+        updates = int(changes_per_second * CHANGE_MIX["update_sales_order"])
+        ids = rng.integers(1, counts["sales_order"] + 1, updates).tolist()
+        conn.run(
+            "UPDATE sales_order SET units_sold = units_sold % 99000 + 1000, "
+            "last_updated = now() WHERE sales_order_id = ANY(:ids)",
+            ids=ids,
+        )
+        stats["updated"] += updates
+
+        for table, assignment in DIMENSION_UPDATES.items():
+            ids = rng.integers(
+                1,
+                counts[table] + 1,
+                max(1, int(changes_per_second * CHANGE_MIX["update_dimension"] / 4)),
+            ).tolist()
+            conn.run(
+                f'UPDATE "{table}" SET {assignment}, last_updated = now() '
+                f'WHERE "{table}_id" = ANY(:ids)',
+                ids=ids,
+            )
+            stats["updated"] += len(ids)
+
+        new_orders = int(changes_per_second * CHANGE_MIX["new_sales_order"])
+        if new_orders:
+            window = {"start": now, "end": now}
+            first_order = counts["sales_order"] + 1
+            first_transaction = counts["transaction"] + 1
+            copy_rows(
+                conn,
+                "sales_order",
+                seed + tick,
+                first_order,
+                new_orders,
+                counts,
+                **window,
+            )
+            conn.run(
+                "INSERT INTO transaction (transaction_id, transaction_type, sales_order_id, "
+                "created_at, last_updated) "
+                "SELECT :first_transaction + i, 'SALE', :first_order + i, now(), now() "
+                "FROM generate_series(0, :n - 1) AS i",
+                first_transaction=first_transaction,
+                first_order=first_order,
+                n=new_orders,
+            )
+            counts["sales_order"] += new_orders
+            counts["transaction"] += new_orders
+            stats["inserted"] += new_orders * 2
+
+        tick += 1
+        time.sleep(max(0.0, 1 - (time.monotonic() - tick_start)))
+
+    for table in ("sales_order", "transaction"):
+        conn.run(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', '{table}_id'), {counts[table]})"
+        )
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-seed", action="store_true", help="keep existing rows")
+    parser.add_argument("--changes-per-second", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--env-file", default=".env.test")
+    args = parser.parse_args()
+
+    load_dotenv(args.env_file)
+    conn = connect_from_env("DB")
+    try:
+        counts = None
+        if not args.no_seed:
+            counts = seed_database(conn, args.scale, args.seed)
+        if args.changes_per_second:
+            print(
+                generate_changes(
+                    conn, args.seed, args.changes_per_second, args.duration, counts
+                )
+            )
+    finally:
+        conn.close()
@@ -189,4 +189,108 @@ resource "aws_cloudwatch_metric_alarm" "load_throttles" {
     FunctionName = aws_lambda_function.load_handler.function_name
   }
   alarm_actions = [aws_sns_topic.notifications.arn]
-}
\ No newline at end of file
+}
+
+# Per-stage metrics printed by the lambdas in Embedded Metric Format (lambda_layer/python/metrics.py)
+resource "aws_cloudwatch_metric_alarm" "extract_query_duration" {
+  alarm_name          = "extract_query_duration_alarm"
+  comparison_operator = "GreaterThanOrEqualToThreshold"
+  evaluation_periods  = "3"
+  metric_name         = "Duration"
+  namespace           = "TotesysPipeline"
+  period              = "300"
+  extended_statistic  = "p90"
+  threshold           = "30000"
+  dimensions = {
+    Function = aws_lambda_function.extract_handler.function_name
+    Stage    = "extract_query"
+    Table    = "sales_order"
+  }
+  alarm_description = "The sales_order extract query has taken over 30s at p90 for 15 minutes"
+  alarm_actions     = [aws_sns_topic.notifications.arn]
+}
+
+resource "aws_cloudwatch_metric_alarm" "parquet_write_errors" {
+  alarm_name          = "parquet_write_errors_alarm"
+  comparison_operator = "GreaterThanOrEqualToThreshold"
+  evaluation_periods  = "1"
+  metric_name         = "Errors"
+  namespace           = "TotesysPipeline"
+  period              = "300"
+  statistic           = "Sum"
+  threshold           = "1"
+  dimensions = {
+    Function = aws_lambda_function.transform_handler.function_name
+    Stage    = "parquet_write"
+    Table    = "fact_sales_order"
+  }
+  alarm_description = "fact_sales_order failed to write to the processed bucket"
+  alarm_actions     = [aws_sns_topic.notifications.arn]
+}
+
+resource "aws_cloudwatch_metric_alarm" "upsert_throughput" {
+  alarm_name          = "fact_sales_order_upsert_throughput_alarm"
+  comparison_operator = "GreaterThanOrEqualToThreshold"
+  evaluation_periods  = "3"
+  threshold           = "2"
+  alarm_description   = "fact_sales_order is upserted at under 500 rows/s (over 2ms per row) for 15 minutes"
+  alarm_actions       = [aws_sns_topic.notifications.arn]
+
+  metric_query {
+    id          = "ms_per_row"
+    expression  = "duration / IF(rows > 0, rows, 1)"
+    label       = "Milliseconds per upserted row"
+    return_data = true
+  }
+
+  metric_query {
+    id = "duration"
+    metric {
+      metric_name = "Duration"
+      namespace   = "TotesysPipeline"
+      period      = "300"
+      stat        = "Sum"
+      dimensions = {
+        Function = aws_lambda_function.load_handler.function_name
+        Stage    = "upsert"
+        Table    = "fact_sales_order"
+      }
+    }
+  }
+
+  metric_query {
+    id = "rows"
+    metric {
+      metric_name = "RowsOut"
+      namespace   = "TotesysPipeline"
+      period      = "300"
+      stat        = "Sum"
+      dimensions = {
+        Function = aws_lambda_function.load_handler.function_name
+        Stage    = "upsert"
+        Table    = "fact_sales_order"
+      }
+    }
+  }
+}
+
+# FreshnessLag is only emitted for tables a load run changed, so an hour without new sales
+# orders has no datapoints and must not page
+resource "aws_cloudwatch_metric_alarm" "fact_sales_order_freshness" {
+  alarm_name          = "fact_sales_order_freshness_alarm"
+  comparison_operator = "GreaterThanOrEqualToThreshold"
+  evaluation_periods  = "2"
+  metric_name         = "FreshnessLag"
+  namespace           = "TotesysPipeline"
+  period              = "1800"
+  statistic           = "Maximum"
+  threshold           = "3600"
+  treat_missing_data  = "notBreaching"
+  dimensions = {
+    Function = aws_lambda_function.load_handler.function_name
+    Stage    = "freshness"
+    Table    = "fact_sales_order"
+  }
+  alarm_description = "fact_sales_order in the warehouse is over an hour behind the source"
+  alarm_actions     = [aws_sns_topic.notifications.arn]
+}
@@ -0,0 +1,13 @@
+import pytest
+from lambda_layer.python.runtime_resources import clear_runtime_resources
+from lambda_layer.python.storage import clear_memory_storage
+
+
+@pytest.fixture(autouse=True)
+def fresh_runtime_resources():
+    # clients, secrets and connections are cached per container, start every test cold
+    clear_runtime_resources()
+    clear_memory_storage()
+    yield
+    clear_runtime_resources()
+    clear_memory_storage()
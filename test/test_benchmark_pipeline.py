@@ -0,0 +1,118 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+from benchmark.pipeline import compare_to_baseline, measure_stage, run_stages
+
+design_columns = [
+    "design_id",
+    "last_updated",
+    "design_name",
+    "file_location",
+    "file_name",
+]
+design_rows = [
+    (472, datetime(2024, 11, 19, 12, 20), "Concrete", "/usr/share", "c.json"),
+    (473, datetime(2024, 11, 19, 12, 21), "Rubber", "/Users", "r.json"),
+]
+
+
+def make_source_conn():
+    conn = MagicMock()
+
+    def run(sql, **kwargs):
+        is_design = sql.split()[3].strip('"') == "design"
+        conn.columns = [{"name": name} for name in design_columns] if is_design else []
+        return design_rows if is_design else []
+
+    conn.run.side_effect = run
+    return conn
+
+
+def make_warehouse_conn(copied):
+    conn = MagicMock()
+
+    def run(sql, stream=None, **kwargs):
+        if stream is not None:
+            copied.append("".join(stream))
+
+    conn.run.side_effect = run
+    return conn
+
+
+def stage(rows_per_second, peak_rss_mb, seconds=1.0):
+    return {
+        "rows_per_second": rows_per_second,
+        "peak_rss_mb": peak_rss_mb,
+        "seconds": seconds,
+    }
+
+
+class TestMeasureStage:
+    def test_records_throughput_and_memory(self):
+        results = {}
+        with measure_stage(results, "transform") as measured:
+            measured["rows"] = 10
+            measured["bytes"] = 100
+
+        assert results["transform"]["rows"] == 10
+        assert results["transform"]["bytes"] == 100
+        assert results["transform"]["rows_per_second"] > 0
+        assert results["transform"]["peak_rss_mb"] > 0
+
+    def test_records_stage_that_raises(self):
+        results = {}
+        try:
+            with measure_stage(results, "fetch"):
+                raise ValueError
+        except ValueError:
+            pass
+        assert results["fetch"]["rows"] == 0
+
+
+class TestCompareToBaseline:
+    def test_no_regressions_within_threshold(self):
+        baseline = {"scale_1": {"fetch": stage(1000, 100)}}
+        results = {"scale_1": {"fetch": stage(850, 115)}}
+        assert compare_to_baseline(results, baseline, 0.2) == []
+
+    def test_reports_slower_and_larger_stages(self):
+        baseline = {"scale_1": {"fetch": stage(1000, 100)}}
+        results = {"scale_1": {"fetch": stage(700, 150)}}
+
+        regressions = compare_to_baseline(results, baseline, 0.2)
+
+        assert len(regressions) == 2
+        assert regressions[0].startswith("scale_1 fetch: 700 rows/s")
+
+    def test_ignores_fast_stages_and_new_scales(self):
+        baseline = {"scale_1": {"fetch": stage(1000, 100, seconds=0.01)}}
+        results = {
+            "scale_1": {"fetch": stage(100, 100, seconds=0.1)},
+            "scale_10": {"fetch": stage(1, 1000)},
+        }
+        assert compare_to_baseline(results, baseline) == []
+
+
+def test_run_stages_measures_every_stage():
+    copied = []
+
+    results = run_stages(
+        make_source_conn(),
+        make_warehouse_conn(copied),
+        "memory://ingestion",
+        "memory://processed",
+    )
+
+    assert list(results) == [
+        "extract_query",
+        "serialize_upload",
+        "fetch",
+        "transform",
+        "parquet_write",
+        "warehouse_load",
+        "pipeline",
+    ]
+    assert results["extract_query"]["rows"] == 2
+    assert results["warehouse_load"]["rows"] == 2
+    assert results["serialize_upload"]["bytes"] > 0
+    assert results["parquet_write"]["bytes"] > 0
+    assert len(copied) == 1
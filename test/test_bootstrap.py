@@ -0,0 +1,347 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+import boto3
+import pytest
+from moto import mock_aws
+from lambda_extract.handler import lambda_handler
+from lambda_extract.src.bootstrap import (
+    bootstrap_extract,
+    plan_shards,
+    read_bootstrap_pending,
+)
+from lambda_extract.src.extract_cursors import write_extract_cursors
+from lambda_layer.python.storage import get_storage
+from lambda_transform.src.load_new_data import load_new_data
+
+SOURCE_TABLES = [
+    "design",
+    "sales_order",
+    "staff",
+    "currency",
+    "counterparty",
+    "address",
+    "department",
+    "purchase_order",
+    "payment_type",
+    "payment",
+    "transaction",
+]
+
+
+def make_source_conn(tables, estimates=None):
+    """
+    Source connection mock over in-memory tables of {table}_id and last_updated rows,
+    answering the min/max, pg_class and range queries of a bootstrap
+    """
+    conn = MagicMock()
+
+    def run(sql, **kwargs):
+        table = sql.split(" FROM ")[-1].split()[0].strip('"')
+        if sql.startswith("SELECT min("):
+            ids = [row[0] for row in tables.get(table, [])]
+            return [[min(ids, default=None), max(ids, default=None)]]
+        if "FROM pg_class" in sql:
+            return [[(estimates or {}).get(kwargs["table"], -1)]]
+        if "ORDER BY last_updated DESC" in sql:
+            newest = max(
+                tables.get(table, []), key=lambda row: (row[1], row[0]), default=None
+            )
+            return [[newest[1], newest[0]]] if newest else []
+        conn.columns = [{"name": f"{table}_id"}, {"name": "last_updated"}]
+        return [
+            row
+            for row in tables.get(table, [])
+            if kwargs["first"] <= row[0] < kwargs["end"]
+        ]
+
+    conn.run.side_effect = run
+    return conn
+
+
+def sales_orders(count):
+    start = datetime(2024, 11, 19)
+    return [(i, start + timedelta(minutes=i)) for i in range(1, count + 1)]
+
+
+class TestPlanShards:
+    def test_ranges_cover_the_key_span(self):
+        conn = make_source_conn(
+            {"sales_order": sales_orders(250)}, estimates={"sales_order": 250}
+        )
+
+        assert plan_shards(conn, "sales_order", shard_rows=100) == [
+            (1, 85),
+            (85, 169),
+            (169, 251),
+        ]
+
+    def test_small_or_empty_tables(self):
+        conn = make_source_conn(
+            {"sales_order": sales_orders(50), "staff": []},
+            estimates={"sales_order": 50},
+        )
+
+        assert plan_shards(conn, "sales_order", shard_rows=100) == [(1, 51)]
+        assert plan_shards(conn, "staff", shard_rows=100) == []
+
+    def test_unanalyzed_table_uses_key_span(self):
+        conn = make_source_conn({"sales_order": sales_orders(300)})
+
+        assert len(plan_shards(conn, "sales_order", shard_rows=100)) == 3
+
+
+def test_bootstrap_parts_are_read_as_one_table():
+    tables = {"sales_order": sales_orders(250), "design": [(7, datetime(2024, 1, 1))]}
+    planner = make_source_conn(tables, estimates={"sales_order": 250})
+    workers = []
+
+    def connect():
+        workers.append(make_source_conn(tables))
+        return workers[-1]
+
+    batch = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    watermarks, cursors, complete = bootstrap_extract(
+        planner,
+        connect,
+        SOURCE_TABLES,
+        "memory://ingestion",
+        batch,
+        shard_rows=100,
+        max_workers=2,
+    )
+
+    storage = get_storage("memory://ingestion")
+    assert json.loads(storage.get(f"{batch}/_parts.json")) == {
+        "sales_order": [
+            "sales_order/part-00000.json",
+            "sales_order/part-00001.json",
+            "sales_order/part-00002.json",
+        ]
+    }
+    assert watermarks["sales_order"] == "2024-11-19T04:10:00"
+    assert watermarks["design"] == "2024-01-01T00:00:00"
+    assert watermarks["staff"] is None
+    assert cursors["sales_order"] == {
+        "last_updated": datetime(2024, 11, 19, 4, 10),
+        "id": 250,
+    }
+    assert cursors["staff"] == {"last_updated": "2000-01-01 00:00:00", "id": None}
+    assert complete is True
+    assert 1 <= len(workers) <= 2
+    for worker in workers:
+        worker.close.assert_called_once()
+    planner.close.assert_not_called()
+
+    data = load_new_data("memory://ingestion", SOURCE_TABLES)
+    assert [row["sales_order_id"] for row in data["sales_order"]] == list(range(1, 251))
+    assert data["design"] == [{"design_id": 7, "last_updated": "2024-01-01T00:00:00"}]
+    assert data["staff"] == []
+
+
+def test_failed_range_fails_the_bootstrap():
+    tables = {"sales_order": sales_orders(250)}
+    planner = make_source_conn(tables, estimates={"sales_order": 250})
+    broken = MagicMock()
+    broken.run.side_effect = RuntimeError("connection reset")
+
+    with pytest.raises(RuntimeError):
+        bootstrap_extract(
+            planner,
+            lambda: broken,
+            ["sales_order"],
+            "memory://ingestion",
+            "2024-11-19 14:30:00",
+            shard_rows=100,
+        )
+
+    broken.close.assert_called()
+    # the failed batch is never transformed, so every range is extracted again
+    pending = read_bootstrap_pending(
+        get_storage("memory://ingestion"), "2024-11-19 14:30:00"
+    )
+    assert pending["shards"] == [
+        ["sales_order", 0, 1, 85],
+        ["sales_order", 1, 85, 169],
+        ["sales_order", 2, 169, 251],
+    ]
+    assert pending["cursors"]["sales_order"]["id"] == 250
+
+
+def test_cursors_are_planned_before_the_ranges_are_read():
+    tables = {"sales_order": sales_orders(250)}
+    planner = make_source_conn(tables, estimates={"sales_order": 250})
+
+    def connect():
+        # an order changes after the plan, before its range is read
+        tables["sales_order"][0] = (1, datetime(2024, 11, 20))
+        return make_source_conn(tables)
+
+    _, cursors, _ = bootstrap_extract(
+        planner,
+        connect,
+        ["sales_order"],
+        "memory://ingestion",
+        "2024-11-19 14:30:00",
+        shard_rows=100,
+        max_workers=1,
+    )
+
+    # the next poll reads the changed order again
+    assert cursors["sales_order"] == {
+        "last_updated": datetime(2024, 11, 19, 4, 10),
+        "id": 250,
+    }
+
+
+def test_stopped_bootstrap_resumes_the_ranges_left():
+    tables = {"sales_order": sales_orders(250), "design": [(7, datetime(2024, 1, 1))]}
+    planner = make_source_conn(tables, estimates={"sales_order": 250})
+    storage = get_storage("memory://ingestion")
+    # the transform reads today's newest batch
+    today = datetime.now().strftime("%Y-%m-%d")
+    first_batch, second_batch = f"{today} 00:00:01", f"{today} 00:00:02"
+    # time for two ranges before the deadline
+    clock = iter([0, 0, 5, 5, 5])
+
+    with patch("lambda_extract.src.bootstrap.time.monotonic", lambda: next(clock)):
+        _, _, complete = bootstrap_extract(
+            planner,
+            lambda: make_source_conn(tables),
+            SOURCE_TABLES,
+            "memory://ingestion",
+            first_batch,
+            shard_rows=100,
+            max_workers=1,
+            deadline=1,
+        )
+
+    assert complete is False
+    pending = read_bootstrap_pending(storage, first_batch)
+    assert pending["shards"][:3] == [
+        ["sales_order", 1, 85, 169],
+        ["sales_order", 2, 169, 251],
+        ["staff", 0, 0, 0],
+    ]
+    manifest = json.loads(storage.get(f"{first_batch}/_parts.json"))
+    # tables not reached yet are empty in this batch
+    assert manifest["sales_order"] == ["sales_order/part-00000.json"]
+    assert manifest["staff"] == []
+    assert "design" not in manifest
+
+    _, resumed_cursors, complete = bootstrap_extract(
+        planner,
+        lambda: make_source_conn(tables),
+        SOURCE_TABLES,
+        "memory://ingestion",
+        second_batch,
+        pending=pending,
+    )
+
+    assert complete is True
+    assert read_bootstrap_pending(storage, second_batch) is None
+    assert resumed_cursors["sales_order"] == {
+        "last_updated": "2024-11-19T04:10:00",
+        "id": 250,
+    }
+    assert json.loads(storage.get(f"{second_batch}/_parts.json")) == {
+        "design": [],
+        "sales_order": [
+            "sales_order/part-00001.json",
+            "sales_order/part-00002.json",
+        ],
+    }
+    data = load_new_data("memory://ingestion", SOURCE_TABLES)
+    assert [row["sales_order_id"] for row in data["sales_order"]] == list(
+        range(85, 251)
+    )
+    assert data["design"] == []
+
+
+@mock_aws
+def test_handler_resumes_a_stopped_bootstrap():
+    region = "eu-west-2"
+    boto3.client("s3", region_name=region).create_bucket(
+        Bucket="ingestion", CreateBucketConfiguration={"LocationConstraint": region}
+    )
+    boto3.client("secretsmanager", region_name=region).create_secret(
+        Name="totes", SecretString="{}"
+    )
+    storage = get_storage("ingestion")
+    planned = {"sales_order": {"last_updated": "2024-11-19T04:10:00", "id": 250}}
+    write_extract_cursors(storage, "2024-11-19 14:30:00", planned, complete=False)
+    storage.put(
+        "2024-11-19 14:30:00/_bootstrap_pending.json",
+        json.dumps(
+            {
+                "shards": [["sales_order", 2, 169, 251]],
+                "split": ["sales_order"],
+                "cursors": planned,
+            }
+        ),
+    )
+    tables = {"sales_order": sales_orders(250)}
+
+    with patch(
+        "lambda_extract.handler.create_conn",
+        side_effect=lambda *args, **kwargs: make_source_conn(tables),
+    ):
+        lambda_handler({"secret": "totes", "bucket": "ingestion"}, None)
+
+    batch = max(key.split("/")[0] for key in storage.list())
+    rows = json.loads(storage.get(f"{batch}/sales_order/part-00002.json"))
+    cursors = json.loads(storage.get(f"{batch}/_extract_cursors.json"))
+    assert [row["sales_order_id"] for row in rows] == list(range(169, 251))
+    assert json.loads(storage.get(f"{batch}/_parts.json"))["design"] == []
+    assert cursors["complete"] is True
+    assert cursors["tables"]["sales_order"] == planned["sales_order"]
+    assert f"{batch}/_bootstrap_pending.json" not in storage.list()
+
+
+@mock_aws
+def test_handler_extracts_a_failed_bootstrap_on_the_next_run():
+    region = "eu-west-2"
+    boto3.client("s3", region_name=region).create_bucket(
+        Bucket="ingestion", CreateBucketConfiguration={"LocationConstraint": region}
+    )
+    boto3.client("secretsmanager", region_name=region).create_secret(
+        Name="totes", SecretString="{}"
+    )
+    storage = get_storage("ingestion")
+    tables = {"sales_order": sales_orders(250), "design": [(7, datetime(2024, 1, 1))]}
+    broken = MagicMock()
+    broken.run.side_effect = RuntimeError("connection reset")
+    # the first connection plans the ranges, the worker reading them fails
+    connections = [make_source_conn(tables), broken]
+
+    with patch("lambda_extract.handler.datetime") as clock, patch(
+        "lambda_extract.handler.create_conn",
+        side_effect=lambda *args, **kwargs: connections.pop(0),
+    ):
+        clock.now.return_value = datetime(2024, 11, 19, 14, 30)
+        with pytest.raises(RuntimeError):
+            lambda_handler({"secret": "totes", "bucket": "ingestion"}, None)
+
+    failed_batch = "2024-11-19 14:30:00"
+    cursors = json.loads(storage.get(f"{failed_batch}/_extract_cursors.json"))
+    assert cursors["complete"] is False
+    assert len(read_bootstrap_pending(storage, failed_batch)["shards"]) == 11
+
+    with patch("lambda_extract.handler.datetime") as clock, patch(
+        "lambda_extract.handler.create_conn",
+        side_effect=lambda *args, **kwargs: make_source_conn(tables),
+    ):
+        clock.now.return_value = datetime(2024, 11, 19, 14, 50)
+        lambda_handler({"secret": "totes", "bucket": "ingestion"}, None)
+
+    batch = "2024-11-19 14:50:00"
+    cursors = json.loads(storage.get(f"{batch}/_extract_cursors.json"))
+    assert [
+        row["design_id"] for row in json.loads(storage.get(f"{batch}/design.json"))
+    ] == [7]
+    assert cursors["complete"] is True
+    assert cursors["tables"]["design"] == {
+        "last_updated": "2024-01-01T00:00:00",
+        "id": 7,
+    }
+    assert f"{batch}/_bootstrap_pending.json" not in storage.list()
@@ -7,7 +7,6 @@ These tests verify the bug fixes for:
 """
 
 import pandas as pd
-import pytest
 from unittest.mock import patch, MagicMock
 from lambda_transform.src.transform_star import (
     transform_sales_order,
@@ -196,43 +195,6 @@ class TestEmptyDataFrameHandling:
         assert "location_id" in result.columns, "Should have correct columns"
 
 
-class TestLoadParquetDataErrorHandling:
-    """Tests to verify load_parquet_data properly raises errors."""
-
-    @patch("lambda_load.src.load_parquet_data.retrive_list_of_files")
-    def test_empty_bucket_returns_empty_dict(self, mock_retrieve):
-        """Verify empty bucket returns empty dict instead of crashing."""
-        from lambda_load.src.load_parquet_data import read_parquet_data_to_dataframe
-
-        mock_retrieve.return_value = []
-
-        result = read_parquet_data_to_dataframe("test-bucket")
-
-        assert result == {}, "Should return empty dict for empty bucket"
-
-    @patch("lambda_load.src.load_parquet_data.retrive_list_of_files")
-    def test_invalid_timestamp_raises_error(self, mock_retrieve):
-        """Verify invalid S3 key format raises ValueError."""
-        from lambda_load.src.load_parquet_data import read_parquet_data_to_dataframe
-
-        mock_retrieve.return_value = ["invalid_key_format.parquet"]
-
-        with pytest.raises(ValueError, match="Invalid S3 key format"):
-            read_parquet_data_to_dataframe("test-bucket")
-
-    @patch("lambda_load.src.load_parquet_data.retrive_list_of_files")
-    @patch("lambda_load.src.load_parquet_data.wr")
-    def test_all_parquet_files_fail_raises_error(self, mock_wr, mock_retrieve):
-        """Verify that if ALL parquet files fail to load, a RuntimeError is raised."""
-        from lambda_load.src.load_parquet_data import read_parquet_data_to_dataframe
-
-        mock_retrieve.return_value = ["2024-11-19 14:30/test.parquet"]
-        mock_wr.s3.read_parquet.side_effect = Exception("S3 read failed")
-
-        with pytest.raises(RuntimeError, match="Failed to load any parquet files"):
-            read_parquet_data_to_dataframe("test-bucket")
-
-
 class TestWarehouseLoadFunctions:
     """Tests for pg8000 warehouse load functions."""
 
@@ -250,7 +212,7 @@ class TestWarehouseLoadFunctions:
             default_schema == "public"
         ), f"Default schema should be 'public', got '{default_schema}'"
 
-    @patch("lambda_load.src.warehouse_load_functions_pg8000.boto3.client")
+    @patch("boto3.client")
     def test_get_secret_returns_none_on_failure(self, mock_boto):
         """Verify get_secret returns None when secret not found."""
         from lambda_load.src.warehouse_load_functions_pg8000 import get_secret
@@ -266,3 +228,88 @@ class TestWarehouseLoadFunctions:
         result = get_secret("non-existent-secret")
 
         assert result is None, "Should return None for non-existent secret"
+
+
+class TestWarehouseTypes:
+    """Tests to verify DATE/TIME columns are bound as native Python values."""
+
+    def test_datetime_and_string_columns_are_converted(self):
+        from lambda_load.src.warehouse_load_functions_pg8000 import (
+            to_warehouse_types,
+        )
+        from datetime import date, time
+
+        df = pd.DataFrame(
+            {
+                "sales_record_id": [1],
+                "created_date": pd.to_datetime(["2024-11-19"]),
+                "created_time": ["14:26:09.927000"],
+            }
+        )
+
+        result = to_warehouse_types("fact_sales_order", df)
+
+        assert result["created_date"].iloc[0] == date(2024, 11, 19)
+        assert result["created_time"].iloc[0] == time(14, 26, 9, 927000)
+        assert df["created_time"].iloc[0] == "14:26:09.927000", "Input is not mutated"
+
+    def test_partition_date_strings_are_converted(self):
+        from lambda_load.src.warehouse_load_functions_pg8000 import (
+            to_warehouse_types,
+        )
+        from datetime import date
+
+        df = pd.DataFrame({"created_date": pd.Categorical(["2024-11-19"])})
+
+        result = to_warehouse_types("fact_sales_order", df)
+
+        assert result["created_date"].iloc[0] == date(2024, 11, 19)
+
+    def test_typed_columns_are_unchanged(self):
+        from lambda_load.src.warehouse_load_functions_pg8000 import (
+            to_warehouse_types,
+        )
+        from datetime import date
+
+        df = pd.DataFrame(
+            {
+                "date_id": [date(2024, 11, 19)],
+                "year": [2024],
+            }
+        )
+
+        result = to_warehouse_types("dim_date", df)
+
+        pd.testing.assert_frame_equal(result, df)
+
+    def test_categorical_columns_are_converted_to_plain_values(self):
+        from lambda_load.src.warehouse_load_functions_pg8000 import (
+            to_warehouse_types,
+        )
+
+        df = pd.DataFrame(
+            {
+                "location_id": [1, 2],
+                "district": pd.Categorical(["Leeds", None]),
+            }
+        )
+
+        records = to_warehouse_types("dim_location", df).to_dict(orient="records")
+
+        assert records == [
+            {"location_id": 1, "district": "Leeds"},
+            {"location_id": 2, "district": None},
+        ]
+
+    def test_missing_star_tables_are_skipped(self):
+        from lambda_load.src.warehouse_load_functions_pg8000 import (
+            load_data_into_warehouse,
+        )
+
+        conn = MagicMock()
+        dataframes = {"dim_design": pd.DataFrame({"design_id": [1, 2]})}
+
+        load_data_into_warehouse(dataframes, conn)
+
+        assert conn.run.call_count == 2
+        assert "public.dim_design" in conn.run.call_args.args[0]
@@ -0,0 +1,361 @@
+import json
+import os
+import struct
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+import boto3
+import pytest
+from dotenv import load_dotenv
+from moto import mock_aws
+from pg8000.native import Connection
+from lambda_extract.handler import lambda_handler
+from lambda_extract.src.cdc import (
+    acknowledge_changes,
+    capture_changes,
+    collapse_changes,
+    decode_pgoutput,
+    decode_test_decoding,
+    peek_changes,
+)
+
+DESIGN_COLUMNS = [
+    ("design_id", 23, True),
+    ("created_at", 1114, False),
+    ("last_updated", 1114, False),
+    ("design_name", 1043, False),
+    ("file_location", 1043, False),
+    ("file_name", 1043, False),
+]
+
+
+def relation_message(relation_id, table, columns):
+    body = b"R" + struct.pack("!I", relation_id) + b"public\0" + table.encode() + b"\0d"
+    body += struct.pack("!h", len(columns))
+    for name, type_oid, key in columns:
+        body += struct.pack("!b", int(key)) + name.encode() + b"\0"
+        body += struct.pack("!Ii", type_oid, -1)
+    return body
+
+
+def tuple_data(values):
+    body = struct.pack("!h", len(values))
+    for value in values:
+        if value is None:
+            body += b"n"
+        else:
+            encoded = str(value).encode()
+            body += b"t" + struct.pack("!i", len(encoded)) + encoded
+    return body
+
+
+def change_message(kind, relation_id, values, old_values=None):
+    body = kind.encode() + struct.pack("!I", relation_id)
+    if old_values is not None:
+        body += b"O" + tuple_data(old_values)
+    return body + (b"K" if kind == "D" else b"N") + tuple_data(values)
+
+
+def design_values(design_id, name, last_updated="2024-11-19 12:20:00.123"):
+    return [design_id, "2024-11-19 12:00:00", last_updated, name, "/usr", "d.json"]
+
+
+class TestDecodePgoutput:
+    def test_inserts_are_typed_like_polled_rows(self):
+        changes = decode_pgoutput(
+            [
+                b"B" + bytes(20),
+                relation_message(16400, "design", DESIGN_COLUMNS),
+                change_message("I", 16400, design_values(472, "Wooden")),
+                b"C" + bytes(25),
+            ]
+        )
+
+        assert changes == [
+            {
+                "table": "design",
+                "op": "insert",
+                "key": ["design_id"],
+                "row": {
+                    "design_id": 472,
+                    "created_at": datetime(2024, 11, 19, 12, 0),
+                    "last_updated": datetime(2024, 11, 19, 12, 20, 0, 123000),
+                    "design_name": "Wooden",
+                    "file_location": "/usr",
+                    "file_name": "d.json",
+                },
+            }
+        ]
+
+    def test_numeric_is_decoded_exactly(self):
+        columns = [("payment_id", 23, True), ("payment_amount", 1700, False)]
+
+        [change] = decode_pgoutput(
+            [
+                relation_message(16401, "payment", columns),
+                change_message("I", 16401, [2, "1033.78"]),
+            ]
+        )
+
+        assert change["row"]["payment_amount"] == Decimal("1033.78")
+
+    def test_updates_with_old_row_and_deletes(self):
+        changes = decode_pgoutput(
+            [
+                relation_message(16400, "design", DESIGN_COLUMNS),
+                change_message(
+                    "U",
+                    16400,
+                    design_values(473, "Steel"),
+                    old_values=design_values(472, "Wooden"),
+                ),
+                change_message("D", 16400, [473, None, None, None, None, None]),
+            ]
+        )
+
+        assert [(c["op"], c["row"]["design_id"]) for c in changes] == [
+            ("update", 473),
+            ("delete", 473),
+        ]
+        assert changes[0]["row"]["design_name"] == "Steel"
+        assert changes[1]["row"]["design_name"] is None
+
+
+def test_decode_test_decoding():
+    changes = decode_test_decoding(
+        [
+            "BEGIN",
+            "table public.design: INSERT: design_id[integer]:472 "
+            "last_updated[timestamp without time zone]:'2024-11-19 12:20:00.123' "
+            "design_name[character varying]:'O''Brien Wood' file_location[character varying]:null",
+            "table public.payment: UPDATE: payment_id[integer]:2 paid[boolean]:true "
+            "payment_amount[numeric]:1033.78",
+            "table public.design: DELETE: design_id[integer]:9",
+            "COMMIT",
+        ]
+    )
+
+    assert changes == [
+        {
+            "table": "design",
+            "op": "insert",
+            "key": ["design_id"],
+            "row": {
+                "design_id": 472,
+                "last_updated": datetime(2024, 11, 19, 12, 20, 0, 123000),
+                "design_name": "O'Brien Wood",
+                "file_location": None,
+            },
+        },
+        {
+            "table": "payment",
+            "op": "update",
+            "key": ["payment_id"],
+            "row": {
+                "payment_id": 2,
+                "paid": True,
+                "payment_amount": Decimal("1033.78"),
+            },
+        },
+        {
+            "table": "design",
+            "op": "delete",
+            "key": ["design_id"],
+            "row": {"design_id": 9},
+        },
+    ]
+
+
+def test_collapse_keeps_newest_row_and_collects_deletes():
+    def change(op, design_id, name):
+        row = {"design_id": design_id, "design_name": name}
+        return {"table": "design", "op": op, "row": row, "key": ["design_id"]}
+
+    rows, deleted = collapse_changes(
+        [
+            change("insert", 1, "Wooden"),
+            change("update", 1, "Steel"),
+            change("insert", 2, "Rubber"),
+            change("delete", 2, None),
+            change("update", 3, "Bronze"),
+        ],
+        ["design", "staff"],
+    )
+
+    assert rows == {
+        "design": [
+            {"design_id": 1, "design_name": "Steel"},
+            {"design_id": 3, "design_name": "Bronze"},
+        ],
+        "staff": [],
+    }
+    assert deleted == {"design": [{"design_id": 2}]}
+
+
+def make_slot_conn(plugin=None, messages=()):
+    """Source connection mock with one slot, None for no slot yet"""
+    conn = MagicMock()
+
+    def run(sql, **kwargs):
+        if "FROM pg_replication_slots" in sql:
+            return [[plugin]] if plugin else []
+        if "peek_binary_changes" in sql or "peek_changes" in sql:
+            return [list(message) for message in messages]
+        return []
+
+    conn.run.side_effect = run
+    return conn
+
+
+class TestCaptureChanges:
+    def test_first_run_creates_publication_and_slot(self):
+        conn = make_slot_conn()
+
+        assert capture_changes(conn, ["design", "staff"]) is None
+
+        statements = [c.args[0] for c in conn.run.call_args_list]
+        assert (
+            'CREATE PUBLICATION "totesys_cdc" FOR TABLE "design", "staff"' in statements
+        )
+        assert any("pg_create_logical_replication_slot" in s for s in statements)
+
+    def test_reads_without_consuming(self):
+        conn = make_slot_conn(
+            "pgoutput",
+            [
+                ("0/16B3748", b"B" + bytes(20)),
+                ("0/16B3748", relation_message(16400, "design", DESIGN_COLUMNS)),
+                ("0/16B3748", change_message("I", 16400, design_values(1, "Wooden"))),
+                ("0/16B37A0", b"C" + bytes(25)),
+            ],
+        )
+
+        rows, deleted, lsn = capture_changes(conn, ["design"])
+
+        assert [row["design_id"] for row in rows["design"]] == [1]
+        assert deleted == {}
+        assert lsn == "0/16B37A0"
+        statements = " ".join(c.args[0] for c in conn.run.call_args_list)
+        assert "pg_replication_slot_advance" not in statements
+        assert "pg_logical_slot_get" not in statements
+
+    def test_empty_slot_has_nothing_to_acknowledge(self):
+        changes, lsn = peek_changes(
+            make_slot_conn("test_decoding"), plugin="test_decoding"
+        )
+
+        assert (changes, lsn) == ([], None)
+
+
+@mock_aws
+def test_handler_acknowledges_after_batch_is_written():
+    region = "eu-west-2"
+    boto3.client("s3", region_name=region).create_bucket(
+        Bucket="ingestion", CreateBucketConfiguration={"LocationConstraint": region}
+    )
+    boto3.client("secretsmanager", region_name=region).create_secret(
+        Name="totes", SecretString="{}"
+    )
+    conn = make_slot_conn(
+        "test_decoding",
+        [
+            (
+                "0/16B3748",
+                "table public.design: INSERT: design_id[integer]:1 "
+                "last_updated[timestamp without time zone]:'2024-11-19 12:20:00'",
+            ),
+            ("0/16B3748", "table public.staff: DELETE: staff_id[integer]:7"),
+            ("0/16B37A0", "COMMIT"),
+        ],
+    )
+
+    with patch("lambda_extract.handler.create_conn", return_value=conn):
+        lambda_handler({"secret": "totes", "bucket": "ingestion", "cdc": True}, None)
+
+    s3 = boto3.client("s3", region_name=region)
+    keys = [obj["Key"] for obj in s3.list_objects_v2(Bucket="ingestion")["Contents"]]
+    batch = keys[0].split("/")[0]
+    design = s3.get_object(Bucket="ingestion", Key=f"{batch}/design.json")
+    deleted = s3.get_object(Bucket="ingestion", Key=f"{batch}/_deleted_rows.json")
+    assert json.loads(design["Body"].read()) == [
+        {"design_id": 1, "last_updated": "2024-11-19T12:20:00"}
+    ]
+    assert json.loads(deleted["Body"].read()) == {"staff": [{"staff_id": 7}]}
+    assert len(keys) == 13
+    assert conn.run.call_args_list[-1].kwargs == {
+        "slot": "totesys_cdc",
+        "lsn": "0/16B37A0",
+    }
+
+
+@mock_aws
+def test_handler_does_not_acknowledge_a_failed_write():
+    region = "eu-west-2"
+    boto3.client("secretsmanager", region_name=region).create_secret(
+        Name="totes", SecretString="{}"
+    )
+    conn = make_slot_conn(
+        "test_decoding",
+        [("0/16B37A0", "table public.staff: DELETE: staff_id[integer]:7")],
+    )
+
+    with patch("lambda_extract.handler.create_conn", return_value=conn), patch(
+        "lambda_extract.handler.retrieve_list_of_s3_files", return_value=[]
+    ):
+        # the bucket does not exist, so the first table file cannot be written
+        with pytest.raises(Exception):
+            lambda_handler({"secret": "totes", "bucket": "missing", "cdc": True}, None)
+
+    statements = " ".join(c.args[0] for c in conn.run.call_args_list)
+    assert "pg_replication_slot_advance" not in statements
+
+
+@pytest.fixture
+def logical_db_conn():
+    """Local database from `make all`, run with wal_level = logical in postgresql.conf"""
+    load_dotenv(".env.test")
+    try:
+        conn = Connection(
+            database=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            timeout=10,
+        )
+    except Exception as e:
+        pytest.skip(f"No local database: {e}")
+    if conn.run("SHOW wal_level")[0][0] != "logical":
+        conn.close()
+        pytest.skip("Local database is not running with wal_level = logical")
+    yield conn
+    conn.run(
+        "SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots "
+        "WHERE slot_name = 'totesys_cdc_test'"
+    )
+    conn.run('DROP PUBLICATION IF EXISTS "totesys_cdc_test"')
+    conn.close()
+
+
+def test_capture_from_local_database(logical_db_conn):
+    conn = logical_db_conn
+    slot = {"slot": "totesys_cdc_test", "publication": "totesys_cdc_test"}
+    assert capture_changes(conn, ["design"], **slot) is None
+
+    design_id = conn.run(
+        "INSERT INTO design (design_name, file_location, file_name) "
+        "VALUES ('CDC', '/tmp', 'cdc.json') RETURNING design_id"
+    )[0][0]
+    conn.run(
+        "UPDATE design SET design_name = 'CDC 2' WHERE design_id = :id", id=design_id
+    )
+    conn.run("DELETE FROM design WHERE design_id = :id", id=design_id)
+
+    rows, deleted, lsn = capture_changes(conn, ["design"], **slot)
+    assert rows == {"design": []}
+    assert deleted == {"design": [{"design_id": design_id}]}
+
+    # peeking again returns the same changes until they are acknowledged
+    assert capture_changes(conn, ["design"], **slot)[1] == deleted
+    acknowledge_changes(conn, lsn, slot["slot"])
+    assert capture_changes(conn, ["design"], **slot) == ({"design": []}, {}, None)
@@ -0,0 +1,10 @@
+import pytest
+from benchmark.cold_start import COLD_START_BUDGET_MS, LAZY_MODULES, measure_imports
+
+
+@pytest.mark.parametrize("handler", list(COLD_START_BUDGET_MS))
+def test_handler_does_not_import_heavy_modules(handler):
+    imports = measure_imports(handler)
+
+    assert handler in imports
+    assert [module for module in LAZY_MODULES if module in imports] == []
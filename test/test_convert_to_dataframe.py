@@ -76,6 +76,23 @@ def test_function_returns_dict_of_dataframes_with_multiple_dictionary_input():
     assert type(output_dataframe["sales_order"]) == pd.core.frame.DataFrame
 
 
+def test_low_cardinality_string_columns_become_categorical():
+    df = pd.DataFrame(
+        {
+            "address_id": [1, 2, 3, 4],
+            "country": ["Wales", "Wales", "England", None],
+            "address_line_1": ["1 High St", "2 High St", "3 High St", "4 High St"],
+        }
+    )
+
+    output_dataframe = convert_dictionary_to_dataframe({"address": df})["address"]
+
+    assert isinstance(output_dataframe["country"].dtype, pd.CategoricalDtype)
+    assert output_dataframe["address_line_1"].dtype == object
+    assert output_dataframe["address_id"].dtype == "int64"
+    assert output_dataframe["country"].isna().iloc[3]
+
+
 class TestExceptions(unittest.TestCase):
     def test_raises_exception_with_invalid_input(self):
         with self.assertRaises(Exception) as detail:
@@ -0,0 +1,235 @@
+import io
+import unittest
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from datetime import date, time
+from moto import mock_aws
+from unittest.mock import MagicMock, patch
+from lambda_layer.python.storage import get_storage
+from lambda_load.src import copy_load
+from lambda_load.src.copy_load import (
+    encode_copy_value,
+    encode_copy_batch,
+    iter_parquet_batches,
+    copy_upsert_table,
+    stream_load_into_warehouse,
+)
+
+
+def run_consuming_stream(copied):
+    # pg8000 reads the whole COPY stream while running the statement
+    def run(sql, stream=None, **kwargs):
+        if stream is not None:
+            copied.append("".join(stream))
+        return []
+
+    return run
+
+
+def test_encode_copy_value():
+    assert encode_copy_value(None) == "\\N"
+    assert encode_copy_value(True) == "t"
+    assert encode_copy_value(date(2024, 11, 19)) == "2024-11-19"
+    assert encode_copy_value(time(14, 26, 9, 927000)) == "14:26:09.927000"
+    assert encode_copy_value(3.94) == "3.94"
+    assert encode_copy_value("a\tb\\c\nd") == "a\\tb\\\\c\\nd"
+
+
+def test_encode_copy_batch():
+    batch = pa.RecordBatch.from_pydict(
+        {"design_id": [1, 2], "design_name": ["Steel", None]}
+    )
+
+    assert encode_copy_batch(batch) == "1\tSteel\n2\t\\N\n"
+
+
+def test_copy_upsert_table_streams_batches_in_one_transaction():
+    conn = MagicMock()
+    copied = []
+    conn.run.side_effect = run_consuming_stream(copied)
+    batches = [
+        pa.RecordBatch.from_pydict({"design_id": [1], "design_name": ["Steel"]}),
+        pa.RecordBatch.from_pydict({"design_id": [2], "design_name": ["Wood"]}),
+    ]
+
+    rows = copy_upsert_table(conn, "dim_design", "design_id", batches)
+
+    statements = [call.args[0] for call in conn.run.call_args_list]
+    assert rows == 2
+    assert copied == ["1\tSteel\n2\tWood\n"]
+    assert statements[0] == "START TRANSACTION"
+    assert statements[3] == (
+        'COPY "stage_dim_design" ("design_id", "design_name") FROM STDIN'
+    )
+    assert 'SELECT DISTINCT ON ("design_id")' in statements[4]
+    assert 'ORDER BY "design_id", _load_seq DESC' in statements[4]
+    assert 'ON CONFLICT ("design_id") DO UPDATE' in statements[4]
+    assert statements[-1] == "COMMIT"
+
+
+def test_copy_upsert_table_merges_batch_local_keys_one_batch_at_a_time():
+    conn = MagicMock()
+    copied = []
+    merged = []
+
+    def run(sql, stream=None, **kwargs):
+        if stream is not None:
+            copied.append("".join(stream))
+        if sql.startswith("SELECT DISTINCT"):
+            return [["2024-11-19 14:30:00.000001"], ["2024-11-19 14:45:00.000001"]]
+        if sql.startswith("INSERT"):
+            merged.append((sql, kwargs))
+
+    conn.run.side_effect = run
+    batches = [
+        pa.RecordBatch.from_pydict(
+            {"sales_record_id": [1], "_load_batch": ["2024-11-19 14:30:00.000001"]}
+        ),
+        pa.RecordBatch.from_pydict(
+            {"sales_record_id": [1], "_load_batch": ["2024-11-19 14:45:00.000001"]}
+        ),
+    ]
+
+    rows = copy_upsert_table(
+        conn, "fact_sales_order", "sales_record_id", batches, merge_by="_load_batch"
+    )
+
+    assert rows == 2
+    assert copied == ["1\t2024-11-19 14:30:00.000001\n1\t2024-11-19 14:45:00.000001\n"]
+    assert [kwargs["value"] for _, kwargs in merged] == [
+        "2024-11-19 14:30:00.000001",
+        "2024-11-19 14:45:00.000001",
+    ]
+    sql = merged[0][0]
+    assert sql.startswith('INSERT INTO "public"."fact_sales_order" ("sales_record_id")')
+    assert 'WHERE "_load_batch" = :value' in sql
+
+
+def test_copy_upsert_table_rolls_back_on_error():
+    conn = MagicMock()
+
+    def run(sql, **kwargs):
+        if sql.startswith("INSERT"):
+            raise Exception("constraint violated")
+
+    conn.run.side_effect = run
+    batches = [pa.RecordBatch.from_pydict({"design_id": [1]})]
+
+    with pytest.raises(Exception, match="constraint violated"):
+        copy_upsert_table(conn, "dim_design", "design_id", batches)
+
+    assert conn.run.call_args.args[0] == "ROLLBACK"
+
+
+def test_copy_upsert_table_skips_empty_stream():
+    conn = MagicMock()
+
+    assert copy_upsert_table(conn, "dim_design", "design_id", []) == 0
+    conn.run.assert_not_called()
+
+
+@mock_aws
+class TestStreamLoad(unittest.TestCase):
+    def setUp(self):
+        self.bucket = "test-processed"
+        self.s3 = boto3.client("s3", region_name="eu-west-2")
+        self.s3.create_bucket(
+            Bucket=self.bucket,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+
+    def put_parquet(self, key, table):
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=buffer.getvalue())
+
+    def test_batches_are_streamed_with_partition_columns(self):
+        key = "2024-11-19 14:30/fact_sales_order/created_date=2024-11-19/a.parquet"
+        self.put_parquet(
+            key,
+            pa.table({"sales_record_id": [1, 2, 3], "extra": ["x", "y", "z"]}),
+        )
+
+        batches = list(
+            iter_parquet_batches(
+                get_storage(self.bucket),
+                [key],
+                ["sales_record_id", "created_date"],
+                batch_size=2,
+            )
+        )
+
+        assert [batch.num_rows for batch in batches] == [2, 1]
+        assert batches[1].to_pylist() == [
+            {"sales_record_id": 3, "created_date": "2024-11-19"}
+        ]
+
+    def test_prefetched_files_are_streamed_in_key_order(self):
+        keys = [
+            f"2024-11-19 14:30/fact_sales_order/created_date=2024-11-{day:02d}/a.parquet"
+            for day in range(1, 13)
+        ]
+        for day, key in enumerate(keys, start=1):
+            self.put_parquet(key, pa.table({"sales_record_id": [day]}))
+
+        rows = [
+            row
+            for batch in iter_parquet_batches(
+                get_storage(self.bucket),
+                keys,
+                ["sales_record_id", "created_date"],
+                prefetch_files=3,
+            )
+            for row in batch.to_pylist()
+        ]
+
+        assert [row["sales_record_id"] for row in rows] == list(range(1, 13))
+        assert rows[-1]["created_date"] == "2024-11-12"
+
+    def test_stopped_stream_removes_prefetched_files(self):
+        keys = [f"2024-11-19 14:30/dim_design/{i}.parquet" for i in range(4)]
+        for key in keys:
+            self.put_parquet(key, pa.table({"design_id": [1]}))
+        opened = []
+        original = copy_load.download_parquet_file
+
+        def download(*args):
+            opened.append(original(*args))
+            return opened[-1]
+
+        with patch("lambda_load.src.copy_load.download_parquet_file", download):
+            batches = iter_parquet_batches(
+                get_storage(self.bucket), keys, ["design_id"], prefetch_files=2
+            )
+            next(batches)
+            batches.close()
+
+        assert len(opened) == 3
+        assert all(temp_file.closed for temp_file in opened)
+
+    def test_tables_are_loaded_dimensions_first(self):
+        self.put_parquet(
+            "2024-11-19 14:30/fact_sales_order.parquet",
+            pa.table({"sales_record_id": [1]}),
+        )
+        self.put_parquet(
+            "2024-11-19 14:30/dim_design.parquet", pa.table({"design_id": [7]})
+        )
+        conn = MagicMock()
+        copied = []
+        conn.run.side_effect = run_consuming_stream(copied)
+
+        loaded = stream_load_into_warehouse(
+            get_storage(self.bucket),
+            {
+                "fact_sales_order": ["2024-11-19 14:30/fact_sales_order.parquet"],
+                "dim_design": ["2024-11-19 14:30/dim_design.parquet"],
+            },
+            conn,
+        )
+
+        assert list(loaded) == ["dim_design", "fact_sales_order"]
+        # fact rows carry their batch folder, sales_record_id is only unique within one
+        assert copied == ["7\n", "1\t2024-11-19 14:30\n"]
@@ -1,6 +1,11 @@
-from lambda_extract.src.db_connection import create_conn
+from lambda_extract.src.db_connection import (
+    create_conn,
+    has_replica,
+    protect_session,
+)
 import json
 import unittest
+from unittest.mock import MagicMock, patch
 
 
 class TestDBConnection(unittest.TestCase):
@@ -17,3 +22,55 @@ class TestDBConnection(unittest.TestCase):
         with self.assertRaises(Exception) as detail:
             create_conn(json.dumps(secret_value))
             self.assertEqual(str(detail.exception))
+
+
+class TestSourceProtection(unittest.TestCase):
+    secret_value = {
+        "host": "primary.rds.com",
+        "replica_host": "replica.rds.com",
+        "user": "alpha",
+        "password": "beta",
+        "database": "gamma",
+        "port": 5432,
+    }
+
+    @patch("lambda_extract.src.db_connection.Connection")
+    def test_replica_connection_uses_replica_host(self, mock_connection):
+        create_conn(json.dumps(self.secret_value), replica=True)
+        create_conn(json.dumps(self.secret_value))
+
+        hosts = [c.kwargs["host"] for c in mock_connection.call_args_list]
+        self.assertEqual(hosts, ["replica.rds.com", "primary.rds.com"])
+
+    @patch("lambda_extract.src.db_connection.Connection")
+    def test_replica_falls_back_to_primary(self, mock_connection):
+        secret_value = {
+            k: v for k, v in self.secret_value.items() if k != "replica_host"
+        }
+
+        create_conn(json.dumps(secret_value), replica=True)
+
+        self.assertEqual(mock_connection.call_args.kwargs["host"], "primary.rds.com")
+
+    @patch("lambda_extract.src.db_connection.Connection")
+    def test_empty_replica_host_is_no_replica(self, mock_connection):
+        for replica_host in ["", None]:
+            secret = json.dumps({**self.secret_value, "replica_host": replica_host})
+
+            self.assertFalse(has_replica(secret))
+            create_conn(secret, replica=True)
+            self.assertEqual(
+                mock_connection.call_args.kwargs["host"], "primary.rds.com"
+            )
+        self.assertTrue(has_replica(json.dumps(self.secret_value)))
+        self.assertFalse(has_replica(None))
+
+    def test_protect_session_sets_timeouts(self):
+        conn = MagicMock()
+
+        self.assertIs(protect_session(conn, 20000, 500), conn)
+
+        statements = [c.args[0] for c in conn.run.call_args_list]
+        self.assertEqual(
+            statements, ["SET statement_timeout = 20000", "SET lock_timeout = 500"]
+        )
@@ -1,7 +1,12 @@
-from lambda_extract.src.db_query import get_latest_data
+from lambda_extract.src.db_query import (
+    get_latest_data,
+    get_changes_after_cursors,
+    next_chunk_size,
+)
 from lambda_extract.src.db_connection import create_conn
 from lambda_extract.src.secrets_manager import get_secret
 from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
 
 # TODO: unskip when test DB is ready
 
@@ -54,3 +59,75 @@ def xtest_get_latest_data_returns_empty_tables_for_the_future_date():
 
     for table in tables:
         assert result[table] == []
+
+
+def make_design_conn(rows):
+    """Connection mock answering keyset page queries over (design_id, last_updated) rows"""
+    conn = MagicMock()
+    conn.columns = [{"name": "design_id"}, {"name": "last_updated"}]
+    ordered = sorted(rows, key=lambda row: (row[1], row[0]))
+
+    def run(sql, size, **kwargs):
+        if "last_id" not in kwargs:
+            after = [row for row in ordered if row[1] > kwargs["last_updated"]]
+        else:
+            cursor = (kwargs["last_updated"], kwargs["last_id"])
+            after = [row for row in ordered if (row[1], row[0]) > cursor]
+        return after[:size]
+
+    conn.run.side_effect = run
+    return conn
+
+
+class TestNextChunkSize:
+    def test_slow_pages_shrink(self):
+        assert next_chunk_size(5000, 2.0, target_seconds=0.5) == 1250
+        assert next_chunk_size(1000, 10.0, target_seconds=0.5, min_rows=500) == 500
+
+    def test_fast_pages_grow_at_most_twofold(self):
+        assert next_chunk_size(5000, 0.001, target_seconds=0.5) == 10000
+        assert next_chunk_size(40000, 0.001, max_rows=50000) == 50000
+
+
+def test_cursor_extract_returns_every_row_after_the_timestamp():
+    start = datetime(2024, 11, 19)
+    # several rows share a last_updated, so the id decides where a page ends
+    rows = [(i, start + timedelta(seconds=i // 3)) for i in range(1, 23)]
+    conn = make_design_conn(rows)
+
+    result, cursors, complete = get_changes_after_cursors(
+        conn,
+        ["design"],
+        {"design": {"last_updated": start, "id": None}},
+        chunk_rows=5,
+        close_connection=False,
+    )
+
+    assert [row["design_id"] for row in result["design"]] == list(range(3, 23))
+    assert cursors["design"] == {"last_updated": start + timedelta(seconds=7), "id": 22}
+    assert complete is True
+    calls = conn.run.call_args_list
+    assert 'ORDER BY last_updated, "design_id" LIMIT' in calls[0].args[0]
+    assert calls[1].kwargs["last_updated"] == start + timedelta(seconds=2)
+    assert calls[1].kwargs["last_id"] == 7
+    conn.close.assert_not_called()
+
+
+def test_cursor_extract_shrinks_pages_when_queries_are_slow():
+    start = datetime(2024, 11, 19)
+    conn = make_design_conn([(i, start + timedelta(seconds=i)) for i in range(1, 3001)])
+    # every page takes a second against a 0.5s target
+    clock = iter(range(0, 1000))
+
+    with patch("lambda_extract.src.db_query.time.perf_counter", lambda: next(clock)):
+        result, _, _ = get_changes_after_cursors(
+            conn,
+            ["design"],
+            {"design": {"last_updated": datetime(2000, 1, 1), "id": None}},
+            chunk_rows=2000,
+        )
+
+    assert len(result["design"]) == 3000
+    sizes = [c.kwargs["size"] for c in conn.run.call_args_list]
+    assert sizes == [2000, 1000, 500]
+    conn.close.assert_called_once()
@@ -1,6 +1,9 @@
 from lambda_transform.src.df_to_parquet import convert_dataframe_to_parquet
 from lambda_transform.src.convert_to_dataframe import convert_dictionary_to_dataframe
+import boto3
+import pandas as pd
 import pytest
+from moto import mock_aws
 from unittest.mock import patch
 import unittest
 
@@ -91,3 +94,149 @@ class TestException(unittest.TestCase):
 
         # assertion
         mock_print.assert_any_call("Error processing payment: NoSuchBucket")
+
+
+class TestTypedEncoding:
+    @patch("lambda_transform.src.df_to_parquet.wr.s3.to_parquet")
+    def test_date_columns_are_written_as_date32(self, mock_to_parquet):
+        # transform sales order data so it has date and time columns
+        from lambda_transform.src.transform_star import transform_sales_order
+
+        test_df_dict = convert_dictionary_to_dataframe(test_dict)
+        fact_df = transform_sales_order(test_df_dict["sales_order"])
+
+        # invoke function
+        convert_dataframe_to_parquet("fact_sales_order", fact_df, "test_bucket")
+
+        # check date columns are cast on write, created_date is the partition column
+        assert mock_to_parquet.call_args.kwargs["dtype"] == {
+            "last_updated_date": "date",
+            "agreed_payment_date": "date",
+            "agreed_delivery_date": "date",
+        }
+
+    @patch("lambda_transform.src.df_to_parquet.wr.s3.to_parquet")
+    def test_tables_without_dates_are_not_cast(self, mock_to_parquet):
+        test_df_dict = convert_dictionary_to_dataframe(test_dict)
+
+        convert_dataframe_to_parquet("payment", test_df_dict["payment"], "test_bucket")
+
+        assert mock_to_parquet.call_args.kwargs["dtype"] is None
+
+
+class TestWriteConfig:
+    def test_table_settings_override_defaults(self):
+        from lambda_transform.src.df_to_parquet import get_write_config
+
+        config = get_write_config("fact_sales_order")
+
+        assert config["compression"] == "zstd"
+        assert config["partition_cols"] == ["created_date"]
+        assert config["row_group_size"] == 100_000
+
+    @patch("lambda_transform.src.df_to_parquet.wr.s3.to_parquet")
+    def test_fact_is_written_as_partitioned_dataset(self, mock_to_parquet):
+        from lambda_transform.src.transform_star import transform_sales_order
+
+        test_df_dict = convert_dictionary_to_dataframe(test_dict)
+        fact_df = transform_sales_order(test_df_dict["sales_order"])
+
+        convert_dataframe_to_parquet("fact_sales_order", fact_df, "test_bucket")
+
+        args, kwargs = mock_to_parquet.call_args
+        assert args[1].endswith("/fact_sales_order/")
+        assert kwargs["dataset"] is True
+        assert kwargs["partition_cols"] == ["created_date"]
+        assert kwargs["compression"] == "zstd"
+        assert list(args[0]["created_date"]) == ["2024-11-19"]
+
+    @patch("lambda_transform.src.df_to_parquet.wr.s3.to_parquet")
+    def test_dimension_is_sorted_by_primary_key(self, mock_to_parquet):
+        import pandas as pd
+
+        design_df = pd.DataFrame({"design_id": [3, 1, 2]})
+
+        convert_dataframe_to_parquet("dim_design", design_df, "test_bucket")
+
+        args, kwargs = mock_to_parquet.call_args
+        assert list(args[0]["design_id"]) == [1, 2, 3]
+        assert args[1].endswith("/dim_design.parquet")
+        assert kwargs["pyarrow_additional_kwargs"]["write_table_args"] == {
+            "row_group_size": 100_000
+        }
+
+
+class TestLocalStorageWrite:
+    def test_fact_is_partitioned_and_typed_in_memory(self):
+        import datetime
+        import pyarrow as pa
+        from lambda_transform.src.transform_star import transform_sales_order
+        from lambda_layer.python.storage import get_storage
+        from lambda_load.src.copy_load import iter_parquet_batches
+
+        test_df_dict = convert_dictionary_to_dataframe(test_dict)
+        fact_df = transform_sales_order(test_df_dict["sales_order"])
+
+        result = convert_dataframe_to_parquet(
+            "fact_sales_order", fact_df, "memory://processed"
+        )
+
+        storage = get_storage("memory://processed")
+        keys = storage.list()
+        assert [key.split("/", 1)[1] for key in keys] == [
+            "fact_sales_order/created_date=2024-11-19/part-0.parquet"
+        ]
+        assert result["paths"] == [f"memory://processed/{keys[0]}"]
+        assert result["bytes"] == len(storage.get(keys[0]))
+
+        table = pa.Table.from_batches(
+            iter_parquet_batches(storage, keys, ["created_date", "agreed_payment_date"])
+        ).to_pydict()
+        assert table["created_date"] == ["2024-11-19"]
+        assert isinstance(table["agreed_payment_date"][0], datetime.date)
+
+
+@mock_aws
+class TestWriteStarTables(unittest.TestCase):
+    def setUp(self):
+        self.s3 = boto3.client("s3", region_name="eu-west-2")
+        self.s3.create_bucket(
+            Bucket="test-processed",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+
+    def test_tables_are_written_with_bytes_and_latency(self):
+        from lambda_transform.src.df_to_parquet import write_star_tables
+
+        tables = {
+            "dim_design": pd.DataFrame({"design_id": [1, 2]}),
+            "dim_currency": pd.DataFrame({"currency_id": [1]}),
+        }
+
+        result = write_star_tables(tables, "test-processed", max_workers=2)
+
+        keys = [
+            obj["Key"]
+            for obj in self.s3.list_objects_v2(Bucket="test-processed")["Contents"]
+        ]
+        self.assertEqual(len(keys), 2)
+        self.assertEqual(result["failed"], [])
+        self.assertEqual(result["tables"]["dim_design"]["rows"], 2)
+        self.assertGreater(result["tables"]["dim_design"]["bytes"], 0)
+        self.assertEqual(
+            result["bytes"],
+            sum(table["bytes"] for table in result["tables"].values()),
+        )
+
+    @patch("lambda_transform.src.df_to_parquet.wr.s3.to_parquet")
+    @patch("builtins.print")
+    def test_failed_tables_are_reported(self, mock_print, mock_to_parquet):
+        from lambda_transform.src.df_to_parquet import write_star_tables
+
+        mock_to_parquet.side_effect = Exception("NoSuchBucket")
+        tables = {"dim_design": pd.DataFrame({"design_id": [1]})}
+
+        result = write_star_tables(tables, "missing-bucket")
+
+        self.assertEqual(result["failed"], ["dim_design"])
+        self.assertIn("error", result["tables"]["dim_design"])
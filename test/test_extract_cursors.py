@@ -0,0 +1,202 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+import boto3
+from moto import mock_aws
+from lambda_extract.handler import lambda_handler
+from lambda_extract.src.db_query import get_changes_after_cursors
+from lambda_extract.src.s3_save_utilities import s3_save_as_json
+from lambda_extract.src.extract_cursors import (
+    find_cursor_batch,
+    initial_cursors,
+    read_extract_cursors,
+    run_deadline,
+    write_extract_cursors,
+)
+from lambda_layer.python.storage import get_storage
+
+
+def make_keyset_conn(tables):
+    """
+    Connection mock answering keyset page queries over in-memory ({table}_id, last_updated)
+    rows, tables not given are empty
+    """
+    conn = MagicMock()
+
+    def run(sql, size=None, **kwargs):
+        if sql == "SELECT 1":
+            return [[1]]
+        table = sql.split(" FROM ")[1].split()[0].strip('"')
+        conn.columns = [{"name": f"{table}_id"}, {"name": "last_updated"}]
+        ordered = sorted(tables.get(table, []), key=lambda row: (row[1], row[0]))
+        # the database casts cursor strings read back from the bucket to timestamps
+        last_updated = kwargs["last_updated"]
+        if isinstance(last_updated, str):
+            last_updated = datetime.fromisoformat(last_updated)
+        if "last_id" in kwargs:
+            cursor = (last_updated, kwargs["last_id"])
+            return [row for row in ordered if (row[1], row[0]) > cursor][:size]
+        return [row for row in ordered if row[1] > last_updated][:size]
+
+    conn.run.side_effect = run
+    return conn
+
+
+def sales_orders(count, start=datetime(2024, 11, 19)):
+    # pairs of rows share a last_updated
+    return [(i, start + timedelta(seconds=i // 2)) for i in range(1, count + 1)]
+
+
+def test_find_cursor_batch_picks_newest_batch_with_cursors():
+    keys = [
+        "2024-11-19 10:00:00/design.json",
+        "2024-11-19 10:00:00/_extract_cursors.json",
+        "2024-11-19 10:20:00/_extract_cursors.json",
+        "2024-11-19 10:40:00/design.json",
+    ]
+
+    assert find_cursor_batch(keys) == "2024-11-19 10:20:00"
+    assert find_cursor_batch(keys[:1]) is None
+
+
+def test_cursors_round_trip():
+    storage = get_storage("memory://ingestion")
+    cursors = {"design": {"last_updated": datetime(2024, 11, 19, 12, 0, 1), "id": 7}}
+
+    write_extract_cursors(storage, "2024-11-19 12:00:00", cursors, complete=False)
+
+    saved = json.loads(storage.get("2024-11-19 12:00:00/_extract_cursors.json"))
+    assert saved["complete"] is False
+    assert read_extract_cursors(
+        storage, "2024-11-19 12:00:00", ["design", "staff"]
+    ) == {
+        "design": {"last_updated": "2024-11-19T12:00:01", "id": 7},
+        "staff": {"last_updated": "2024-11-19 12:00:00", "id": None},
+    }
+
+
+def test_run_deadline_keeps_time_to_write():
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = 120_000
+
+    with patch("lambda_extract.src.extract_cursors.time.monotonic", return_value=100):
+        assert run_deadline(context, reserve_seconds=20) == 200
+    assert run_deadline(None) is None
+
+
+def test_stopped_run_resumes_without_rereading():
+    conn = make_keyset_conn({"sales_order": sales_orders(25)})
+    cursors = initial_cursors(["design", "sales_order"], "2000-01-01 00:00:00")
+    # one page fits before the deadline
+    clock = iter([0, 0, 5, 5])
+
+    with patch("lambda_extract.src.db_query.time.monotonic", lambda: next(clock)):
+        first, cursors, complete = get_changes_after_cursors(
+            conn,
+            ["design", "sales_order"],
+            cursors,
+            chunk_rows=10,
+            deadline=1,
+            close_connection=False,
+        )
+
+    assert complete is False
+    assert [row["sales_order_id"] for row in first["sales_order"]] == list(range(1, 11))
+    second, cursors, complete = get_changes_after_cursors(
+        conn, ["design", "sales_order"], cursors, chunk_rows=10, close_connection=False
+    )
+    read = [row["sales_order_id"] for row in first["sales_order"]] + [
+        row["sales_order_id"] for row in second["sales_order"]
+    ]
+
+    assert complete is True
+    assert read == list(range(1, 26))
+    assert cursors["sales_order"] == {
+        "last_updated": datetime(2024, 11, 19, 0, 0, 12),
+        "id": 25,
+    }
+
+
+def test_page_boundary_inside_a_shared_timestamp():
+    # rows 2 and 3 share a last_updated and the first page ends between them
+    conn = make_keyset_conn({"sales_order": sales_orders(5)})
+    cursors = initial_cursors(["sales_order"], "2000-01-01 00:00:00")
+
+    result, cursors, _ = get_changes_after_cursors(
+        conn, ["sales_order"], cursors, chunk_rows=2, close_connection=False
+    )
+
+    assert [row["sales_order_id"] for row in result["sales_order"]] == [1, 2, 3, 4, 5]
+
+
+@mock_aws
+def test_handler_continues_after_saved_cursors():
+    region = "eu-west-2"
+    boto3.client("s3", region_name=region).create_bucket(
+        Bucket="ingestion", CreateBucketConfiguration={"LocationConstraint": region}
+    )
+    boto3.client("secretsmanager", region_name=region).create_secret(
+        Name="totes", SecretString="{}"
+    )
+    storage = get_storage("ingestion")
+    write_extract_cursors(
+        storage,
+        "2024-11-19 00:00:05",
+        {"sales_order": {"last_updated": "2024-11-19T00:00:05", "id": 10}},
+    )
+    conn = make_keyset_conn({"sales_order": sales_orders(14)})
+
+    with patch("lambda_extract.handler.create_conn", return_value=conn):
+        lambda_handler({"secret": "totes", "bucket": "ingestion"}, None)
+
+    batch = max(key.split("/")[0] for key in storage.list())
+    rows = json.loads(storage.get(f"{batch}/sales_order.json"))
+    cursors = json.loads(storage.get(f"{batch}/_extract_cursors.json"))
+    # row 11 shares the saved last_updated with row 10, and is still read
+    assert [row["sales_order_id"] for row in rows] == [11, 12, 13, 14]
+    assert cursors["tables"]["sales_order"] == {
+        "last_updated": "2024-11-19T00:00:07",
+        "id": 14,
+    }
+    assert cursors["tables"]["design"] == {
+        "last_updated": "2024-11-19 00:00:05",
+        "id": None,
+    }
+
+
+@mock_aws
+def test_failed_table_write_keeps_its_cursor():
+    region = "eu-west-2"
+    boto3.client("s3", region_name=region).create_bucket(
+        Bucket="ingestion", CreateBucketConfiguration={"LocationConstraint": region}
+    )
+    boto3.client("secretsmanager", region_name=region).create_secret(
+        Name="totes", SecretString="{}"
+    )
+    storage = get_storage("ingestion")
+    saved = {
+        "design": {"last_updated": "2024-11-19T00:00:00", "id": 1},
+        "sales_order": {"last_updated": "2024-11-19T00:00:05", "id": 10},
+    }
+    write_extract_cursors(storage, "2024-11-19 00:00:05", saved)
+    conn = make_keyset_conn(
+        {"sales_order": sales_orders(14), "design": [(2, datetime(2024, 11, 20))]}
+    )
+
+    def save_failing_sales_order(rows, bucket, key, raise_errors=False):
+        if key.endswith("/sales_order.json"):
+            raise ConnectionError("connection reset")
+        return s3_save_as_json(rows, bucket, key, raise_errors=raise_errors)
+
+    with patch("lambda_extract.handler.create_conn", return_value=conn), patch(
+        "lambda_extract.handler.s3_save_as_json", save_failing_sales_order
+    ):
+        lambda_handler({"secret": "totes", "bucket": "ingestion"}, None)
+
+    batch = max(key.split("/")[0] for key in storage.list())
+    cursors = json.loads(storage.get(f"{batch}/_extract_cursors.json"))["tables"]
+    # sales_order is read again next run, design moves on
+    assert cursors["sales_order"] == saved["sales_order"]
+    assert cursors["design"] == {"last_updated": "2024-11-20T00:00:00", "id": 2}
+    assert json.loads(storage.get(f"{batch}/_parts.json")) == {"sales_order": []}
+    assert f"{batch}/sales_order.json" not in storage.list()
@@ -61,7 +61,7 @@ class TestS3Functions(unittest.TestCase):
 
 
 class TestLoadNewDataWithoutMoto(unittest.TestCase):
-    @patch("lambda_transform.src.load_new_data.boto3.client")
+    @patch("boto3.client")
     def test_load_new_data(self, mock_boto_client):
         dataset_stub = {
             "design": [
@@ -1,49 +1,117 @@
+import io
 import unittest
-from unittest.mock import patch
-from lambda_load.src.load_parquet_data import read_parquet_data_to_dataframe
+import boto3
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from moto import mock_aws
+from lambda_layer.python.storage import get_storage
+from lambda_load.src.load_parquet_data import (
+    get_load_checkpoint,
+    save_load_checkpoint,
+    list_pending_table_keys,
+)
 
 
-class TestReadParquetToDF(unittest.TestCase):
-    @patch("lambda_load.src.load_parquet_data.retrive_list_of_files")
-    @patch("lambda_load.src.load_parquet_data.wr.s3.read_parquet")
-    def test_load_new_data(self, mock_aws_wrangler, mock_retrieve_list):
-        # mock dataframe
-        mock_fact_sales_order = pd.DataFrame(
-            [
-                {
-                    "sales_order_id": 12345,
-                    "created_at": "2024-11-19T15:50:10.225000",
-                    "last_updated": "2024-11-19T15:50:10.225000",
-                    "design_id": 123,
-                    "staff_id": 11,
-                    "counterparty_id": 11,
-                    "units_sold": 12345,
-                    "unit_price": 5.77,
-                    "currency_id": 1,
-                    "agreed_delivery_date": "2024-11-25",
-                    "agreed_payment_date": "2024-11-23",
-                    "agreed_delivery_location_id": 10,
-                }
-            ]
+def put_parquet(s3_client, bucket, key, df):
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buffer)
+    s3_client.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+
+
+@mock_aws
+class TestLoadCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.bucket = "test-bucket"
+        self.s3 = boto3.client("s3", region_name="eu-west-2")
+        self.s3.create_bucket(
+            Bucket=self.bucket,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        self.storage = get_storage(self.bucket)
+        df = pd.DataFrame({"design_id": [1]})
+        for key in [
+            "2024-11-18 23:55/dim_design.parquet",
+            "2024-11-19 14:30/dim_design.parquet",
+            "2024-11-19 14:35/dim_design.parquet",
+            "2024-11-19 14:35/fact_sales_order/created_date=2024-11-19/a.parquet",
+            "2024-11-19 14:40/dim_currency.parquet",
+        ]:
+            put_parquet(self.s3, self.bucket, key, df)
+
+    def test_checkpoint_round_trip(self):
+        assert get_load_checkpoint(self.storage) is None
+
+        save_load_checkpoint(self.storage, "2024-11-19 14:30")
+
+        assert get_load_checkpoint(self.storage) == "2024-11-19 14:30"
+
+    def test_all_batches_pending_without_checkpoint(self):
+        table_keys, batches = list_pending_table_keys(self.storage)
+
+        assert batches == [
+            "2024-11-18 23:55",
+            "2024-11-19 14:30",
+            "2024-11-19 14:35",
+            "2024-11-19 14:40",
+        ]
+        assert table_keys["dim_design"] == [
+            "2024-11-18 23:55/dim_design.parquet",
+            "2024-11-19 14:30/dim_design.parquet",
+            "2024-11-19 14:35/dim_design.parquet",
+        ]
+
+    def test_batches_after_checkpoint_are_grouped_by_table(self):
+        save_load_checkpoint(self.storage, "2024-11-19 14:30")
+
+        table_keys, batches = list_pending_table_keys(
+            self.storage, get_load_checkpoint(self.storage)
         )
 
-        # mock retrive_list_of_files
-        mock_retrieve_list.return_value = ["2024-11-25 12:00/fact_sales_order.parquet"]
+        assert batches == ["2024-11-19 14:35", "2024-11-19 14:40"]
+        assert table_keys == {
+            "dim_design": ["2024-11-19 14:35/dim_design.parquet"],
+            "fact_sales_order": [
+                "2024-11-19 14:35/fact_sales_order/created_date=2024-11-19/a.parquet"
+            ],
+            "dim_currency": ["2024-11-19 14:40/dim_currency.parquet"],
+        }
 
-        # return mock if the table name is fact_sales_order only
-        def mock_aws_wrangler_side_effect(path, **kwargs):
-            if "fact_sales_order" in path[0]:
-                return mock_fact_sales_order
-            raise FileNotFoundError
+    def test_nothing_pending_after_latest_batch(self):
+        assert list_pending_table_keys(self.storage, "2024-11-19 14:40") == (
+            {},
+            [],
+        )
 
-        mock_aws_wrangler.side_effect = mock_aws_wrangler_side_effect
+    def test_run_later_in_the_checkpoint_minute_is_pending(self):
+        df = pd.DataFrame({"design_id": [2]})
+        put_parquet(
+            self.s3, self.bucket, "2024-11-19 14:40:05.000001/dim_design.parquet", df
+        )
+        put_parquet(
+            self.s3, self.bucket, "2024-11-19 14:40:35.120000/dim_design.parquet", df
+        )
 
-        # invoke function
-        bucket_name = "test-bucket"
-        result = read_parquet_data_to_dataframe(bucket_name)
+        table_keys, batches = list_pending_table_keys(
+            self.storage, "2024-11-19 14:40:05.000001"
+        )
+
+        assert batches == ["2024-11-19 14:40:35.120000"]
+        assert table_keys == {
+            "dim_design": ["2024-11-19 14:40:35.120000/dim_design.parquet"]
+        }
 
-        # assertions
-        self.assertEqual(result, {"fact_sales_order": mock_fact_sales_order})
-        self.assertIn("fact_sales_order", result)
-        mock_retrieve_list.assert_called_once_with(bucket_name)
+    def test_catch_up_is_capped_to_the_oldest_batches(self):
+        table_keys, batches = list_pending_table_keys(self.storage, max_batches=2)
+
+        assert batches == ["2024-11-18 23:55", "2024-11-19 14:30"]
+        assert table_keys == {
+            "dim_design": [
+                "2024-11-18 23:55/dim_design.parquet",
+                "2024-11-19 14:30/dim_design.parquet",
+            ]
+        }
+        assert list_pending_table_keys(self.storage, batches[-1], max_batches=2)[1] == [
+            "2024-11-19 14:35",
+            "2024-11-19 14:40",
+        ]
@@ -0,0 +1,85 @@
+import json
+from datetime import datetime
+from unittest.mock import MagicMock
+from lambda_layer.python.storage import get_storage
+from lambda_load.src.load_parquet_data import list_pending_table_keys
+from local_pipeline.runner import run_pipeline
+
+design_rows = [
+    (472, datetime(2024, 11, 19, 12, 20), "Concrete", "/usr/share", "c.json"),
+    (473, datetime(2024, 11, 19, 12, 21), "Rubber", "/Users", "r.json"),
+]
+
+
+def make_source_conn():
+    conn = MagicMock()
+
+    def run(sql, **kwargs):
+        table = sql.split()[3].strip('"')
+        if table != "design":
+            conn.columns = []
+            return []
+        conn.columns = [
+            {"name": name}
+            for name in [
+                "design_id",
+                "last_updated",
+                "design_name",
+                "file_location",
+                "file_name",
+            ]
+        ]
+        return design_rows
+
+    conn.run.side_effect = run
+    return conn
+
+
+def make_warehouse_conn(copied):
+    conn = MagicMock()
+
+    def run(sql, stream=None, **kwargs):
+        if stream is not None:
+            copied.append("".join(stream))
+
+    conn.run.side_effect = run
+    return conn
+
+
+def test_pipeline_runs_in_process():
+    copied = []
+
+    stats = run_pipeline(make_source_conn(), make_warehouse_conn(copied))
+
+    assert stats["extract"]["rows"] == 2
+    assert stats["load"]["tables"] == {"dim_design": 2}
+    assert copied == [
+        "472\tConcrete\t/usr/share\tc.json\n473\tRubber\t/Users\tr.json\n"
+    ]
+
+
+def test_pipeline_writes_lake_files():
+    run_pipeline(make_source_conn(), make_warehouse_conn([]), lake="memory://lake")
+
+    ingestion = get_storage("memory://lake/ingestion")
+    design_key = next(key for key in ingestion.list() if key.endswith("design.json"))
+    assert json.loads(ingestion.get(design_key))[0]["design_name"] == "Concrete"
+
+    table_keys, batches = list_pending_table_keys(
+        get_storage("memory://lake/processed")
+    )
+    assert list(table_keys) == ["dim_design"]
+    assert len(batches) == 1
+
+
+def test_pipeline_without_new_rows_loads_nothing():
+    conn = make_source_conn()
+    conn.run.side_effect = None
+    conn.run.return_value = []
+    conn.columns = []
+    warehouse_conn = make_warehouse_conn([])
+
+    stats = run_pipeline(conn, warehouse_conn)
+
+    assert stats["load"]["tables"] == {}
+    warehouse_conn.run.assert_not_called()
@@ -0,0 +1,102 @@
+import pytest
+from datetime import datetime
+from unittest.mock import MagicMock
+from lambda_layer.python.metrics import (
+    METRICS_NAMESPACE,
+    emit_metrics,
+    parse_emf_records,
+    stage_metrics,
+)
+from lambda_extract.src.db_query import get_latest_data
+from lambda_layer.python.storage import get_storage
+from lambda_transform.src.load_new_data import load_new_data
+from local_pipeline.runner import SOURCE_TABLES
+
+
+def read_records(capsys):
+    return parse_emf_records(capsys.readouterr().out.splitlines())
+
+
+class TestEmitMetrics:
+    def test_record_is_valid_emf(self, capsys, monkeypatch):
+        monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "extract")
+
+        emit_metrics("upload", "design", duration=12.5, bytes_written=300)
+
+        [record] = read_records(capsys)
+        [directive] = record["_aws"]["CloudWatchMetrics"]
+        assert directive["Namespace"] == METRICS_NAMESPACE
+        assert directive["Dimensions"] == [
+            ["Function", "Stage", "Table"],
+            ["Function", "Stage"],
+        ]
+        assert directive["Metrics"] == [
+            {"Name": "Duration", "Unit": "Milliseconds"},
+            {"Name": "BytesWritten", "Unit": "Bytes"},
+        ]
+        assert record["Function"] == "extract"
+        assert record["Table"] == "design"
+        assert record["BytesWritten"] == 300
+
+    def test_stage_without_table(self, capsys):
+        emit_metrics("fetch", rows_out=1)
+
+        [record] = read_records(capsys)
+        assert record["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [
+            ["Function", "Stage"]
+        ]
+        assert "Table" not in record
+
+
+class TestStageMetrics:
+    def test_records_duration_and_values(self, capsys):
+        with stage_metrics("transform", "dim_design") as metrics:
+            metrics["rows_in"] = 3
+            metrics["rows_out"] = 2
+
+        [record] = read_records(capsys)
+        assert record["RowsIn"] == 3
+        assert record["RowsOut"] == 2
+        assert record["Errors"] == 0
+        assert record["Duration"] >= 0
+
+    def test_failed_stage_is_reported(self, capsys):
+        with pytest.raises(ValueError):
+            with stage_metrics("upsert", "dim_staff"):
+                raise ValueError("boom")
+
+        [record] = read_records(capsys)
+        assert record["Errors"] == 1
+
+
+def test_parse_skips_other_log_lines():
+    lines = ["Saved to bucket/key", "{not json", '{"a": 1}', '{"_aws": {}, "X": 1}']
+    assert parse_emf_records(lines) == [{"_aws": {}, "X": 1}]
+
+
+def test_extract_query_is_measured_per_table(capsys):
+    conn = MagicMock()
+    conn.run.return_value = [(1,), (2,)]
+    conn.columns = [{"name": "design_id"}]
+
+    get_latest_data(conn, ["design", "staff"], "2000-01-01 00:00:00")
+
+    records = read_records(capsys)
+    assert [(r["Stage"], r["Table"], r["RowsOut"]) for r in records] == [
+        ("extract_query", "design", 2),
+        ("extract_query", "staff", 2),
+    ]
+
+
+def test_fetch_reports_bytes_read(capsys):
+    storage = get_storage("memory://ingestion")
+    folder = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for table in SOURCE_TABLES:
+        storage.put(f"{folder}/{table}.json", '[{"id": 1}]')
+
+    load_new_data("memory://ingestion", SOURCE_TABLES)
+
+    fetch = [r for r in read_records(capsys) if r["Stage"] == "fetch"]
+    assert [r["Table"] for r in fetch] == SOURCE_TABLES
+    assert fetch[0]["BytesRead"] == len('[{"id": 1}]')
+    assert fetch[0]["RowsOut"] == 1
@@ -0,0 +1,123 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+from local_pipeline.micro_batch import next_interval, run_micro_batches
+
+design_columns = [
+    "design_id",
+    "last_updated",
+    "design_name",
+    "file_location",
+    "file_name",
+]
+
+
+def make_source_conn(batches):
+    """Returns design rows from the next batch for every extract, SELECT 1 always works"""
+    conn = MagicMock()
+    conn.after = []
+
+    def run(sql, **kwargs):
+        if sql == "SELECT 1":
+            return [[1]]
+        table = sql.split()[3].strip('"')
+        if table == "design":
+            conn.after.append((kwargs["last_updated"], kwargs.get("last_id")))
+            conn.columns = [{"name": name} for name in design_columns]
+            return batches.pop(0) if batches else []
+        conn.columns = []
+        return []
+
+    conn.run.side_effect = run
+    return conn
+
+
+def make_warehouse_conn(copied):
+    conn = MagicMock()
+
+    def run(sql, stream=None, **kwargs):
+        if stream is not None:
+            copied.append("".join(stream))
+
+    conn.run.side_effect = run
+    return conn
+
+
+class TestNextInterval:
+    def test_backs_off_when_idle(self):
+        assert next_interval(2, 0, 1, 60) == 4
+        assert next_interval(50, 0, 1, 60) == 60
+
+    def test_speeds_up_when_rows_arrive(self):
+        assert next_interval(8, 10, 1, 60, busy_rows=100) == 4
+        assert next_interval(1.5, 10, 1, 60, busy_rows=100) == 1
+
+    def test_busy_batch_polls_at_minimum(self):
+        assert next_interval(60, 100, 1, 60, busy_rows=100) == 1
+
+
+def test_cursor_follows_loaded_rows():
+    source = make_source_conn(
+        [
+            [(472, datetime(2024, 11, 19, 12, 20), "Concrete", "/usr", "c.json")],
+            [],
+            # committed after the first poll with the same last_updated
+            [(473, datetime(2024, 11, 19, 12, 20), "Rubber", "/Users", "r.json")],
+        ]
+    )
+    copied = []
+
+    totals = run_micro_batches(
+        lambda: source,
+        lambda: make_warehouse_conn(copied),
+        since="2024-11-19 00:00:00",
+        min_interval=0,
+        max_interval=0,
+        max_batches=4,
+    )
+
+    assert source.after == [
+        ("2024-11-19 00:00:00", None),
+        (datetime(2024, 11, 19, 12, 20), 472),
+        (datetime(2024, 11, 19, 12, 20), 472),
+        (datetime(2024, 11, 19, 12, 20), 473),
+    ]
+    assert {key: totals[key] for key in ("polls", "batches", "rows")} == {
+        "polls": 4,
+        "batches": 2,
+        "rows": 2,
+    }
+    assert totals["cursors"]["design"] == {
+        "last_updated": datetime(2024, 11, 19, 12, 20),
+        "id": 473,
+    }
+    assert totals["cursors"]["staff"] == {
+        "last_updated": "2024-11-19 00:00:00",
+        "id": None,
+    }
+    assert copied == ["472\tConcrete\t/usr\tc.json\n", "473\tRubber\t/Users\tr.json\n"]
+    source.close.assert_not_called()
+
+
+def test_failed_load_keeps_cursors():
+    source = make_source_conn(
+        [
+            [(472, datetime(2024, 11, 19, 12, 20), "Concrete", "/usr", "c.json")],
+            [(472, datetime(2024, 11, 19, 12, 20), "Concrete", "/usr", "c.json")],
+        ]
+    )
+    warehouse = make_warehouse_conn([])
+    failing = MagicMock()
+    failing.run.side_effect = RuntimeError("warehouse down")
+    connections = [failing, warehouse]
+
+    totals = run_micro_batches(
+        lambda: source,
+        lambda: connections.pop(0),
+        since="2024-11-19 00:00:00",
+        min_interval=0,
+        max_interval=0,
+        max_batches=2,
+    )
+
+    assert source.after == [("2024-11-19 00:00:00", None)] * 2
+    assert totals["cursors"]["design"]["id"] == 472
@@ -0,0 +1,81 @@
+import marshal
+import subprocess
+import sys
+import pytest
+from lambda_layer.python.profiling import profile_location, profiled
+from lambda_layer.python.storage import get_storage
+
+
+@profiled
+def handler(event, context):
+    if event.get("fail"):
+        raise RuntimeError("handler failed")
+    return sum(range(1000))
+
+
+class TestProfileLocation:
+    def test_off_by_default(self, monkeypatch):
+        monkeypatch.delenv("PROFILE_HANDLER", raising=False)
+        assert profile_location({"bucket": "b"}) is None
+
+    def test_event_field_names_location(self):
+        assert profile_location({"profile": "memory://p"}) == "memory://p"
+
+    def test_event_field_names_bucket(self):
+        assert profile_location({"profile": "my-profiles"}) == "my-profiles"
+
+    @pytest.mark.parametrize("value", [True, "true", "1"])
+    def test_event_switch_on_uses_default_location(self, value):
+        assert profile_location({"profile": value}) == "file:///tmp/profiles"
+
+    @pytest.mark.parametrize(
+        "value", [False, "false", "False", "0", 1, "not a bucket!"]
+    )
+    def test_event_values_that_are_not_on_or_a_location(self, value, monkeypatch):
+        monkeypatch.setenv("PROFILE_HANDLER", "true")
+        assert profile_location({"profile": value}) is None
+
+    def test_env_var_uses_default_location(self, monkeypatch):
+        monkeypatch.setenv("PROFILE_HANDLER", "true")
+        assert profile_location({}) == "file:///tmp/profiles"
+
+
+def test_off_writes_nothing():
+    assert handler({}, None) == 499500
+    assert get_storage("memory://profiles").list() == []
+
+
+def test_writes_profile_artifacts():
+    assert handler({"profile": "memory://profiles"}, None) == 499500
+
+    storage = get_storage("memory://profiles")
+    keys = storage.list()
+    assert [key.rsplit("/", 1)[1] for key in keys] == [
+        "allocations.txt",
+        "functions.txt",
+        "handler.prof",
+    ]
+    assert keys[0].startswith("profiles/local/")
+
+    stats = marshal.loads(storage.get(keys[2]))
+    assert any(name == "handler" for (_, _, name) in stats)
+    assert b"Traced peak" in storage.get(keys[0])
+    assert b"cumulative" in storage.get(keys[1])
+
+
+def test_failed_invocation_is_profiled_and_reraised():
+    with pytest.raises(RuntimeError):
+        handler({"profile": "memory://profiles", "fail": True}, None)
+
+    assert len(get_storage("memory://profiles").list()) == 3
+
+
+def test_profiling_modules_not_imported_at_load():
+    code = (
+        "import sys, lambda_layer.python.profiling; "
+        "print(any(m in sys.modules for m in ('cProfile', 'tracemalloc', 'pstats')))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,179 @@
+import json
+import boto3
+import pandas as pd
+import pyarrow as pa
+import pytest
+from moto import mock_aws
+from unittest.mock import MagicMock
+from lambda_layer.python.request_accounting import (
+    AccountedConnection,
+    accounted,
+    record_request,
+    request_summary,
+    start_run,
+)
+from lambda_layer.python.runtime_resources import get_client
+from lambda_layer.python.storage import get_storage
+from lambda_load.src.copy_load import copy_upsert_table
+from lambda_load.src.warehouse_load_functions_pg8000 import load_data_into_warehouse
+
+
+@pytest.fixture(autouse=True)
+def fresh_ledger():
+    start_run()
+    yield
+    start_run()
+
+
+def design_frame(rows):
+    return pd.DataFrame(
+        {
+            "design_id": range(rows),
+            "design_name": ["Wooden"] * rows,
+            "file_location": ["/usr"] * rows,
+            "file_name": ["w.json"] * rows,
+        }
+    )
+
+
+class TestLedger:
+    def test_latency_histogram_buckets(self):
+        record_request("sql.SELECT", 0.0005)
+        record_request("sql.SELECT", 0.02)
+        record_request("sql.SELECT", 9)
+
+        entry = request_summary()["sql.SELECT"]
+        assert entry["calls"] == 3
+        assert entry["latency_ms"]["1"] == 1
+        assert entry["latency_ms"]["25"] == 1
+        assert entry["latency_ms"]["inf"] == 1
+        assert entry["max_ms"] == 9000
+
+    def test_start_run_clears_ledger(self):
+        record_request("s3.GetObject", 0.01)
+        start_run()
+        assert request_summary() == {}
+
+
+def test_s3_calls_are_counted_through_botocore_hooks():
+    with mock_aws():
+        get_client("s3").create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        storage = get_storage("test-bucket")
+        storage.put("a.json", b"x" * 100)
+        storage.get("a.json")
+        storage.list()
+
+    summary = request_summary()
+    assert summary["s3.PutObject"]["calls"] == 1
+    assert summary["s3.PutObject"]["bytes_sent"] == 100
+    assert summary["s3.GetObject"]["bytes_received"] == 100
+    assert summary["s3.ListObjectsV2"]["calls"] == 1
+
+
+def test_clients_from_default_session_are_counted():
+    with mock_aws():
+        get_client("s3")
+        boto3.client("s3", region_name="eu-west-2").list_buckets()
+
+    assert request_summary()["s3.ListBuckets"]["calls"] == 1
+
+
+class TestAccountedConnection:
+    def test_counts_round_trips_by_statement(self):
+        conn = AccountedConnection(MagicMock())
+
+        conn.run("SELECT 1")
+        conn.run("\n   INSERT INTO t VALUES (:a)", a=1)
+
+        summary = request_summary()
+        assert summary["sql.SELECT"]["calls"] == 1
+        assert summary["sql.INSERT"]["calls"] == 1
+
+    def test_counts_copy_stream_bytes(self):
+        raw = MagicMock()
+        raw.run.side_effect = lambda sql, stream=None, **kwargs: list(stream)
+        conn = AccountedConnection(raw)
+
+        conn.run("COPY t FROM STDIN", stream=iter(["1\tA\n", "2\tB\n"]))
+
+        assert request_summary()["sql.COPY"]["bytes_sent"] == 8
+
+    def test_failed_statement_is_counted_as_error(self):
+        raw = MagicMock()
+        raw.run.side_effect = RuntimeError("gone")
+
+        with pytest.raises(RuntimeError):
+            AccountedConnection(raw).run("SELECT 1")
+
+        assert request_summary()["sql.SELECT"]["errors"] == 1
+
+    def test_passes_other_attributes_through(self):
+        raw = MagicMock()
+        raw.columns = [{"name": "a"}]
+        assert AccountedConnection(raw).columns == [{"name": "a"}]
+
+
+class TestRoundTripsPerLoad:
+    def test_row_upsert_makes_one_round_trip_per_row(self):
+        load_data_into_warehouse(
+            {"dim_design": design_frame(50)}, AccountedConnection(MagicMock())
+        )
+        assert request_summary()["sql.INSERT"]["calls"] == 50
+
+    @pytest.mark.parametrize("rows", [10, 1000])
+    def test_copy_upsert_round_trips_do_not_grow_with_rows(self, rows):
+        batches = pa.Table.from_pandas(design_frame(rows)).to_batches(100)
+
+        copy_upsert_table(
+            AccountedConnection(MagicMock()), "dim_design", "design_id", batches
+        )
+
+        assert sum(entry["calls"] for entry in request_summary().values()) == 6
+
+
+def test_handler_prints_request_summary(capsys):
+    @accounted
+    def handler(event, context):
+        AccountedConnection(MagicMock()).run("SELECT 1")
+
+    handler({}, None)
+
+    line = capsys.readouterr().out.strip().splitlines()[-1]
+    assert json.loads(line)["request_summary"]["sql.SELECT"]["calls"] == 1
+
+
+def test_failed_aws_call_is_counted_as_error():
+    with mock_aws():
+        with pytest.raises(Exception):
+            get_client("s3").get_object(Bucket="missing-bucket", Key="a")
+
+    assert request_summary()["s3.GetObject"]["errors"] == 1
+
+
+def test_call_and_call_error_share_the_operation_name():
+    # the hyphenated "secrets-manager" service id must not split the operation in two
+    with mock_aws():
+        client = get_client("secretsmanager")
+        client.create_secret(Name="totes", SecretString="{}")
+        start_run()
+        client.get_secret_value(SecretId="totes")
+
+        def connection_lost(**kwargs):
+            raise ConnectionError("connection lost")
+
+        client.meta.events.register(
+            "before-send.secrets-manager.GetSecretValue", connection_lost
+        )
+        with pytest.raises(ConnectionError):
+            client.get_secret_value(SecretId="totes")
+        client.meta.events.unregister(
+            "before-send.secrets-manager.GetSecretValue", connection_lost
+        )
+
+    summary = request_summary()
+    assert list(summary) == ["secretsmanager.GetSecretValue"]
+    assert summary["secretsmanager.GetSecretValue"]["calls"] == 2
+    assert summary["secretsmanager.GetSecretValue"]["errors"] == 1
@@ -0,0 +1,112 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+from lambda_layer.python.metrics import parse_emf_records
+from lambda_layer.python.storage import get_storage
+from lambda_layer.python.watermarks import (
+    max_last_updated,
+    read_source_watermarks,
+    write_source_watermarks,
+)
+from lambda_load.src.run_ledger import get_load_watermarks, record_load_run
+from lambda_transform.src.transform_graph import get_star_watermarks
+
+
+class TestWatermarks:
+    def test_max_last_updated_accepts_datetimes_and_strings(self):
+        rows = [
+            {"last_updated": datetime(2024, 11, 19, 14, 20)},
+            {"last_updated": "2024-11-19T14:25:00"},
+        ]
+        assert max_last_updated(rows) == "2024-11-19T14:25:00"
+        assert max_last_updated([]) is None
+
+    def test_manifest_round_trip(self):
+        storage = get_storage("memory://ingestion")
+        write_source_watermarks(
+            storage, "2024-11-19 14:30:00", {"design": None}, "2024-11-19 14:30:00"
+        )
+        assert read_source_watermarks(storage, "2024-11-19 14:30:00") == {
+            "extracted_at": "2024-11-19 14:30:00",
+            "tables": {"design": None},
+        }
+        assert read_source_watermarks(storage, "2024-11-19 14:35:00") is None
+
+
+def test_star_watermarks_follow_inputs_back_to_source_tables():
+    source = {
+        "counterparty": "2024-11-19T14:00:00",
+        "address": "2024-11-19T14:10:00",
+        "sales_order": "2024-11-19T14:20:00",
+        "design": None,
+    }
+    assert get_star_watermarks(
+        source, ["dim_counterparty", "dim_date", "dim_design"]
+    ) == {
+        "dim_counterparty": "2024-11-19T14:10:00",
+        "dim_date": "2024-11-19T14:20:00",
+        "dim_design": None,
+    }
+
+
+class TestRecordLoadRun:
+    def setup_method(self):
+        self.storage = get_storage("memory://processed")
+        write_source_watermarks(
+            self.storage,
+            "2024-11-19 14:30",
+            {"dim_design": "2024-11-19T14:20:00", "fact_sales_order": None},
+            "2024-11-19 14:30:00",
+        )
+        write_source_watermarks(
+            self.storage,
+            "2024-11-19 14:50",
+            {"fact_sales_order": "2024-11-19T14:45:00"},
+            "2024-11-19 14:50:00",
+        )
+
+    def test_watermarks_combine_batches(self):
+        watermarks, extracted_at = get_load_watermarks(
+            self.storage, ["2024-11-19 14:30", "2024-11-19 14:40", "2024-11-19 14:50"]
+        )
+        assert watermarks == {
+            "dim_design": "2024-11-19T14:20:00",
+            "fact_sales_order": "2024-11-19T14:45:00",
+        }
+        assert extracted_at == "2024-11-19 14:50:00"
+
+    def test_records_lag_per_table(self, capsys):
+        conn = MagicMock()
+
+        lags = record_load_run(
+            conn,
+            self.storage,
+            ["2024-11-19 14:30", "2024-11-19 14:50"],
+            {"dim_design": 3, "fact_sales_order": 10, "dim_staff": 1},
+            committed_at=datetime(2024, 11, 19, 15, 0),
+        )
+
+        assert lags == {
+            "dim_design": 2400.0,
+            "fact_sales_order": 900.0,
+            "dim_staff": None,
+        }
+
+        create, insert = [c.args[0] for c in conn.run.call_args_list]
+        assert "CREATE TABLE IF NOT EXISTS" in create
+        assert insert.startswith('INSERT INTO "public".pipeline_run_ledger')
+        params = conn.run.call_args.kwargs
+        assert params["run_batch_0"] == "2024-11-19 14:50"
+        assert params["batches_loaded_0"] == 2
+        assert params["rows_loaded_1"] == 10
+        assert params["source_last_updated_2"] is None
+
+        records = parse_emf_records(capsys.readouterr().out.splitlines())
+        assert [(r["Table"], r["FreshnessLag"]) for r in records] == [
+            ("dim_design", 2400.0),
+            ("fact_sales_order", 900.0),
+        ]
+
+    def test_nothing_loaded_writes_nothing(self):
+        conn = MagicMock()
+        assert record_load_run(conn, self.storage, ["2024-11-19 14:30"], {}) == {}
+        conn.run.assert_not_called()
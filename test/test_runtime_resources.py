@@ -0,0 +1,77 @@
+import boto3
+import json
+import pytest
+from moto import mock_aws
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+from lambda_layer.python.runtime_resources import (
+    get_client,
+    get_secret_string,
+    get_db_connection,
+    is_connection_alive,
+)
+
+
+def test_client_is_created_once():
+    with patch("boto3.client") as mock_client:
+        first = get_client("s3")
+        second = get_client("s3")
+
+    assert first is second
+    mock_client.assert_called_once()
+
+
+@mock_aws
+def test_secret_is_cached_until_ttl_expires():
+    client = boto3.client("secretsmanager", region_name="eu-west-2")
+    client.create_secret(Name="db", SecretString=json.dumps({"user": "a"}))
+
+    assert get_secret_string("db") == '{"user": "a"}'
+
+    client.put_secret_value(SecretId="db", SecretString=json.dumps({"user": "b"}))
+    assert get_secret_string("db") == '{"user": "a"}'
+    assert get_secret_string("db", ttl=0) == '{"user": "b"}'
+
+
+@mock_aws
+def test_missing_secret_raises_client_error():
+    with pytest.raises(ClientError):
+        get_secret_string("non-existent-secret")
+
+
+def test_live_connection_is_reused():
+    conn = MagicMock()
+    connect = MagicMock(return_value=conn)
+
+    assert get_db_connection("db", connect) is conn
+    assert get_db_connection("db", connect) is conn
+
+    connect.assert_called_once()
+    conn.run.assert_called_once_with("SELECT 1")
+
+
+def test_dead_connection_is_replaced():
+    dead, fresh = MagicMock(), MagicMock()
+    dead.run.side_effect = Exception("server closed the connection")
+    connect = MagicMock(side_effect=[dead, fresh])
+
+    get_db_connection("db", connect)
+
+    assert get_db_connection("db", connect) is fresh
+    dead.close.assert_called_once()
+
+
+def test_failed_connect_is_not_cached():
+    conn = MagicMock()
+    connect = MagicMock(side_effect=[None, conn])
+
+    assert get_db_connection("db", connect) is None
+    assert get_db_connection("db", connect) is conn
+
+
+def test_is_connection_alive():
+    conn = MagicMock()
+    assert is_connection_alive(conn)
+
+    conn.run.side_effect = Exception("network error")
+    assert not is_connection_alive(conn)
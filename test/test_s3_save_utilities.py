@@ -3,6 +3,7 @@ import unittest
 from unittest.mock import patch, Mock
 import json
 from lambda_extract.src.s3_save_utilities import s3_save_as_json, s3_save_as_csv
+from lambda_layer.python.runtime_resources import CLIENT_CONFIG
 from moto import mock_aws
 
 
@@ -94,7 +95,7 @@ class TestS3SaveAsCSV(unittest.TestCase):
         mock_remove.assert_called_once_with("/tmp/test.csv")
 
         # Verify region was set correctly in boto3 client
-        mock_boto_client.assert_called_once_with("s3", region_name="eu-west-2")
+        mock_boto_client.assert_called_once_with("s3", config=CLIENT_CONFIG)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+import io
+import boto3
+import pytest
+from moto import mock_aws
+from lambda_layer.python.storage import (
+    LocalStorage,
+    MemoryStorage,
+    S3Storage,
+    get_storage,
+)
+
+
+@pytest.fixture(params=["memory", "local", "s3"])
+def storage(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryStorage()
+    elif request.param == "local":
+        yield LocalStorage(str(tmp_path))
+    else:
+        with mock_aws():
+            boto3.client("s3", region_name="eu-west-2").create_bucket(
+                Bucket="test-bucket",
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+            yield S3Storage("test-bucket")
+
+
+def test_put_get_and_download(storage):
+    storage.put("2024-11-19 14:30/design.json", '{"a": 1}')
+
+    assert storage.get("2024-11-19 14:30/design.json") == b'{"a": 1}'
+    buffer = io.BytesIO()
+    storage.download("2024-11-19 14:30/design.json", buffer)
+    assert buffer.getvalue() == b'{"a": 1}'
+
+
+def test_missing_key_raises_file_not_found(storage):
+    with pytest.raises(FileNotFoundError):
+        storage.get("missing.json")
+
+
+def test_list_is_sorted_and_filtered(storage):
+    for key in [
+        "2024-11-19 14:35/staff.json",
+        "2024-11-18 23:55/design.json",
+        "2024-11-19 14:30/design.json",
+        "load_checkpoint.json",
+    ]:
+        storage.put(key, b"{}")
+
+    assert storage.list(prefix="2024-11-19") == [
+        "2024-11-19 14:30/design.json",
+        "2024-11-19 14:35/staff.json",
+    ]
+    assert storage.list(start_after="2024-11-19 14:300") == [
+        "2024-11-19 14:35/staff.json",
+        "load_checkpoint.json",
+    ]
+
+
+def test_get_storage_resolves_locations(tmp_path):
+    assert isinstance(get_storage("my-bucket"), S3Storage)
+    assert get_storage("s3://my-bucket").bucket == "my-bucket"
+    assert get_storage(f"file://{tmp_path}").root == str(tmp_path)
+    assert get_storage("memory://lake") is get_storage("memory://lake")
@@ -0,0 +1,78 @@
+import numpy as np
+from unittest.mock import MagicMock, patch
+from local_pipeline.synthetic_data import (
+    SEED_ORDER,
+    generate_columns,
+    iter_copy_chunks,
+    scaled_row_counts,
+    seed_database,
+)
+
+
+def copied_text(conn):
+    return {
+        call.args[0].split()[1].strip('"'): "".join(call.kwargs["stream"])
+        for call in conn.run.call_args_list
+        if "stream" in call.kwargs
+    }
+
+
+class TestScaledRowCounts:
+    def test_reference_tables_do_not_scale(self):
+        counts = scaled_row_counts(1000)
+        assert counts["currency"] == 3
+        assert counts["sales_order"] == 10_000_000
+
+    def test_every_order_has_a_transaction_and_payment(self):
+        counts = scaled_row_counts(2)
+        assert counts["transaction"] == counts["sales_order"] + counts["purchase_order"]
+        assert counts["payment"] == counts["transaction"]
+        assert list(counts) == SEED_ORDER
+
+
+class TestGenerateColumns:
+    def test_same_seed_gives_same_rows(self):
+        counts = scaled_row_counts(0.1)
+        first = list(iter_copy_chunks("sales_order", 7, 1, 500, counts))
+        second = list(iter_copy_chunks("sales_order", 7, 1, 500, counts))
+        other = list(iter_copy_chunks("sales_order", 8, 1, 500, counts))
+        assert first == second
+        assert first != other
+
+    def test_rows_respect_source_constraints(self):
+        counts = scaled_row_counts(1)
+        rng = np.random.default_rng(0)
+        ids = np.arange(1, 5001)
+        orders = generate_columns("sales_order", rng, ids, counts)
+        assert 1000 <= min(orders["units_sold"]) <= max(orders["units_sold"]) <= 100_000
+        assert 2 <= min(orders["unit_price"]) <= max(orders["unit_price"]) <= 4
+        assert max(orders["design_id"]) <= counts["design"]
+        assert all(u >= c for c, u in zip(orders["created_at"], orders["last_updated"]))
+        assert orders["created_at"] == sorted(orders["created_at"])
+
+        payments = generate_columns("payment", rng, ids, counts)
+        assert all(10_000_000 <= n <= 99_999_999 for n in payments["company_ac_number"])
+
+    def test_transactions_reference_sales_then_purchase_orders(self):
+        counts = scaled_row_counts(0.001)
+        ids = np.arange(1, counts["transaction"] + 1)
+        columns = generate_columns("transaction", np.random.default_rng(0), ids, counts)
+        assert columns["sales_order_id"][0] == 1
+        assert columns["purchase_order_id"][-1] == counts["purchase_order"]
+        assert columns["transaction_type"][-1] == "PURCHASE"
+
+
+class TestSeedDatabase:
+    @patch("local_pipeline.synthetic_data.CHUNK_ROWS", 7)
+    def test_copies_every_table_in_chunks(self):
+        conn = MagicMock()
+        counts = seed_database(conn, scale=0.01, seed=1)
+
+        text = copied_text(conn)
+        assert list(text) == SEED_ORDER
+        for table, rows in counts.items():
+            lines = text[table].splitlines()
+            assert len(lines) == rows
+            assert lines[0].split("\t")[0] == "1"
+        assert "\\N" in text["transaction"]
+        assert conn.run.call_args_list[0].args[0].startswith("TRUNCATE")
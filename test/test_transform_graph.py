@@ -0,0 +1,138 @@
+import pandas as pd
+import pytest
+from unittest.mock import Mock
+from lambda_transform.src.transform_graph import (
+    TRANSFORM_GRAPH,
+    get_execution_order,
+    get_lookup_tables,
+    run_transform_graph,
+)
+
+sales_order = [
+    {
+        "sales_order_id": 1,
+        "created_at": "2022-11-03T14:20:52.186",
+        "last_updated": "2022-11-03 14:20:52.186",
+        "design_id": 2,
+        "staff_id": 19,
+        "counterparty_id": 8,
+        "units_sold": 42972,
+        "unit_price": 3.94,
+        "currency_id": 2,
+        "agreed_delivery_date": "2022-11-07",
+        "agreed_payment_date": "2022-11-08",
+        "agreed_delivery_location_id": 8,
+    }
+]
+
+
+def test_execution_order_puts_dependencies_first():
+    order = get_execution_order(TRANSFORM_GRAPH)
+
+    assert set(order) == set(TRANSFORM_GRAPH)
+    assert order.index("fact_sales_order") < order.index("dim_date")
+
+
+def test_execution_order_raises_for_cycle():
+    graph = {"a": (Mock(), ["b"]), "b": (Mock(), ["a"])}
+
+    with pytest.raises(ValueError, match="cycle"):
+        get_execution_order(graph)
+
+
+def test_only_sales_order_changed_builds_fact_and_date():
+    extracted_data_df = {
+        "sales_order": pd.DataFrame(sales_order),
+        "design": pd.DataFrame(),
+        "address": pd.DataFrame(),
+    }
+
+    result = run_transform_graph(extracted_data_df)
+
+    assert set(result) == {"fact_sales_order", "dim_date"}
+
+
+def test_node_is_skipped_when_primary_input_is_empty():
+    transform = Mock(return_value=pd.DataFrame({"id": [1]}))
+    graph = {"dim_test": (transform, ["table_a", "table_b"])}
+
+    result = run_transform_graph(
+        {"table_a": pd.DataFrame(), "table_b": pd.DataFrame({"id": [1]})}, graph
+    )
+
+    assert result == {}
+    transform.assert_not_called()
+
+
+def test_only_counterparty_changed_builds_dim_counterparty():
+    counterparty = pd.DataFrame(
+        [
+            {
+                "counterparty_id": 1,
+                "counterparty_legal_name": "Mraz LLC",
+                "legal_address_id": 2,
+            }
+        ]
+    )
+    address = pd.DataFrame(
+        [
+            {
+                "address_id": 2,
+                "address_line_1": "179 Alexie Cliffs",
+                "address_line_2": None,
+                "district": None,
+                "city": "Aliso Viejo",
+                "postal_code": "99305-7380",
+                "country": "San Marino",
+                "phone": "9621 880720",
+            }
+        ]
+    )
+    extracted_data_df = {"counterparty": counterparty, "address": pd.DataFrame()}
+
+    result = run_transform_graph(extracted_data_df, lookup_data_df={"address": address})
+
+    # dim_location only follows new address rows
+    assert set(result) == {"dim_counterparty"}
+    assert result["dim_counterparty"]["counterparty_legal_city"].tolist() == [
+        "Aliso Viejo"
+    ]
+
+
+def test_lookup_tables_needed_by_a_batch():
+    assert get_lookup_tables({"counterparty": [{"counterparty_id": 1}]}) == ["address"]
+    assert get_lookup_tables({"department": [{"department_id": 1}]}) == ["department"]
+    assert get_lookup_tables({"design": [{"design_id": 1}], "address": []}) == []
+
+
+def test_node_with_empty_output_is_dropped():
+    graph = {"dim_test": (Mock(return_value=pd.DataFrame()), ["table_a"])}
+
+    result = run_transform_graph({"table_a": pd.DataFrame({"id": [1]})}, graph)
+
+    assert result == {}
+
+
+def test_independent_nodes_run_concurrently():
+    import threading
+
+    # both transforms must be running at the same time to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def transform(df):
+        barrier.wait()
+        return df
+
+    graph = {
+        "dim_a": (transform, ["table_a"]),
+        "dim_b": (transform, ["table_b"]),
+        "dim_c": (lambda df: df, ["dim_a"]),
+    }
+    extracted_data_df = {
+        "table_a": pd.DataFrame({"id": [1]}),
+        "table_b": pd.DataFrame({"id": [2]}),
+    }
+
+    result = run_transform_graph(extracted_data_df, graph, max_workers=2)
+
+    assert set(result) == {"dim_a", "dim_b", "dim_c"}
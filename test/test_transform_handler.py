@@ -1,6 +1,10 @@
+import json
 import unittest
 from unittest.mock import patch
 from lambda_transform.transform_handler import lambda_handler
+from lambda_transform.src.lookup_state import update_lookup_tables
+from lambda_layer.python.storage import get_storage
+from lambda_layer.python.watermarks import read_source_watermarks
 import pandas as pd
 
 data_json = [
@@ -33,6 +37,21 @@ data_json = [
     },
 ]
 
+address_json = [
+    {
+        "address_id": address_id,
+        "address_line_1": "6826 Herzog Via",
+        "address_line_2": None,
+        "district": "Avon",
+        "city": "New Patienceburgh",
+        "postal_code": "28441",
+        "country": "Turkey",
+        "phone": "1803 637401",
+        "last_updated": "2022-11-03 14:20:49.962",
+    }
+    for address_id in [1, 2]
+]
+
 tables = [
     "design",
     "sales_order",
@@ -50,7 +69,7 @@ tables = [
 
 class TestTransformHandler(unittest.TestCase):
     @patch("lambda_transform.transform_handler.load_new_data")
-    @patch("lambda_transform.transform_handler.convert_dictionary_to_dataframe")
+    @patch("lambda_transform.src.convert_to_dataframe.convert_dictionary_to_dataframe")
     def test_handler_calls_utility_functions(
         self, mock_convert_dictionary_to_dataframe, mock_load_new_data
     ):
@@ -74,3 +93,132 @@ class TestTransformHandler(unittest.TestCase):
         mock_convert_dictionary_to_dataframe.assert_called_once_with(
             {"design": data_json}
         )
+
+    @patch("lambda_transform.src.load_new_data.load_source_watermarks")
+    @patch("lambda_transform.src.df_to_parquet.write_star_tables")
+    @patch("lambda_transform.transform_handler.load_new_data")
+    def test_handler_joins_counterparty_to_saved_addresses(
+        self, mock_load_new_data, mock_write_star_tables, mock_load_source_watermarks
+    ):
+        mock_load_source_watermarks.return_value = None
+        processed = get_storage("memory://processed")
+        processed.put("lookup_state/address.json", json.dumps(address_json))
+        mock_load_new_data.return_value = {"counterparty": data_json, "address": []}
+
+        lambda_handler(
+            {
+                "data_bucket": "memory://ingestion",
+                "processed_bucket": "memory://processed",
+            },
+            None,
+        )
+
+        # the batch has no addresses, they come from the saved copy
+        star_tables = mock_write_star_tables.call_args.args[0]
+        self.assertEqual(list(star_tables), ["dim_counterparty"])
+        self.assertEqual(len(star_tables["dim_counterparty"]), 3)
+
+    def test_missing_lookup_copy_is_built_from_every_batch(self):
+        ingestion = get_storage("memory://ingestion")
+        ingestion.put("2024-11-18 10:00:00/address.json", json.dumps(address_json))
+        ingestion.put("2024-11-19 10:00:00/address.json", json.dumps([]))
+
+        tables = update_lookup_tables(
+            "memory://ingestion", "memory://processed", {"address": []}
+        )
+
+        self.assertEqual(tables["address"], address_json)
+        saved = get_storage("memory://processed").get("lookup_state/address.json")
+        self.assertEqual(json.loads(saved), address_json)
+
+    @patch("lambda_transform.src.load_new_data.load_source_watermarks")
+    @patch("lambda_transform.src.df_to_parquet.write_star_tables")
+    @patch("lambda_transform.transform_handler.load_new_data")
+    def test_handler_returns_write_result(
+        self, mock_load_new_data, mock_write_star_tables, mock_load_source_watermarks
+    ):
+        mock_load_source_watermarks.return_value = None
+        mock_load_new_data.return_value = {
+            "design": [
+                {
+                    "design_id": 472,
+                    "design_name": "Concrete",
+                    "file_location": "/usr/share",
+                    "file_name": "concrete-20241026-76vi.json",
+                }
+            ]
+        }
+        mock_write_star_tables.return_value = {
+            "tables": {"dim_design": {"paths": [], "bytes": 10}},
+            "batch": "2024-11-19 14:30",
+            "bytes": 10,
+            "seconds": 0.1,
+            "failed": [],
+        }
+
+        mock_event = {
+            "data_bucket": "test_data_bucket",
+            "processed_bucket": "test_processed_bucket",
+        }
+
+        result = lambda_handler(mock_event, None)
+
+        self.assertEqual(result, mock_write_star_tables.return_value)
+        tables, bucket = mock_write_star_tables.call_args.args
+        self.assertEqual(list(tables), ["dim_design"])
+        self.assertEqual(bucket, "test_processed_bucket")
+
+    @patch("lambda_transform.src.load_new_data.load_source_watermarks")
+    @patch("lambda_transform.transform_handler.load_new_data")
+    def test_handler_writes_star_table_watermarks(
+        self, mock_load_new_data, mock_load_source_watermarks
+    ):
+        mock_load_new_data.return_value = {
+            "design": [
+                {
+                    "design_id": 472,
+                    "design_name": "Concrete",
+                    "file_location": "/usr/share",
+                    "file_name": "concrete-20241026-76vi.json",
+                    "last_updated": "2024-11-19T14:29:51.371000",
+                }
+            ]
+        }
+        mock_load_source_watermarks.return_value = {
+            "extracted_at": "2024-11-19 14:30:00",
+            "tables": {"design": "2024-11-19T14:29:51.371000", "staff": None},
+        }
+
+        result = lambda_handler(
+            {
+                "data_bucket": "memory://ingestion",
+                "processed_bucket": "memory://processed",
+            },
+            None,
+        )
+
+        manifest = read_source_watermarks(
+            get_storage("memory://processed"), result["batch"]
+        )
+        self.assertEqual(
+            manifest,
+            {
+                "extracted_at": "2024-11-19 14:30:00",
+                "tables": {"dim_design": "2024-11-19T14:29:51.371000"},
+            },
+        )
+
+    @patch("lambda_transform.src.convert_to_dataframe.convert_dictionary_to_dataframe")
+    @patch("lambda_transform.transform_handler.load_new_data")
+    def test_handler_returns_early_without_new_data(
+        self, mock_load_new_data, mock_convert_dictionary_to_dataframe
+    ):
+        mock_load_new_data.return_value = {table: [] for table in tables}
+
+        mock_event = {
+            "data_bucket": "test_data_bucket",
+            "processed_bucket": "test_processed_bucket",
+        }
+
+        self.assertIsNone(lambda_handler(mock_event, None))
+        mock_convert_dictionary_to_dataframe.assert_not_called()
@@ -8,7 +8,7 @@ from lambda_transform.src.transform_star import (
     transform_currency,
     transform_location,
 )
-from datetime import datetime
+from datetime import datetime, time
 import pytest
 
 
@@ -231,9 +231,9 @@ def test_transform_sales_order():
                 "sales_record_id": 1,
                 "sales_order_id": 1,
                 "created_date": pd.to_datetime("2022-11-3"),
-                "created_time": "14:20:52.186000",
+                "created_time": time(14, 20, 52, 186000),
                 "last_updated_date": pd.to_datetime("2022-11-3"),
-                "last_updated_time": "14:20:52.186000",
+                "last_updated_time": time(14, 20, 52, 186000),
                 "sales_staff_id": 19,
                 "counterparty_id": 8,
                 "units_sold": 42972,
@@ -248,9 +248,9 @@ def test_transform_sales_order():
                 "sales_record_id": 2,
                 "sales_order_id": 2,
                 "created_date": pd.to_datetime("2022-11-3"),
-                "created_time": "14:20:52.188000",
+                "created_time": time(14, 20, 52, 188000),
                 "last_updated_date": pd.to_datetime("2022-11-3"),
-                "last_updated_time": "14:20:52.188000",
+                "last_updated_time": time(14, 20, 52, 188000),
                 "sales_staff_id": 10,
                 "counterparty_id": 4,
                 "units_sold": 65839,
@@ -454,3 +454,21 @@ def test_transform_table_location_id():
 
     transformed_df = transform_location(input_address_df)
     pd.testing.assert_frame_equal(transformed_df, expected_df)
+
+
+def test_transform_currency_lookup_is_built_once():
+    from lambda_transform.src.transform_star import get_currency_names
+
+    currency_df_input = pd.DataFrame(
+        [
+            {"currency_id": 1, "currency_code": "gbp"},
+            {"currency_id": 2, "currency_code": "USD"},
+        ]
+    )
+    get_currency_names.cache_clear()
+
+    transform_currency(currency_df_input)
+    transformed_df = transform_currency(currency_df_input)
+
+    assert get_currency_names.cache_info().misses == 1
+    assert list(transformed_df["currency_name"]) == ["Pound Sterling", "US Dollar"]